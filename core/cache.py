@@ -0,0 +1,266 @@
+import json
+import os
+import pickle
+import threading
+import time
+import uuid
+from collections import OrderedDict, defaultdict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+from core.metrics import CACHE_LOOKUPS
+
+_MISSING = object()
+_ALL = '*'
+
+
+class LocalBus:
+    # invalidation bus for a single process (tests, runserver): delivers to every
+    # TieredCache subscribed to the channel, like Redis pub/sub does across processes
+    subscribers = defaultdict(list)
+
+    def __init__(self, channel):
+        self.channel = channel
+
+    def publish(self, message):
+        for callback in list(self.subscribers[self.channel]):
+            callback(message)
+
+    def subscribe(self, callback):
+        self.subscribers[self.channel].append(callback)
+
+    def listen(self):
+        pass
+
+
+class RedisBus:
+    def __init__(self, channel, url):
+        import redis
+
+        self.channel = channel
+        self.client = redis.Redis.from_url(url)
+        self.callback = None
+        self.pid = None
+
+    def publish(self, message):
+        self.listen()
+        self.client.publish(self.channel, message)
+
+    def subscribe(self, callback):
+        self.callback = callback
+        self.listen()
+
+    def listen(self):
+        # the listener thread doesn't survive a fork, start one per worker process
+        if self.callback is None or self.pid == os.getpid():
+            return
+        self.pid = os.getpid()
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(**{self.channel: lambda message: self.callback(message['data'])})
+        pubsub.run_in_thread(sleep_time=1, daemon=True)
+
+
+class LocalTier:
+    # the in-process half of a TieredCache: Django builds one cache object per thread,
+    # all of them in a process share this LRU, its statistics and its bus subscription
+    def __init__(self, max_entries, timeout, bus):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.bus = bus
+        self.sender = uuid.uuid4().hex
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.counters = defaultdict(lambda: {'l1_hits': 0, 'l2_hits': 0, 'misses': 0})
+        bus.subscribe(self.on_message)
+
+    def get(self, full_key):
+        with self.lock:
+            entry = self.entries.get(full_key)
+            if entry is None:
+                return _MISSING
+            pickled, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self.entries[full_key]
+                return _MISSING
+            self.entries.move_to_end(full_key)
+        return pickle.loads(pickled)
+
+    def set(self, full_key, value, timeout):
+        lifetime = self.timeout if timeout is None else min(timeout, self.timeout)
+        if lifetime <= 0:
+            self.evict([full_key])
+            return
+        pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self.lock:
+            self.entries[full_key] = (pickled, time.monotonic() + lifetime)
+            self.entries.move_to_end(full_key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def evict(self, full_keys):
+        with self.lock:
+            if _ALL in full_keys:
+                self.entries.clear()
+            for full_key in full_keys:
+                self.entries.pop(full_key, None)
+
+    def invalidate(self, full_keys):
+        self.evict(full_keys)
+        self.bus.publish(json.dumps({'sender': self.sender, 'keys': list(full_keys)}))
+
+    def on_message(self, message):
+        message = json.loads(message)
+        if message['sender'] != self.sender:
+            self.evict(message['keys'])
+
+    def count(self, key, outcome):
+        prefix = str(key).split(':', 1)[0]
+        with self.lock:
+            self.counters[prefix][outcome] += 1
+        CACHE_LOOKUPS.labels(prefix, outcome).inc()
+
+
+_tiers = {}
+_tiers_lock = threading.Lock()
+
+
+class TieredCache(BaseCache):
+    # L1: a bounded LRU of pickled values in this process, entries live at most
+    # L1_TIMEOUT seconds. L2: the SHARED cache alias (Redis in production), the
+    # source of truth for every worker. Writes go to L2 and are announced on the
+    # invalidation bus so other workers drop their L1 copy; L1_TIMEOUT bounds the
+    # staleness should a message be lost. Keys carry the usual KEY_PREFIX, KEY_FUNCTION
+    # and version, incr_version() moves a key to a fresh version in both tiers; L2 stores
+    # them under that full key, so aliases sharing one L2 keep apart by KEY_PREFIX.
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.shared_alias = options.get('SHARED', 'shared')
+        name = location or 'default'
+        with _tiers_lock:
+            if name not in _tiers:
+                bus_url = options.get('BUS_URL')
+                channel = options.get('CHANNEL', f'cache-invalidation:{name}')
+                bus = RedisBus(channel, bus_url) if bus_url else LocalBus(channel)
+                _tiers[name] = LocalTier(options.get('L1_MAX_ENTRIES', 1000), options.get('L1_TIMEOUT', 30), bus)
+        self.l1 = _tiers[name]
+
+    @property
+    def shared(self):
+        return caches[self.shared_alias]
+
+    def stats(self):
+        # {key prefix: {'l1_hits', 'l2_hits', 'misses', 'hit_ratio'}}, a prefix being
+        # the part of the key before the first ':'
+        with self.l1.lock:
+            counters = {prefix: dict(values) for prefix, values in self.l1.counters.items()}
+        for values in counters.values():
+            lookups = values['l1_hits'] + values['l2_hits'] + values['misses']
+            values['hit_ratio'] = (values['l1_hits'] + values['l2_hits']) / lookups if lookups else 0.0
+        return counters
+
+    def reset_stats(self):
+        with self.l1.lock:
+            self.l1.counters.clear()
+
+    # cache API
+
+    def _timeout(self, timeout):
+        return self.default_timeout if timeout is DEFAULT_TIMEOUT else timeout
+
+    def get(self, key, default=None, version=None):
+        full_key = self.make_and_validate_key(key, version)
+        self.l1.bus.listen()
+        value = self.l1.get(full_key)
+        if value is not _MISSING:
+            self.l1.count(key, 'l1_hits')
+            return value
+        value = self.shared.get(full_key, _MISSING)
+        if value is _MISSING:
+            self.l1.count(key, 'misses')
+            return default
+        self.l1.count(key, 'l2_hits')
+        self.l1.set(full_key, value, None)
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        full_key = self.make_and_validate_key(key, version)
+        timeout = self._timeout(timeout)
+        self.shared.set(full_key, value, timeout)
+        self.l1.invalidate([full_key])
+        self.l1.set(full_key, value, timeout)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        full_key = self.make_and_validate_key(key, version)
+        timeout = self._timeout(timeout)
+        added = self.shared.add(full_key, value, timeout)
+        if added:
+            self.l1.invalidate([full_key])
+            self.l1.set(full_key, value, timeout)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.shared.touch(self.make_and_validate_key(key, version), self._timeout(timeout))
+
+    def delete(self, key, version=None):
+        full_key = self.make_and_validate_key(key, version)
+        deleted = self.shared.delete(full_key)
+        self.l1.invalidate([full_key])
+        return deleted
+
+    def has_key(self, key, version=None):
+        full_key = self.make_and_validate_key(key, version)
+        if self.l1.get(full_key) is not _MISSING:
+            return True
+        return self.shared.has_key(full_key)
+
+    def incr(self, key, delta=1, version=None):
+        full_key = self.make_and_validate_key(key, version)
+        value = self.shared.incr(full_key, delta)
+        self.l1.invalidate([full_key])
+        return value
+
+    def get_many(self, keys, version=None):
+        found, missing = {}, {}
+        for key in keys:
+            full_key = self.make_and_validate_key(key, version)
+            value = self.l1.get(full_key)
+            if value is _MISSING:
+                missing[full_key] = key
+            else:
+                self.l1.count(key, 'l1_hits')
+                found[key] = value
+        if missing:
+            shared = self.shared.get_many(list(missing))
+            for full_key, key in missing.items():
+                if full_key in shared:
+                    self.l1.count(key, 'l2_hits')
+                    self.l1.set(full_key, shared[full_key], None)
+                    found[key] = shared[full_key]
+                else:
+                    self.l1.count(key, 'misses')
+        return found
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        timeout = self._timeout(timeout)
+        full_keys = {self.make_and_validate_key(key, version): key for key in data}
+        failed = set(self.shared.set_many({full_key: data[key] for full_key, key in full_keys.items()}, timeout))
+        self.l1.invalidate(list(full_keys))
+        for full_key, key in full_keys.items():
+            if full_key not in failed:
+                self.l1.set(full_key, data[key], timeout)
+        return [key for full_key, key in full_keys.items() if full_key in failed]
+
+    def delete_many(self, keys, version=None):
+        full_keys = [self.make_and_validate_key(key, version) for key in keys]
+        self.shared.delete_many(full_keys)
+        self.l1.invalidate(full_keys)
+
+    def clear(self):
+        self.shared.clear()
+        self.l1.invalidate([_ALL])
+
+    def close(self, **kwargs):
+        self.shared.close(**kwargs)
+
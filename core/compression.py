@@ -0,0 +1,121 @@
+import brotli
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_sequence, compress_string
+
+# bodies worth compressing (text/*, JSON, NDJSON, the OpenAPI schema, ...); images and
+# archives are compressed already
+COMPRESSIBLE_TYPES = ('text/', 'json', 'javascript', 'xml')
+
+
+def accepted_encoding(header):
+    # the coding to answer an Accept-Encoding header with: 'br' or 'gzip', whichever has
+    # the higher q-value (brotli on a tie), or None when the client accepts neither
+    weights = {}
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        weight = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name == 'q':
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        if coding:
+            weights[coding.strip().lower()] = weight
+    best, best_weight = None, 0.0
+    for coding in ('br', 'gzip'):
+        weight = weights.get(coding, weights.get('*', 0.0))
+        if weight > best_weight:
+            best, best_weight = coding, weight
+    return best
+
+
+def brotli_sequence(sequence, quality):
+    compressor = brotli.Compressor(quality=quality, mode=brotli.MODE_TEXT)
+    for item in sequence:
+        data = compressor.process(item)
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+async def brotli_async_sequence(sequence, quality):
+    compressor = brotli.Compressor(quality=quality, mode=brotli.MODE_TEXT)
+    async for item in sequence:
+        data = compressor.process(item)
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+async def gzip_async_sequence(sequence):
+    # GZipMiddleware's way: every chunk is a gzip member of its own
+    async for item in sequence:
+        yield compress_string(item, max_random_bytes=GZipMiddleware.max_random_bytes)
+
+
+class CompressionMiddleware:
+    # GZipMiddleware plus brotli: text responses of at least COMPRESSION_MIN_SIZE bytes,
+    # and streaming ones (exports), are compressed with the coding the client prefers.
+    # Like GZipMiddleware it sets Vary: Accept-Encoding and weakens a strong ETag, so the
+    # If-None-Match of ConditionalGetMixin still matches.
+    sync_capable = async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.compress(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.compress(request, await self.get_response(request))
+
+    def compress(self, request, response):
+        content_type = response.get('Content-Type', '')
+        if response.has_header('Content-Encoding') or not any(kind in content_type for kind in COMPRESSIBLE_TYPES):
+            return response
+        if not response.streaming and len(response.content) < settings.COMPRESSION_MIN_SIZE:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        coding = accepted_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if coding is None:
+            return response
+
+        quality = settings.COMPRESSION_BROTLI_QUALITY
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = (
+                    brotli_async_sequence(response.streaming_content, quality) if coding == 'br'
+                    else gzip_async_sequence(response.streaming_content)
+                )
+            else:
+                response.streaming_content = (
+                    brotli_sequence(response.streaming_content, quality) if coding == 'br'
+                    else compress_sequence(response.streaming_content, max_random_bytes=GZipMiddleware.max_random_bytes)
+                )
+            # the compressed length isn't known until the last chunk
+            del response.headers['Content-Length']
+        else:
+            if coding == 'br':
+                compressed = brotli.compress(response.content, quality=quality, mode=brotli.MODE_TEXT)
+            else:
+                compressed = compress_string(response.content, max_random_bytes=GZipMiddleware.max_random_bytes)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers['Content-Length'] = str(len(compressed))
+
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = f'W/{etag}'
+        response.headers['Content-Encoding'] = coding
+        return response
@@ -0,0 +1,118 @@
+import hmac
+import ipaddress
+import os
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+
+# Under gunicorn every worker writes its samples to PROMETHEUS_MULTIPROC_DIR (set up in
+# gunicorn.conf.py before the workers import this module) and /metrics sums the files of
+# all workers. Without the variable (runserver, tests) metrics live in this process.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+REQUESTS = Counter('http_requests_total', 'Обработанные HTTP-запросы', ['route', 'method', 'status'])
+REQUEST_SECONDS = Histogram('http_request_duration_seconds', 'Время ответа', ['route', 'method'], buckets=LATENCY_BUCKETS)
+REQUESTS_IN_PROGRESS = Gauge(
+    'http_requests_in_progress', 'Запросы в обработке', ['route', 'method'], multiprocess_mode='livesum',
+)
+REQUEST_DB_SECONDS = Histogram('http_request_db_seconds', 'Время SQL-запросов за один HTTP-запрос', ['route'], buckets=LATENCY_BUCKETS)
+REQUEST_DB_QUERIES = Counter('http_request_db_queries_total', 'SQL-запросы', ['route'])
+CACHE_LOOKUPS = Counter('cache_lookups_total', 'Обращения к кешу', ['prefix', 'result'])
+EMAIL_SEND_SECONDS = Histogram('email_send_duration_seconds', 'Время отправки письма по SMTP', buckets=LATENCY_BUCKETS)
+EMAILS = Counter('emails_total', 'Отправленные письма', ['result'])
+
+UNMATCHED = '<unmatched>'
+
+
+def route_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return (match.view_name or match.route) if match else UNMATCHED
+
+
+def render_metrics(path=None):
+    path = path or os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if path:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry, path=path)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry)
+
+
+def metrics_allowed(request):
+    # route names, traffic and error rates are for our scrapers and staff only
+    from django.conf import settings
+
+    if settings.METRICS_TOKEN and hmac.compare_digest(
+        request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {settings.METRICS_TOKEN}',
+    ):
+        return True
+    try:
+        address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        address = None
+    if address is not None and any(
+        address in ipaddress.ip_network(network.strip(), strict=False)
+        for network in settings.METRICS_ALLOWED_IPS if network.strip()
+    ):
+        return True
+    user = getattr(request, 'user', None)
+    return bool(user and user.is_active and user.is_staff)
+
+
+def metrics_view(request):
+    from django.http import HttpResponse, HttpResponseForbidden
+
+    if not metrics_allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(render_metrics(), content_type=CONTENT_TYPE_LATEST)
+
+
+class MetricsMiddleware:
+    # Latency, status and in-flight requests per route name ('hotels-list',
+    # 'booking-create', ...), plus the SQL time QueryBudgetMiddleware recorded.
+    # Must come before core.querybudget.QueryBudgetMiddleware in MIDDLEWARE.
+    sync_capable = async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+            # Django would call the sync process_view through a thread
+            self.process_view = self.aprocess_view
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = time.perf_counter()
+        response = self.get_response(request)
+        self.record(request, response, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        self.record(request, response, time.perf_counter() - started)
+        return response
+
+    def record(self, request, response, elapsed):
+        route = route_name(request)
+        in_progress = getattr(request, 'metrics_in_progress', None)
+        if in_progress is not None:
+            in_progress.dec()
+        REQUESTS.labels(route, request.method, response.status_code).inc()
+        REQUEST_SECONDS.labels(route, request.method).observe(elapsed)
+        queries = getattr(request, 'queries', None)
+        if queries is not None:
+            REQUEST_DB_SECONDS.labels(route).observe(queries.duration)
+            REQUEST_DB_QUERIES.labels(route).inc(queries.count)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # the route is known only once the URL is resolved
+        request.metrics_in_progress = REQUESTS_IN_PROGRESS.labels(route_name(request), request.method)
+        request.metrics_in_progress.inc()
+
+    async def aprocess_view(self, request, view_func, view_args, view_kwargs):
+        MetricsMiddleware.process_view(self, request, view_func, view_args, view_kwargs)
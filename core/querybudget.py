@@ -0,0 +1,128 @@
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b|%s")
+_LIST = re.compile(r'\(\?(?:,\s*\?)*\)')
+
+
+def normalize_sql(sql):
+    # "... WHERE id IN (1, 2, 3) AND name = 'x'" -> "... WHERE id IN (?) AND name = ?"
+    return _LIST.sub('(?)', _LITERAL.sub('?', sql))
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class QueryRecorder:
+    # connection.execute_wrapper() hook: counts queries, their total time and how often
+    # each normalized statement ran
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+            self.shapes[normalize_sql(sql)] += 1
+
+    def repeated(self, threshold=None):
+        # statements run more than threshold times: the N in N+1
+        threshold = settings.QUERY_REPEAT_THRESHOLD if threshold is None else threshold
+        return {sql: count for sql, count in self.shapes.items() if count > threshold}
+
+
+@contextmanager
+def record_queries():
+    recorder = QueryRecorder()
+    with connection.execute_wrapper(recorder):
+        yield recorder
+
+
+def view_budget(request):
+    # `query_budget` on a DRF view class: an int, or {action: int} for viewsets;
+    # views that don't declare one get QUERY_BUDGET_DEFAULT. False opts a view out of
+    # both checks, for views whose query count grows with the upload (bulk imports).
+    match = request.resolver_match
+    # DRF views keep their class in `cls`, Django's class-based views in `view_class`
+    view_class = (getattr(match.func, 'cls', None) or getattr(match.func, 'view_class', None)) if match else None
+    if view_class is None:
+        return None
+    budget = getattr(view_class, 'query_budget', None)
+    if isinstance(budget, dict):
+        actions = getattr(match.func, 'actions', None) or {}
+        budget = budget.get(actions.get(request.method.lower()))
+    return settings.QUERY_BUDGET_DEFAULT if budget is None else budget
+
+
+class QueryBudgetMiddleware:
+    # Records the SQL of every request and checks it against the view's query_budget
+    # and QUERY_REPEAT_THRESHOLD. A violation raises QueryBudgetExceeded when
+    # QUERY_BUDGET_STRICT (the test suite), otherwise it is logged.
+    sync_capable = async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with record_queries() as recorder:
+            request.queries = recorder
+            response = self.get_response(request)
+        return self.check(request, response, recorder)
+
+    async def __acall__(self, request):
+        # the async ORM runs all queries of a request in one thread (Django gives every
+        # request its own thread-sensitive executor), the hook goes on that thread's connection
+        recorder = request.queries = QueryRecorder()
+        await sync_to_async(_add_wrapper)(recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(_remove_wrapper)(recorder)
+        return self.check(request, response, recorder)
+
+    def check(self, request, response, recorder):
+        if settings.DEBUG:
+            response['X-Query-Count'] = recorder.count
+            response['X-Query-Time'] = f'{recorder.duration * 1000:.1f}ms'
+
+        budget = view_budget(request)
+        if budget is False:
+            return response
+        problems = []
+        if budget is not None and recorder.count > budget:
+            problems.append(f'{recorder.count} queries, budget is {budget}')
+        for sql, count in recorder.repeated().items():
+            problems.append(f'N+1: {count} x {sql}')
+        if problems:
+            message = f'{request.method} {request.path}: ' + '; '.join(problems)
+            if settings.QUERY_BUDGET_STRICT:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+
+def _add_wrapper(recorder):
+    connection.execute_wrappers.append(recorder)
+
+
+def _remove_wrapper(recorder):
+    connection.execute_wrappers.remove(recorder)
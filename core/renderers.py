@@ -0,0 +1,29 @@
+import orjson
+from django.utils.http import parse_header_parameters
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+# orjson passes what it can't serialize natively to DRF's encoder: lazy strings,
+# QuerySets, timedeltas, Decimals (as floats, like JSONRenderer) and datetimes, which
+# keep JSONRenderer's format (milliseconds, 'Z' for UTC)
+_default = JSONEncoder().default
+OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+
+class ORJSONRenderer(BaseRenderer):
+    # drop-in for rest_framework's JSONRenderer: the same compact UTF-8 output,
+    # several times faster on large lists
+    media_type = 'application/json'
+    format = 'json'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        options = OPTIONS
+        # the browsable API and `Accept: application/json; indent=4` ask for indented
+        # output, orjson only indents by two spaces
+        _, params = parse_header_parameters(accepted_media_type or '')
+        if 'indent' in params or (renderer_context or {}).get('indent'):
+            options |= orjson.OPT_INDENT_2
+        return orjson.dumps(data, default=_default, option=options)
@@ -11,7 +11,9 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
 import os
+import sys
 import dj_database_url
+from datetime import timedelta
 from pathlib import Path
 from decouple import config
 
@@ -41,6 +43,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 
     'rest_framework',
     'django_rest_passwordreset',
@@ -50,11 +53,15 @@ INSTALLED_APPS = [
 
 
     'users',
-    'hotels'
+    'hotels',
+    'notifications',
 
 ]
 
 MIDDLEWARE = [
+    'core.metrics.MetricsMiddleware',
+    'core.compression.CompressionMiddleware',
+    'core.querybudget.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -151,6 +158,33 @@ MEDIA_URL = 'media/'
 # host/api/v1/media/my_image.jpg
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Media (hotel images and their variants) goes to the S3-compatible bucket S3_BUCKET
+# (AWS S3, or minio at S3_ENDPOINT_URL) when it is set, see core.storage.S3Storage:
+# clients get presigned URLs valid for a week that stay the same for a day, so they
+# are cached and the bytes never go through the web workers. Without S3_BUCKET (tests,
+# local runs) files are kept in MEDIA_ROOT.
+S3_BUCKET = os.environ.get('S3_BUCKET')
+
+STORAGES = {
+    'default': {
+        'BACKEND': 'core.storage.S3Storage',
+        'OPTIONS': {
+            'bucket': S3_BUCKET,
+            'endpoint_url': os.environ.get('S3_ENDPOINT_URL'),
+            'region': os.environ.get('S3_REGION', 'us-east-1'),
+            'access_key': os.environ.get('S3_ACCESS_KEY_ID'),
+            'secret_key': os.environ.get('S3_SECRET_ACCESS_KEY'),
+            'url_expire': 7 * 24 * 3600,
+            'url_stable_for': 24 * 3600,
+        },
+    } if S3_BUCKET else {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -164,16 +198,106 @@ EMAIL_HOST_USER = 'memka47@gmail.com'
 EMAIL_HOST_PASSWORD = 'tmonlbcoqevylebh'
 EMAIL_PORT = 587
 EMAIL_USE_TLS = True
-EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+EMAIL_BACKEND = 'notifications.backends.PooledSMTPEmailBackend'
+# per process: idle SMTP connections kept open, messages per connection before it is
+# replaced, seconds an idle connection is trusted, messages per second (0 = no cap)
+EMAIL_POOL_SIZE = 4
+EMAIL_POOL_MAX_MESSAGES = 100
+EMAIL_POOL_IDLE_TIMEOUT = 60
+EMAIL_RATE_LIMIT = 10
+
+# Outgoing email is queued in notifications.OutboxMessage and sent by `manage.py send_outbox`;
+# a failed message is retried after 30s, 60s, 120s, ... (at most an hour) up to 8 times
+OUTBOX_BATCH_SIZE = 50
+OUTBOX_MAX_ATTEMPTS = 8
+OUTBOX_BACKOFF_SECONDS = 30
+OUTBOX_MAX_BACKOFF_SECONDS = 3600
+OUTBOX_POLL_INTERVAL = 5
 
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication'
+        'users.authentication.CachedTokenAuthentication'
+    ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'core.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
     ],
-    'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend']
+    'DEFAULT_PARSER_CLASSES': [
+        'core.parsers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+    'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
+    'DEFAULT_PAGINATION_CLASS': 'hotels.pagination.KeysetPagination',
+    'PAGE_SIZE': 20,
 }
 
+# core.compression.CompressionMiddleware: text responses from COMPRESSION_MIN_SIZE bytes
+# up (and streamed exports) are sent brotli- or gzip-compressed, as the client accepts.
+# Brotli quality 0-11: on /hotel/ 5 is as small as gzip for less CPU, higher ones are
+# slightly smaller and a lot slower (`manage.py bench_responses`).
+COMPRESSION_MIN_SIZE = 1024
+COMPRESSION_BROTLI_QUALITY = 5
+
+# core.querybudget: views declare `query_budget`, others get QUERY_BUDGET_DEFAULT; a
+# statement repeated more than QUERY_REPEAT_THRESHOLD times in a request is an N+1.
+# Violations fail the test suite and are logged everywhere else.
+QUERY_BUDGET_DEFAULT = 20
+QUERY_REPEAT_THRESHOLD = 5
+QUERY_BUDGET_STRICT = sys.argv[1:2] == ['test']
+
+# /metrics/ (core.metrics) answers only scrapers from METRICS_ALLOWED_IPS (addresses or
+# networks, comma-separated in the env), requests with `Authorization: Bearer
+# <METRICS_TOKEN>` and staff users; everyone else gets 403. No address is trusted by
+# default: behind a proxy on the same host every client arrives from 127.0.0.1, so
+# list networks only when the scraper reaches the workers directly.
+METRICS_ALLOWED_IPS = os.environ.get('METRICS_ALLOWED_IPS', '').split(',')
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+# Auth tokens expire TOKEN_TTL after login (None: never); the token -> user lookup is
+# cached for TOKEN_CACHE_TIMEOUT seconds. `manage.py purge_expired_tokens` deletes old tokens.
+TOKEN_TTL = timedelta(days=30)
+TOKEN_CACHE_TIMEOUT = 300
+
+# Longest stay one booking may cover, in nights (a booking writes a RoomNight and a
+# HotelDailyStats row per night in one transaction)
+MAX_STAY_NIGHTS = 60
+
+# Hotel full-text search: longest accepted query and per-query time budget
+HOTEL_SEARCH_MAX_LENGTH = 100
+HOTEL_SEARCH_TIMEOUT_MS = 500
+
+# /top-hotels/ ranks hotels by sum(weight * value) over Hotel counters ('rating' is the
+# average rate). The defaults rank by bookings and break ties by rating. After changing
+# the weights run `manage.py rebuild_hotel_counters` to re-score every hotel.
+TOP_HOTELS_SCORE = {'bookings_count': 1.0, 'rating': 0.01}
+TOP_HOTELS_LIMIT = 5
+TOP_HOTELS_MAX_LIMIT = 50
+
+# Bulk import of hotels and rooms (POST /import/, `manage.py import_catalog`): rows per
+# validated and inserted chunk, and how many row errors the report lists
+IMPORT_BATCH_SIZE = 500
+IMPORT_MAX_ERRORS = 1000
+
+# Most rooms one POST /room/batch/ may create
+ROOM_BATCH_MAX_SIZE = 5000
+
+# Rows fetched from the database and written to the response at a time by the
+# streaming exports (/bookings/export/<csv|ndjson>/)
+EXPORT_CHUNK_SIZE = 2000
+
+# Hotel.image variants rendered by `manage.py process_images` (hotels.images): the box
+# each one is scaled into, in pixels, saved as WebP and JPEG. Larger uploads are refused.
+IMAGE_VARIANTS = {'thumb': (160, 160), 'card': (480, 360), 'full': (1600, 1200)}
+IMAGE_MAX_PIXELS = 40_000_000
+IMAGE_BATCH_SIZE = 10
+IMAGE_POLL_INTERVAL = 5
+
+# /owner/analytics/: period shown when none is given and the longest one allowed, in days
+ANALYTICS_DEFAULT_DAYS = 30
+ANALYTICS_MAX_DAYS = 3 * 366
+
 
 SWAGGER_SETTINGS = { 
    'SECURITY_DEFINITIONS': {
@@ -186,11 +310,29 @@ SWAGGER_SETTINGS = {
     
 }
 
+# Two-tier cache, see core.cache.TieredCache: a per-process LRU in front of the shared
+# Redis at REDIS_URL, which also carries L1 invalidations between workers. Without
+# REDIS_URL (tests, local runs) a local-memory cache stands in for Redis.
+REDIS_URL = os.environ.get('REDIS_URL')
+
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
-        'LOCATION': os.path.join(BASE_DIR, 'restel_cache'),
-    }
+        'BACKEND': 'core.cache.TieredCache',
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'SHARED': 'shared',
+            'L1_MAX_ENTRIES': 1000,
+            'L1_TIMEOUT': 30,
+            'BUS_URL': REDIS_URL,
+        },
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+    } if REDIS_URL else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'shared',
+    },
 }
 
 
@@ -215,6 +357,10 @@ LOGGING = {
             'level': 'INFO',
             'propagate': True,
         },
+        'core.querybudget': {
+            'handlers': ['file'],
+            'level': 'WARNING',
+        },
     },
     'formatters': {
         'verbose': {
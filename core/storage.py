@@ -0,0 +1,192 @@
+import hashlib
+import hmac
+import mimetypes
+import posixpath
+import tempfile
+import threading
+from datetime import datetime, timezone
+from urllib.parse import quote, urlsplit
+
+import requests
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import File
+from django.core.files.storage import Storage
+from django.utils.deconstruct import deconstructible
+
+# the bodies of streamed uploads aren't hashed, S3 and minio accept that with SigV4
+UNSIGNED_PAYLOAD = 'UNSIGNED-PAYLOAD'
+# longest validity S3 allows for a presigned URL
+MAX_URL_EXPIRE = 7 * 24 * 3600
+
+
+class S3Error(OSError):
+    def __init__(self, response):
+        super().__init__(f'S3 {response.request.method} {urlsplit(response.url).path}: {response.status_code} {response.text[:200]}')
+        self.status_code = response.status_code
+
+
+def _quote(value, safe='-_.~'):
+    return quote(value, safe=safe)
+
+
+def _hmac(key, message):
+    return hmac.new(key, message.encode(), hashlib.sha256).digest()
+
+
+def signing_key(secret_key, date, region, service='s3'):
+    key = _hmac(f'AWS4{secret_key}'.encode(), date)
+    for part in (region, service, 'aws4_request'):
+        key = _hmac(key, part)
+    return key
+
+
+def signature(secret_key, region, amz_date, method, path, query, headers, payload_hash):
+    # AWS Signature Version 4 of one request; query and headers are dicts, header
+    # names in lower case, all of them are signed
+    scope = f'{amz_date[:8]}/{region}/s3/aws4_request'
+    canonical_request = '\n'.join((
+        method,
+        _quote(path, safe='/-_.~'),
+        '&'.join(f'{_quote(name)}={_quote(value)}' for name, value in sorted(query.items())),
+        ''.join(f'{name}:{str(value).strip()}\n' for name, value in sorted(headers.items())),
+        ';'.join(sorted(headers)),
+        payload_hash,
+    ))
+    string_to_sign = '\n'.join((
+        'AWS4-HMAC-SHA256', amz_date, scope, hashlib.sha256(canonical_request.encode()).hexdigest(),
+    ))
+    return hmac.new(signing_key(secret_key, amz_date[:8], region), string_to_sign.encode(), hashlib.sha256).hexdigest()
+
+
+@deconstructible
+class S3Storage(Storage):
+    # Media in an S3-compatible bucket (AWS S3, minio, ...), so web nodes keep no files.
+    # Uploads are streamed from the uploaded file to the bucket, reads go to the client
+    # as presigned GET URLs and never pass through the web workers. Objects are addressed
+    # as <endpoint_url>/<bucket>/<key> when endpoint_url is given (minio), as
+    # https://<bucket>.s3.<region>.amazonaws.com/<key> otherwise; path_style overrides that.
+    def __init__(
+        self, bucket=None, endpoint_url=None, region='us-east-1', access_key=None, secret_key=None,
+        path_style=None, location='', url_expire=MAX_URL_EXPIRE, url_stable_for=24 * 3600,
+        cache_control='public, max-age=604800, immutable', timeout=30, spool_size=8 * 1024 * 1024,
+    ):
+        if not bucket:
+            raise ImproperlyConfigured('S3Storage: не задан bucket')
+        if not 0 < url_expire <= MAX_URL_EXPIRE or not 0 <= url_stable_for < url_expire:
+            raise ImproperlyConfigured(f'S3Storage: url_expire от 1 до {MAX_URL_EXPIRE} с, url_stable_for меньше url_expire')
+        self.bucket = bucket
+        self.endpoint_url = (endpoint_url or f'https://{bucket}.s3.{region}.amazonaws.com').rstrip('/')
+        self.path_style = bool(endpoint_url) if path_style is None else path_style
+        self.region = region
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.location = location.strip('/')
+        self.url_expire = url_expire
+        self.url_stable_for = url_stable_for
+        self.cache_control = cache_control
+        self.timeout = timeout
+        self.spool_size = spool_size
+        self._local = threading.local()
+
+    @property
+    def session(self):
+        # a keep-alive session per thread
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def key(self, name):
+        name = name.replace('\\', '/').lstrip('/')
+        return posixpath.join(self.location, name) if self.location else name
+
+    def object_url(self, name):
+        path = f'/{self.bucket}/{self.key(name)}' if self.path_style else f'/{self.key(name)}'
+        return f'{self.endpoint_url}{_quote(path, safe="/-_.~")}', path
+
+    def request(self, method, name, headers=None, **kwargs):
+        url, path = self.object_url(name)
+        amz_date = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+        signed = {'host': urlsplit(url).netloc, 'x-amz-content-sha256': UNSIGNED_PAYLOAD, 'x-amz-date': amz_date}
+        signed.update((header.lower(), value) for header, value in (headers or {}).items())
+        credential = f'{self.access_key}/{amz_date[:8]}/{self.region}/s3/aws4_request'
+        signed['authorization'] = (
+            f'AWS4-HMAC-SHA256 Credential={credential}, SignedHeaders={";".join(sorted(signed))}, '
+            f'Signature={signature(self.secret_key, self.region, amz_date, method, path, {}, signed, UNSIGNED_PAYLOAD)}'
+        )
+        # requests sets Host itself, from the same URL
+        del signed['host']
+        return self.session.request(method, url, headers=signed, timeout=self.timeout, **kwargs)
+
+    def head(self, name):
+        response = self.request('HEAD', name)
+        if response.status_code == 404:
+            return None
+        if response.status_code != 200:
+            raise S3Error(response)
+        return response
+
+    def _open(self, name, mode='rb'):
+        if 'w' in mode or '+' in mode or 'a' in mode:
+            raise ValueError('S3Storage открывает файлы только для чтения, записывайте через save()')
+        response = self.request('GET', name, stream=True)
+        with response:
+            if response.status_code == 404:
+                raise FileNotFoundError(name)
+            if response.status_code != 200:
+                raise S3Error(response)
+            # Pillow and friends need to seek: small objects stay in memory, large ones
+            # are spooled to a temporary file, never more than spool_size in memory
+            file = tempfile.SpooledTemporaryFile(max_size=self.spool_size)
+            for chunk in response.iter_content(64 * 1024):
+                file.write(chunk)
+        file.seek(0)
+        return File(file, name)
+
+    def _save(self, name, content):
+        content.seek(0)
+        headers = {'content-type': mimetypes.guess_type(name)[0] or 'application/octet-stream'}
+        if self.cache_control:
+            headers['cache-control'] = self.cache_control
+        # a file object with a known size: requests sends Content-Length and then the
+        # body a block at a time, the upload is never read into memory as a whole
+        response = self.request('PUT', name, headers=headers, data=content)
+        if response.status_code != 200:
+            raise S3Error(response)
+        return name
+
+    def delete(self, name):
+        response = self.request('DELETE', name)
+        if response.status_code not in (200, 204, 404):
+            raise S3Error(response)
+
+    def exists(self, name):
+        return self.head(name) is not None
+
+    def size(self, name):
+        response = self.head(name)
+        if response is None:
+            raise FileNotFoundError(name)
+        return int(response.headers['Content-Length'])
+
+    def url(self, name, now=None):
+        # A presigned GET valid for url_expire seconds. The signing time is rounded down
+        # to url_stable_for, so an object keeps the same URL for that long and browsers
+        # and CDNs cache it like any static file (the objects are saved with
+        # cache_control); a URL stays valid at least url_expire - url_stable_for seconds.
+        url, path = self.object_url(name)
+        timestamp = int((now or datetime.now(timezone.utc)).timestamp())
+        if self.url_stable_for:
+            timestamp -= timestamp % self.url_stable_for
+        amz_date = datetime.fromtimestamp(timestamp, timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+        query = {
+            'X-Amz-Algorithm': 'AWS4-HMAC-SHA256',
+            'X-Amz-Credential': f'{self.access_key}/{amz_date[:8]}/{self.region}/s3/aws4_request',
+            'X-Amz-Date': amz_date,
+            'X-Amz-Expires': str(self.url_expire),
+            'X-Amz-SignedHeaders': 'host',
+        }
+        query['X-Amz-Signature'] = signature(
+            self.secret_key, self.region, amz_date, 'GET', path, query, {'host': urlsplit(url).netloc}, UNSIGNED_PAYLOAD,
+        )
+        return f'{url}?' + '&'.join(f'{_quote(name)}={_quote(value)}' for name, value in query.items())
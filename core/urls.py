@@ -22,6 +22,8 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter 
 from django.contrib.staticfiles.urls import staticfiles_urlpatterns
 
+from core.metrics import metrics_view
+
 schema_view = get_schema_view(
    openapi.Info(
       title="Hotel Booking",
@@ -41,6 +43,7 @@ schema_view = get_schema_view(
 urlpatterns = [
     path('', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
     path('admin/', admin.site.urls),
+    path('metrics/', metrics_view, name='metrics'),
     path('account/', include('users.urls')),
     path('', include('hotels.urls'))
 ]
@@ -0,0 +1,28 @@
+import os
+import re
+import shutil
+import tempfile
+
+# Workers write their metrics to files in PROMETHEUS_MULTIPROC_DIR so /metrics can
+# sum them (core.metrics). Every gunicorn master (web and asgi in the Procfile) gets a
+# directory of its own, named after its proc_name under the configured one, so a
+# restart of one never wipes the other's files. The variable has to be set before
+# anything imports prometheus_client, this file included: on_starting runs in the
+# master before the workers are forked, the directory is emptied on every start.
+METRICS_ROOT = os.environ.get('PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'restel-metrics'))
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 4))
+
+
+def on_starting(server):
+    path = os.path.join(METRICS_ROOT, re.sub(r'[^\w.-]+', '-', server.cfg.proc_name))
+    os.environ['PROMETHEUS_MULTIPROC_DIR'] = path
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
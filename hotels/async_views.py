@@ -0,0 +1,135 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import prefetch_related_objects
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.views import View
+from rest_framework import exceptions
+from rest_framework.request import ForcedAuthentication, Request
+
+from core.renderers import ORJSONRenderer
+from hotels.mixins import deferred_prefetch, page_etag, representation_version, set_version_headers, version_annotations
+from hotels.search import astatement_timeout
+from hotels.views import AvailabilityAPIView, FavoriteListAPIView, HotelViewSet, TopHotelsAPIView
+from users.authentication import CachedTokenAuthentication
+
+renderer = ORJSONRenderer()
+
+
+def json_response(data, status=200, headers=None):
+    return HttpResponse(renderer.render(data), status=status, content_type=renderer.media_type, headers=headers)
+
+
+async def conditional(view, versions, respond):
+    # ConditionalGetMixin._conditional for async views
+    etag, last_modified = representation_version(view.request, versions)
+    response = get_conditional_response(view.request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = await respond(view)
+        if response.status_code == 200:
+            set_version_headers(response, etag, last_modified)
+    return response
+
+
+class AsyncReadView(View):
+    # Async GET counterpart of a read-only DRF view, served under /async/ by the ASGI
+    # workers (core.asgi). The token is checked through the async cache and the queries
+    # run through the async ORM, so the event loop serves other connections while they
+    # wait. Everything in between - permissions, query parameters, filters,
+    # ?fields=/?expand=, pagination and the serializer - is `drf_view`'s own, so both
+    # paths answer with the same JSON. respond() renders drf_view's list; views that
+    # answer something else (a detail, a conditional list) override it.
+    drf_view = None
+    action = None
+
+    async def get(self, request, *args, **kwargs):
+        try:
+            drf_request = await self.initialize_request(request)
+            view = self.drf_view(request=drf_request, args=args, kwargs=kwargs, format_kwarg=None, action=self.action)
+            view.check_permissions(drf_request)
+            return await self.respond(view)
+        except exceptions.APIException as exc:
+            return self.handle_exception(exc)
+
+    async def initialize_request(self, request):
+        authenticator = CachedTokenAuthentication()
+        # APIClient.force_authenticate() (tests) is picked up by Request itself
+        if getattr(request, '_force_auth_user', None) is None:
+            credentials = await authenticator.aauthenticate(request)
+            if credentials is not None:
+                return Request(request, authenticators=[ForcedAuthentication(*credentials)])
+        return Request(request, authenticators=[authenticator])
+
+    def handle_exception(self, exc):
+        # the status, body and headers DRF's exception handling gives
+        headers = {}
+        if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+            headers['WWW-Authenticate'] = CachedTokenAuthentication.keyword
+        data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+        return json_response(data, exc.status_code, headers)
+
+    async def respond(self, view):
+        queryset = view.filter_queryset(view.get_queryset())
+        if view.paginator is None:
+            rows = [obj async for obj in queryset]
+            return json_response(view.get_serializer(rows, many=True).data)
+        page = await view.paginator.apaginate_queryset(queryset, view.request, view=view)
+        return json_response(view.paginator.get_paginated_response(view.get_serializer(page, many=True).data).data)
+
+
+class HotelListView(AsyncReadView):
+    drf_view = HotelViewSet
+    action = 'list'
+    query_budget = 7
+
+    async def respond(self, view):
+        if not view.request.query_params.get('search'):
+            return await self.conditional_list(view)
+        async with astatement_timeout(settings.HOTEL_SEARCH_TIMEOUT_MS):
+            return await self.conditional_list(view)
+
+    async def conditional_list(self, view):
+        # ConditionalGetMixin.list: the ETag comes from the page rows
+        queryset, prefetch = deferred_prefetch(view.filter_queryset(view.get_queryset()).annotate(**version_annotations(view.version_fields)))
+        page = await view.paginator.apaginate_queryset(queryset, view.request, view=view)
+        etag = page_etag(view.request, page, view.version_fields, view.paginator)
+        response = get_conditional_response(view.request, etag=etag)
+        if response is None:
+            await sync_to_async(prefetch_related_objects)(page, *prefetch)
+            response = json_response(view.paginator.get_paginated_response(view.get_serializer(page, many=True).data).data)
+            set_version_headers(response, etag, None)
+        return response
+
+
+class HotelDetailView(AsyncReadView):
+    drf_view = HotelViewSet
+    action = 'retrieve'
+    query_budget = 5
+
+    async def respond(self, view):
+        versions = await view.get_queryset().filter(pk=view.kwargs['pk']).values_list(*view.version_fields).afirst()
+        if versions is None:
+            raise exceptions.NotFound()
+        return await conditional(view, versions, self.retrieve)
+
+    async def retrieve(self, view):
+        hotel = await view.filter_queryset(view.get_queryset()).filter(pk=view.kwargs['pk']).afirst()
+        if hotel is None:
+            raise exceptions.NotFound()
+        view.check_object_permissions(view.request, hotel)
+        return json_response(view.get_serializer(hotel).data)
+
+
+class TopHotelsView(AsyncReadView):
+    drf_view = TopHotelsAPIView
+    query_budget = 4
+
+
+class AvailabilityView(AsyncReadView):
+    drf_view = AvailabilityAPIView
+    query_budget = 2
+
+
+class FavoriteListView(AsyncReadView):
+    drf_view = FavoriteListAPIView
+    query_budget = 2
@@ -0,0 +1,66 @@
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from hotels.models import Booking, Hotel, HotelDailyStats, Room, RoomNight
+
+# the constraints that reject a stay overlapping one already booked
+CONFLICT_CONSTRAINTS = ('booking_no_overlap', 'room_night_unique')
+
+
+class RoomUnavailable(Exception):
+    pass
+
+
+def stay_nights(check_in, check_out):
+    return [check_in + timedelta(days=i) for i in range((check_out - check_in).days)]
+
+
+def is_conflict(exc):
+    # any other integrity error is a bug, not a taken room, and must not be reported as one
+    diag = getattr(exc.__cause__, 'diag', None)
+    return getattr(diag, 'constraint_name', None) in CONFLICT_CONSTRAINTS
+
+
+def book_room(user, room, check_in, check_out, guests):
+    # No read-then-write: a conflicting stay is rejected by the booking_no_overlap
+    # exclusion constraint (PostgreSQL) and by the unique (room, night) index of the
+    # RoomNight ledger, so concurrent requests for the same room need no locks.
+    with transaction.atomic():
+        booking = Booking(
+            user=user,
+            room=room,
+            check_in=check_in,
+            check_out=check_out,
+            guests=guests,
+            total_cost=room.price_per_night * (check_out - check_in).days,
+        )
+        try:
+            booking.save(force_insert=True)
+            RoomNight.objects.bulk_create([
+                RoomNight(room=room, booking=booking, night=night) for night in stay_nights(check_in, check_out)
+            ])
+        except IntegrityError as exc:
+            if is_conflict(exc):
+                raise RoomUnavailable()
+            raise
+
+        if room.status != 'Booked':
+            Room.objects.filter(pk=room.pk).update(status='Booked', updated_at=timezone.now())
+        Hotel.objects.bump(room.hotel_id, bookings_count=1)
+        HotelDailyStats.objects.record(room.hotel_id, booking)
+    return booking
+
+
+def cancel_booking(booking):
+    # returns False if the booking was gone already (a retried or concurrent cancel):
+    # the counters and the rollup move only for the request whose DELETE removed the row
+    with transaction.atomic():
+        # the ledger rows go with the booking in a single cascading DELETE
+        _, deleted = Booking.objects.filter(pk=booking.pk).delete()
+        if not deleted.get(Booking._meta.label):
+            return False
+        Hotel.objects.bump(booking.room.hotel_id, bookings_count=-1)
+        HotelDailyStats.objects.record(booking.room.hotel_id, booking, sign=-1)
+    return True
@@ -0,0 +1,62 @@
+import csv
+from itertools import islice
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+FORMATS = {'csv': 'text/csv; charset=utf-8', 'ndjson': 'application/x-ndjson'}
+
+# column name -> Booking lookup; the export reads tuples straight from the cursor,
+# joined to the room and the hotel, without building model instances
+BOOKING_COLUMNS = {
+    'id': 'id',
+    'created_at': 'created_at',
+    'check_in': 'check_in',
+    'check_out': 'check_out',
+    'guests': 'guests',
+    'total_cost': 'total_cost',
+    'user': 'user__email',
+    'room_id': 'room_id',
+    'room_number': 'room__room_number',
+    'room_type': 'room__room_type',
+    'hotel_id': 'room__hotel_id',
+    'hotel': 'room__hotel__name',
+}
+
+
+class _Echo:
+    # csv.writer target that hands the formatted line back instead of storing it
+    def write(self, value):
+        return value
+
+
+# a text cell starting with one of these is run as a formula by Excel and friends
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def csv_cell(value):
+    # user-entered text (hotel names, emails, ...) is quoted with a leading ' so a
+    # spreadsheet shows it as text; numbers and dates are written as they are
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def export_rows(queryset, columns):
+    # a server-side cursor on PostgreSQL: EXPORT_CHUNK_SIZE rows in memory at a time
+    return queryset.values_list(*columns.values()).iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+
+
+def stream_export(rows, columns, format):
+    # yields the export a chunk of rows at a time, a header line first for CSV
+    names = list(columns)
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    writer = csv.writer(_Echo())
+    if format == 'csv':
+        yield writer.writerow(names)
+    rows = iter(rows)
+    while chunk := list(islice(rows, settings.EXPORT_CHUNK_SIZE)):
+        if format == 'csv':
+            yield ''.join(writer.writerow([csv_cell(value) for value in row]) for row in chunk)
+        else:
+            yield ''.join(encoder.encode(dict(zip(names, row))) + '\n' for row in chunk)
@@ -0,0 +1,95 @@
+import io
+import logging
+import os
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from hotels.models import Hotel
+
+logger = logging.getLogger(__name__)
+
+# Pillow format and save options per variant file extension
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+class ImageTooLarge(ValueError):
+    pass
+
+
+def render_variants(file):
+    # {variant: {extension: bytes}} for every IMAGE_VARIANTS size. JPEGs are decoded
+    # straight at about the largest variant size (draft mode), other formats are
+    # refused above IMAGE_MAX_PIXELS, so a multi-megabyte upload never sits in
+    # memory at full resolution more than once.
+    sizes = sorted(settings.IMAGE_VARIANTS.items(), key=lambda item: item[1][0] * item[1][1], reverse=True)
+    with Image.open(file) as image:
+        if image.width * image.height > settings.IMAGE_MAX_PIXELS:
+            raise ImageTooLarge(f'{image.width}x{image.height}')
+        image.draft('RGB', sizes[0][1])
+        image = ImageOps.exif_transpose(image).convert('RGB')
+
+    variants = {}
+    for name, size in sizes:
+        # each variant is scaled down from the previous, larger one
+        image.thumbnail(size, Image.LANCZOS)
+        variants[name] = {}
+        for extension, (format, options) in FORMATS.items():
+            buffer = io.BytesIO()
+            image.save(buffer, format, **options)
+            variants[name][extension] = buffer.getvalue()
+    return variants
+
+
+def process_hotel_image(hotel):
+    # renders and stores the variants of hotel.image, returns False if the image
+    # changed in the meantime (the new one stays pending)
+    source = hotel.image.name or ''
+    stem = os.path.splitext(os.path.basename(source))[0]
+    rendered = {}
+    if source:
+        try:
+            with hotel.image.open('rb') as file:
+                rendered = render_variants(file)
+        except (OSError, ValueError, Image.DecompressionBombError) as exc:
+            # the hotel keeps serving the original image
+            logger.warning('Не удалось обработать изображение отеля %s (%s): %r', hotel.pk, source, exc)
+
+    variants = {
+        name: {
+            extension: default_storage.save(f'hotel_image/variants/{hotel.pk}/{stem}-{name}.{extension}', ContentFile(content))
+            for extension, content in files.items()
+        }
+        for name, files in rendered.items()
+    }
+    # update() skips auto_now, the hotel's ETag needs a new updated_at
+    updated = Hotel.objects.filter(pk=hotel.pk, image=hotel.image.name).update(
+        image_variants=variants, image_pending=False, updated_at=timezone.now(),
+    )
+    stale = variant_paths(hotel.image_variants) if updated else variant_paths(variants)
+    for path in stale:
+        default_storage.delete(path)
+    return bool(updated)
+
+
+def variant_paths(variants):
+    return [path for files in variants.values() for path in files.values()]
+
+
+def process_pending(batch_size=None):
+    # processes up to batch_size hotels waiting for variants, returns how many. Runs
+    # outside any transaction so rendering never holds a lock on the hotel row; meant
+    # for a single worker, a second one would render the same hotels.
+    hotels = list(
+        Hotel.objects.filter(image_pending=True).order_by('id')
+        .only('id', 'image', 'image_variants')[:batch_size or settings.IMAGE_BATCH_SIZE]
+    )
+    for hotel in hotels:
+        process_hotel_image(hotel)
+    return len(hotels)
@@ -0,0 +1,151 @@
+import csv
+import io
+import json
+import os
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+
+from hotels.models import Hotel, Room, refresh_leaderboard
+from hotels.serializers import HotelImportSerializer, RoomImportSerializer
+
+FORMATS = ('csv', 'jsonl')
+
+
+class ImportFormatError(ValueError):
+    pass
+
+
+def import_format(filename):
+    extension = os.path.splitext(filename or '')[1].lower().lstrip('.')
+    return 'jsonl' if extension in ('jsonl', 'ndjson') else extension
+
+
+def read_rows(file, format):
+    # Yields (line, row, error) one row at a time from a binary file object, nothing
+    # but the current row is held in memory. A row that can't be parsed comes with
+    # an error message instead of a dict; a broken file raises ImportFormatError.
+    if format not in FORMATS:
+        raise ImportFormatError(f'Неизвестный формат {format!r}, поддерживаются: {", ".join(FORMATS)}')
+    text = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+    try:
+        if format == 'csv':
+            reader = csv.DictReader(text)
+            for row in reader:
+                yield reader.line_num, row, None
+        else:
+            for line, data in enumerate(text, 1):
+                if not data.strip():
+                    continue
+                try:
+                    row = json.loads(data)
+                except ValueError as exc:
+                    yield line, None, f'Неверный JSON: {exc}'
+                    continue
+                if isinstance(row, dict):
+                    yield line, row, None
+                else:
+                    yield line, None, 'Ожидается JSON-объект'
+    except (UnicodeDecodeError, csv.Error) as exc:
+        raise ImportFormatError(f'Не удалось прочитать файл: {exc}')
+    finally:
+        # the caller owns the file, don't let the wrapper close it
+        text.detach()
+
+
+class CatalogImport:
+    # Imports hotel and room rows for one owner:
+    #   {"kind": "hotel", "ref": "H1", "name": ..., "address": ..., "description": ..., "stars": 4}
+    #   {"kind": "room", "hotel": "H1", "room_number": "101", "room_type": "Standard", "capacity": 2, "price_per_night": 80}
+    # A room's `hotel` is the ref of a hotel earlier in the file or the id of one of
+    # the owner's hotels. Rows are validated and bulk-inserted in chunks of
+    # IMPORT_BATCH_SIZE, each chunk in its own transaction, so the memory used is one
+    # chunk plus the file's ref -> id map; invalid rows are skipped and reported.
+    def __init__(self, owner, batch_size=None):
+        self.owner = owner
+        self.batch_size = batch_size or settings.IMPORT_BATCH_SIZE
+        self.refs = {}
+        # building a ModelSerializer's fields costs more than validating a row with
+        # them: one serializer per kind validates every row of the file
+        self.serializers = {'hotel': HotelImportSerializer(), 'room': RoomImportSerializer()}
+        self.rows = self.hotels_created = self.rooms_created = self.errors_count = 0
+        self.errors = []
+
+    def run(self, rows):
+        rows = iter(rows)
+        while chunk := list(islice(rows, self.batch_size)):
+            self.import_chunk(chunk)
+        return self.report()
+
+    def report(self):
+        return {
+            'rows': self.rows,
+            'hotels_created': self.hotels_created,
+            'rooms_created': self.rooms_created,
+            'errors_count': self.errors_count,
+            # the first IMPORT_MAX_ERRORS of them
+            'errors': sorted(self.errors, key=lambda error: error['line']),
+        }
+
+    def error(self, line, errors):
+        self.errors_count += 1
+        if len(self.errors) < settings.IMPORT_MAX_ERRORS:
+            self.errors.append({'line': line, 'errors': errors})
+
+    def validate(self, kind, row):
+        try:
+            return self.serializers[kind].run_validation(row), None
+        except ValidationError as exc:
+            return None, exc.detail
+
+    def import_chunk(self, chunk):
+        hotels, rooms, chunk_refs = [], [], set()
+        for line, row, error in chunk:
+            self.rows += 1
+            if error is not None:
+                self.error(line, {'non_field_errors': [error]})
+                continue
+            kind = str(row.get('kind') or '').strip()
+            if kind not in self.serializers:
+                self.error(line, {'kind': ['Ожидается hotel или room']})
+                continue
+            data, errors = self.validate(kind, row)
+            if errors:
+                self.error(line, errors)
+            elif kind == 'hotel':
+                ref = str(row.get('ref') or '').strip()
+                if ref and (ref in self.refs or ref in chunk_refs):
+                    self.error(line, {'ref': [f'ref {ref!r} уже встречался в файле']})
+                else:
+                    chunk_refs.add(ref)
+                    hotels.append((ref, Hotel(owner=self.owner, **data)))
+            else:
+                rooms.append((line, str(row.get('hotel') or '').strip(), Room(**data)))
+
+        with transaction.atomic():
+            created = Hotel.objects.bulk_create([hotel for _, hotel in hotels])
+            if created:
+                # bulk_create skips the post_save receiver that adds hotels to the leaderboard
+                refresh_leaderboard([hotel.pk for hotel in created])
+            self.refs.update((ref, hotel.pk) for ref, hotel in hotels if ref)
+
+            # one query for every hotel id the chunk's rooms refer to; isdigit() alone
+            # lets through characters like '²' that int() rejects
+            ids = {int(key) for _, key, _ in rooms if key not in self.refs and key.isascii() and key.isdigit()}
+            owned = set(Hotel.objects.filter(owner=self.owner, pk__in=ids).values_list('pk', flat=True)) if ids else set()
+            valid = []
+            for line, key, room in rooms:
+                hotel_id = self.refs.get(key)
+                if hotel_id is None and key.isascii() and key.isdigit() and int(key) in owned:
+                    hotel_id = int(key)
+                if hotel_id is None:
+                    self.error(line, {'hotel': [f'Отель {key!r} не найден среди ваших отелей']})
+                    continue
+                room.hotel_id = hotel_id
+                valid.append(room)
+            Room.objects.bulk_create(valid)
+
+        self.hotels_created += len(created)
+        self.rooms_created += len(valid)
@@ -0,0 +1,90 @@
+import json
+import time
+
+import brotli
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from django.urls import resolve
+from django.utils.text import compress_string
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from core.renderers import ORJSONRenderer
+
+User = get_user_model()
+
+DEFAULT_PATHS = ('/hotel/', '/bookings/?expand=room')
+
+
+def cpu_ms(function, repeat):
+    # CPU time of one call, the best of `repeat` runs
+    best = None
+    for _ in range(repeat):
+        started = time.process_time_ns()
+        function()
+        elapsed = time.process_time_ns() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return round(best / 1e6, 3)
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает ответы API до и после ORJSONRenderer и сжатия: время рендеринга JSON '
+        '(JSONRenderer DRF и orjson) и байты ответа без сжатия, в gzip и в brotli'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*', default=DEFAULT_PATHS, help=f'пути API, по умолчанию {" ".join(DEFAULT_PATHS)}')
+        parser.add_argument('--email', help='от чьего имени запрашивать (по умолчанию пользователь с наибольшим числом бронирований)')
+        parser.add_argument('--page-size', type=int, default=100)
+        parser.add_argument('--repeat', type=int, default=20, help='сколько раз повторить каждый замер')
+        parser.add_argument('--output', help='записать результаты в JSON')
+
+    def handle(self, *args, **options):
+        if options['email']:
+            user = User.objects.filter(email=options['email']).first()
+        else:
+            user = User.objects.annotate(bookings_total=Count('booking')).order_by('-bookings_total').first()
+        if user is None:
+            raise CommandError('Нет пользователя, запустите seed_catalog или укажите --email')
+
+        results = {path: self.measure(path, user, options) for path in options['paths']}
+        self.stdout.write(
+            f"{'путь':<28}{'DRF, мс':>9}{'orjson, мс':>11}{'байт':>10}{'gzip':>9}{'gzip, мс':>9}{'br':>9}{'br, мс':>8}"
+        )
+        for path, row in results.items():
+            self.stdout.write(
+                f"{path:<28}{row['drf_render_ms']:>9}{row['orjson_render_ms']:>11}{row['bytes']:>10}"
+                f"{row['gzip_bytes']:>9}{row['gzip_ms']:>9}{row['br_bytes']:>9}{row['br_ms']:>8}"
+            )
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump({'user': user.email, 'page_size': options['page_size'], 'paths': results}, file, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Результаты записаны в {options['output']}"))
+
+    def measure(self, path, user, options):
+        separator = '&' if '?' in path else '?'
+        request = APIRequestFactory().get(f"{path}{separator}page_size={options['page_size']}")
+        force_authenticate(request, user)
+        match = resolve(request.path)
+        response = match.func(request, *match.args, **match.kwargs)
+        if response.status_code != 200:
+            raise CommandError(f'{path}: {response.status_code} {response.data}')
+        data = response.data
+
+        before, after = JSONRenderer().render(data), ORJSONRenderer().render(data)
+        if json.loads(before) != json.loads(after):
+            raise CommandError(f'{path}: ORJSONRenderer отдаёт не то же, что JSONRenderer')
+        quality = settings.COMPRESSION_BROTLI_QUALITY
+        return {
+            'rows': len(data.get('results', data)) if isinstance(data, dict) else len(data),
+            'drf_render_ms': cpu_ms(lambda: JSONRenderer().render(data), options['repeat']),
+            'orjson_render_ms': cpu_ms(lambda: ORJSONRenderer().render(data), options['repeat']),
+            'bytes': len(after),
+            'gzip_bytes': len(compress_string(after)),
+            'gzip_ms': cpu_ms(lambda: compress_string(after), options['repeat']),
+            'br_bytes': len(brotli.compress(after, quality=quality, mode=brotli.MODE_TEXT)),
+            'br_ms': cpu_ms(lambda: brotli.compress(after, quality=quality, mode=brotli.MODE_TEXT), options['repeat']),
+        }
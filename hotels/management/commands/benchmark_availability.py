@@ -0,0 +1,107 @@
+import random
+import statistics
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from hotels.booking import stay_nights
+from hotels.models import Booking, Hotel, Room, RoomNight
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Замеряет поиск свободных комнат на синтетическом каталоге (данные откатываются после замера)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rooms', type=int, default=100_000)
+        parser.add_argument('--rooms-per-hotel', type=int, default=50)
+        parser.add_argument('--bookings-per-room', type=int, default=3)
+        parser.add_argument('--searches', type=int, default=20)
+        parser.add_argument('--page-size', type=int, default=20)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.seed(options)
+            page, full = self.measure(options)
+            transaction.set_rollback(True)
+
+        for name, timings in (('первая страница', page), ('все свободные комнаты', full)):
+            timings.sort()
+            self.stdout.write(
+                f'{name}: медиана {statistics.median(timings):.1f} мс, '
+                f'p95 {timings[int(len(timings) * 0.95) - 1]:.1f} мс, макс {timings[-1]:.1f} мс'
+            )
+
+    def seed(self, options):
+        started = time.perf_counter()
+        rng = random.Random(42)
+        batch_size = options['batch_size']
+        owner = User.objects.create_user(email='availability-benchmark@example.com', password=None, is_owner=True)
+        hotels = Hotel.objects.bulk_create(
+            [
+                Hotel(name=f'Benchmark {i}', address='-', description='-', stars=str(i % 5 + 1), owner=owner)
+                for i in range(options['rooms'] // options['rooms_per_hotel'] + 1)
+            ],
+            batch_size=batch_size,
+        )
+        rooms = Room.objects.bulk_create(
+            [
+                Room(
+                    hotel=hotels[i // options['rooms_per_hotel']], room_number=str(i), room_type=Room.STANDARD,
+                    capacity=rng.randint(1, 3), price_per_night=Decimal(rng.randint(20, 300)),
+                )
+                for i in range(options['rooms'])
+            ],
+            batch_size=batch_size,
+        )
+        start = date.today()
+        bookings = []
+        for room in rooms:
+            check_in = start
+            for _ in range(options['bookings_per_room']):
+                check_in += timedelta(days=rng.randint(0, 20))
+                nights = rng.randint(1, 7)
+                bookings.append(Booking(
+                    user=owner, room=room, check_in=check_in, check_out=check_in + timedelta(days=nights),
+                    guests=1, total_cost=room.price_per_night * nights,
+                ))
+                check_in += timedelta(days=nights)
+            if len(bookings) >= batch_size:
+                self.save_bookings(bookings)
+                bookings = []
+        self.save_bookings(bookings)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE hotels_room; ANALYZE hotels_roomnight; ANALYZE hotels_hotel;')
+        self.stdout.write(f'{len(rooms)} комнат в {len(hotels)} отелях, создано за {time.perf_counter() - started:.1f} с')
+
+    def save_bookings(self, bookings):
+        Booking.objects.bulk_create(bookings)
+        RoomNight.objects.bulk_create([
+            RoomNight(room=booking.room, booking=booking, night=night)
+            for booking in bookings for night in stay_nights(booking.check_in, booking.check_out)
+        ])
+
+    def measure(self, options):
+        rng = random.Random(7)
+        page, full = [], []
+        for _ in range(options['searches']):
+            check_in = date.today() + timedelta(days=rng.randint(0, 60))
+            check_out = check_in + timedelta(days=rng.randint(1, 7))
+            rooms = Room.objects.available(check_in, check_out).filter(
+                capacity__gte=rng.randint(1, 3), hotel__stars=str(rng.randint(1, 5)),
+            )
+
+            started = time.perf_counter()
+            list(rooms.order_by('price_per_night', 'id')[:options['page_size']])
+            page.append((time.perf_counter() - started) * 1000)
+
+            started = time.perf_counter()
+            list(rooms.values_list('id', flat=True))
+            full.append((time.perf_counter() - started) * 1000)
+        return page, full
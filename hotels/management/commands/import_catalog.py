@@ -0,0 +1,46 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from hotels.importer import FORMATS, CatalogImport, ImportFormatError, import_format, read_rows
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Импортирует отели и комнаты владельца из CSV или JSONL (формат строк: hotels.importer.CatalogImport)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--owner', required=True, help='почта владельца отелей')
+        parser.add_argument('--format', choices=FORMATS, help='по умолчанию по расширению файла')
+        parser.add_argument('--batch-size', type=int)
+
+    def handle(self, *args, **options):
+        try:
+            owner = User.objects.get(email=options['owner'], is_owner=True)
+        except User.DoesNotExist:
+            raise CommandError(f"Владелец {options['owner']} не найден")
+        format = options['format'] or import_format(options['path'])
+        if format not in FORMATS:
+            raise CommandError(f'Укажите --format, поддерживаются: {", ".join(FORMATS)}')
+
+        importer = CatalogImport(owner, options['batch_size'])
+        failure = None
+        with open(options['path'], 'rb') as file:
+            try:
+                importer.run(read_rows(file, format))
+            except ImportFormatError as exc:
+                failure = exc
+        report = importer.report()
+
+        for error in report['errors']:
+            self.stderr.write(f"строка {error['line']}: {error['errors']}")
+        if report['errors_count'] > len(report['errors']):
+            self.stderr.write(f"... и еще {report['errors_count'] - len(report['errors'])} ошибок")
+        self.stdout.write(self.style.SUCCESS(
+            f"Строк: {report['rows']}, создано отелей: {report['hotels_created']}, комнат: {report['rooms_created']}, "
+            f"ошибок: {report['errors_count']}"
+        ))
+        if failure is not None:
+            # rows before the broken part stay imported
+            raise CommandError(str(failure))
@@ -0,0 +1,220 @@
+import json
+import math
+import random
+import statistics
+import threading
+import time
+from collections import Counter
+from datetime import date, timedelta
+
+import requests
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from hotels.models import Hotel, Room
+
+User = get_user_model()
+
+SCENARIOS = ('hotel-list', 'hotel-detail', 'top-hotels', 'booking-create', 'like')
+# scenario=weight; a client picks its next request with these odds
+DEFAULT_MIX = 'hotel-list=40,hotel-detail=25,top-hotels=15,booking-create=10,like=10'
+
+
+def percentile(sorted_values, fraction):
+    # nearest-rank percentile of an already sorted list
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(samples, elapsed):
+    # samples: [(status, milliseconds)]; status 0 means the request failed without a response
+    timings = sorted(ms for _, ms in samples)
+    statuses = Counter(str(status) for status, _ in samples)
+    return {
+        'requests': len(samples),
+        'errors': sum(1 for status, _ in samples if status == 0 or status >= 500),
+        'statuses': dict(sorted(statuses.items())),
+        'throughput_rps': round(len(samples) / elapsed, 1) if elapsed else 0.0,
+        'mean_ms': round(statistics.fmean(timings), 2) if timings else None,
+        'p50_ms': percentile(timings, 0.50),
+        'p95_ms': percentile(timings, 0.95),
+        'p99_ms': percentile(timings, 0.99),
+        'max_ms': timings[-1] if timings else None,
+    }
+
+
+def parse_mix(value):
+    # "hotel-list=50,like=10" -> {'hotel-list': 50, 'like': 10}
+    mix = {}
+    for part in filter(None, value.split(',')):
+        name, _, weight = part.partition('=')
+        if name not in SCENARIOS:
+            raise CommandError(f'Неизвестный сценарий {name}, доступны: {", ".join(SCENARIOS)}')
+        try:
+            mix[name] = float(weight)
+        except ValueError:
+            raise CommandError(f'Неверный вес сценария {name}: {weight!r}')
+    if not mix or sum(mix.values()) <= 0:
+        raise CommandError('Пустая смесь сценариев')
+    return mix
+
+
+class Client:
+    # one simulated user: a keep-alive session logged in as a seeded account
+    def __init__(self, base_url, email, password, hotel_ids, room_ids, seed, timeout, async_reads=False):
+        self.base_url = base_url.rstrip('/')
+        # hotel-list, hotel-detail and top-hotels against the async views (hotels.async_views)
+        self.read_prefix = '/async' if async_reads else ''
+        self.session = requests.Session()
+        self.hotel_ids = hotel_ids
+        self.room_ids = room_ids
+        self.rng = random.Random(seed)
+        self.timeout = timeout
+        response = self.session.post(f'{self.base_url}/account/login/', data={'email': email, 'password': password}, timeout=timeout)
+        if response.status_code != 200:
+            raise CommandError(f'Не удалось войти как {email}: {response.status_code} {response.text[:200]}')
+        self.session.headers['Authorization'] = f"Token {response.json()['token']}"
+
+    def request(self, scenario):
+        method, path, data = getattr(self, scenario.replace('-', '_'))()
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, f'{self.base_url}{path}', data=data, timeout=self.timeout)
+            status = response.status_code
+        except requests.RequestException:
+            status = 0
+        return status, round((time.perf_counter() - started) * 1000, 2)
+
+    def hotel_list(self):
+        if self.rng.random() < 0.3:
+            return 'GET', f'{self.read_prefix}/hotel/?stars={self.rng.randint(1, 5)}', None
+        return 'GET', f'{self.read_prefix}/hotel/', None
+
+    def hotel_detail(self):
+        return 'GET', f'{self.read_prefix}/hotel/{self.rng.choice(self.hotel_ids)}/', None
+
+    def top_hotels(self):
+        return 'GET', f'{self.read_prefix}/top-hotels/', None
+
+    def booking_create(self):
+        check_in = date.today() + timedelta(days=self.rng.randint(1, 365))
+        check_out = check_in + timedelta(days=self.rng.randint(1, 5))
+        data = {'check_in': check_in.isoformat(), 'check_out': check_out.isoformat(), 'guests': 1}
+        return 'POST', f'/bookings/{self.rng.choice(self.room_ids)}/', data
+
+    def like(self):
+        return 'POST', f'/hotel/{self.rng.choice(self.hotel_ids)}/like/', None
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный тест: параллельные клиенты шлют на работающий сервер смесь реальных запросов '
+        '(список и карточка отеля, топ-отели, бронирование, лайк) и пишут p50/p95/p99 и пропускную способность в JSON'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='адрес сервера')
+        parser.add_argument('--clients', type=int, default=16, help='параллельных клиентов')
+        parser.add_argument('--duration', type=float, default=30, help='длительность замера, с')
+        parser.add_argument('--requests', type=int, default=0, help='остановиться после стольких запросов (0 — без ограничения)')
+        parser.add_argument('--mix', default=DEFAULT_MIX, help='веса сценариев, например hotel-list=50,like=10')
+        parser.add_argument('--prefix', default='seed', help='чьими аккаунтами входить, как в seed_catalog')
+        parser.add_argument('--password', default='loadtest123')
+        parser.add_argument('--timeout', type=float, default=10, help='таймаут одного запроса, с')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--async-reads', action='store_true', help='сценарии чтения — на асинхронные /async/ (ASGI-сервер)')
+        parser.add_argument('--output', help='куда записать результаты (по умолчанию loadtest-<время>.json)')
+        parser.add_argument('--compare', help='JSON прошлого прогона: вывести изменение p95 и пропускной способности')
+
+    def handle(self, *args, **options):
+        options['mix'] = parse_mix(options['mix'])
+        # targets come from the catalog seed_catalog created; the server has to use the same database
+        emails = list(
+            User.objects.filter(email__startswith=f"{options['prefix']}-", is_active=True)
+            .order_by('pk').values_list('email', flat=True)[:options['clients']]
+        )
+        hotel_ids = list(Hotel.objects.order_by('?').values_list('pk', flat=True)[:1000])
+        room_ids = list(Room.objects.order_by('?').values_list('pk', flat=True)[:1000])
+        if len(emails) < options['clients'] or not hotel_ids or not room_ids:
+            raise CommandError(f"Нужно не меньше {options['clients']} пользователей и каталог, запустите seed_catalog")
+
+        clients = [
+            Client(options['url'], email, options['password'], hotel_ids, room_ids, options['seed'] + i, options['timeout'], options['async_reads'])
+            for i, email in enumerate(emails)
+        ]
+        started_at = timezone.now()
+        samples, elapsed = self.run(clients, options)
+        results = self.report(started_at, samples, elapsed, options)
+
+        output = options['output'] or f"loadtest-{started_at:%Y%m%d-%H%M%S}.json"
+        with open(output, 'w') as file:
+            json.dump(results, file, ensure_ascii=False, indent=2)
+        self.print_results(results)
+        if options['compare']:
+            self.print_comparison(options['compare'], results)
+        self.stdout.write(self.style.SUCCESS(f'Результаты записаны в {output}'))
+
+    def run(self, clients, options):
+        scenarios, weights = zip(*options['mix'].items())
+        samples = {scenario: [] for scenario in scenarios}
+        lock = threading.Lock()
+        budget = iter(range(options['requests'])) if options['requests'] else None
+        deadline = time.perf_counter() + options['duration']
+
+        def worker(client):
+            rng = random.Random(client.rng.random())
+            while time.perf_counter() < deadline:
+                if budget is not None:
+                    with lock:
+                        if next(budget, None) is None:
+                            return
+                scenario = rng.choices(scenarios, weights)[0]
+                sample = client.request(scenario)
+                with lock:
+                    samples[scenario].append(sample)
+
+        threads = [threading.Thread(target=worker, args=(client,), daemon=True) for client in clients]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return samples, time.perf_counter() - started
+
+    def report(self, started_at, samples, elapsed, options):
+        return {
+            'started_at': started_at.isoformat(timespec='seconds'),
+            'url': options['url'],
+            'clients': options['clients'],
+            'async_reads': options['async_reads'],
+            'duration_s': round(elapsed, 2),
+            'mix': options['mix'],
+            'total': summarize([sample for values in samples.values() for sample in values], elapsed),
+            'scenarios': {scenario: summarize(values, elapsed) for scenario, values in samples.items()},
+        }
+
+    def print_results(self, results):
+        rows = [('всего', results['total'])] + list(results['scenarios'].items())
+        self.stdout.write(f"{'сценарий':<16}{'запросов':>9}{'ошибок':>8}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}")
+        for name, row in rows:
+            self.stdout.write(
+                f"{name:<16}{row['requests']:>9}{row['errors']:>8}{row['throughput_rps']:>9}"
+                + ''.join(f"{row[key] if row[key] is not None else '-':>9}" for key in ('p50_ms', 'p95_ms', 'p99_ms'))
+            )
+
+    def print_comparison(self, path, results):
+        with open(path) as file:
+            previous = json.load(file)
+        self.stdout.write(f'по сравнению с {path} ({previous.get("started_at")}):')
+        rows = [('всего', previous['total'], results['total'])] + [
+            (name, previous['scenarios'][name], row) for name, row in results['scenarios'].items() if name in previous['scenarios']
+        ]
+        for name, before, after in rows:
+            changes = []
+            for key, label in (('p95_ms', 'p95'), ('throughput_rps', 'rps')):
+                if before.get(key) and after.get(key) is not None:
+                    changes.append(f'{label} {before[key]} -> {after[key]} ({(after[key] / before[key] - 1) * 100:+.1f}%)')
+            self.stdout.write(f"  {name}: {', '.join(changes) or 'нет данных'}")
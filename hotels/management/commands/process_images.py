@@ -0,0 +1,29 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from hotels.images import process_pending
+
+
+class Command(BaseCommand):
+    help = 'Готовит уменьшенные копии (WebP и JPEG) загруженных изображений отелей'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.IMAGE_BATCH_SIZE, help='отелей за один проход')
+        parser.add_argument('--loop', action='store_true', help='работать постоянно, ожидая новые загрузки')
+        parser.add_argument('--interval', type=float, default=settings.IMAGE_POLL_INTERVAL, help='пауза между опросами, сек.')
+
+    def handle(self, *args, **options):
+        while True:
+            total = 0
+            while True:
+                processed = process_pending(options['batch_size'])
+                total += processed
+                if processed < options['batch_size']:
+                    break
+            if total or not options['loop']:
+                self.stdout.write(f'Обработано изображений: {total}')
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
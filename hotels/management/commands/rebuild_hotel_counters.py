@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import F, Q
+from django.utils import timezone
+
+from hotels.models import Hotel, hotel_counters, refresh_leaderboard
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счетчики отелей (бронирования, лайки, избранное, оценки, отзывы) по дочерним таблицам и рейтинг топ-отелей'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='только проверить счетчики, ничего не изменяя')
+
+    def handle(self, *args, **options):
+        counters = hotel_counters()
+        mismatch = Q()
+        for field in counters:
+            mismatch |= ~Q(**{field: F(f'actual_{field}')})
+        stale = Hotel.objects.annotate(**{f'actual_{field}': value for field, value in counters.items()}).filter(mismatch)
+        stale_ids = list(stale.values_list('id', flat=True))
+
+        if options['check']:
+            if stale_ids:
+                raise CommandError(f'Неверные счетчики у {len(stale_ids)} отелей: {stale_ids[:20]}')
+            self.stdout.write(self.style.SUCCESS('Все счетчики верны'))
+            return
+
+        # only the hotels whose counters were off: their representation changes, so
+        # updated_at moves with them and cached ETags stop matching
+        Hotel.objects.filter(pk__in=stale_ids).update(updated_at=timezone.now(), **counters)
+        refresh_leaderboard()
+        self.stdout.write(self.style.SUCCESS(f'Счетчики пересчитаны, исправлено отелей: {len(stale_ids)}'))
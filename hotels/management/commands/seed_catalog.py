@@ -0,0 +1,170 @@
+import random
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from hotels.booking import stay_nights
+from hotels.models import Booking, Favorite, Hotel, HotelRating, Like, Review, Room, RoomNight, hotel_counters, rebuild_daily_stats, refresh_leaderboard
+
+User = get_user_model()
+
+WORDS = (
+    'уютный', 'тихий', 'центр', 'море', 'горы', 'вид', 'завтрак', 'бассейн', 'парк', 'спа',
+    'семейный', 'бизнес', 'рядом', 'аэропорт', 'озеро', 'ресторан', 'парковка', 'терраса',
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет базу синтетическим каталогом: пользователи, отели, комнаты, бронирования, '
+        'лайки, избранное, оценки и отзывы (для нагрузочного теста loadtest)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--owners', type=int, default=50, help='сколько из пользователей владеют отелями')
+        parser.add_argument('--hotels', type=int, default=500)
+        parser.add_argument('--rooms-per-hotel', type=int, default=20)
+        parser.add_argument('--bookings-per-room', type=int, default=5)
+        parser.add_argument('--likes', type=int, default=10_000)
+        parser.add_argument('--favorites', type=int, default=5000)
+        parser.add_argument('--ratings', type=int, default=10_000)
+        parser.add_argument('--reviews', type=int, default=5000)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--prefix', default='seed', help='почты пользователей: <prefix>-<n>@example.com')
+        parser.add_argument('--password', default='loadtest123', help='пароль всех созданных пользователей')
+        parser.add_argument('--flush', action='store_true', help='сначала удалить каталог, созданный с тем же --prefix')
+
+    def handle(self, *args, **options):
+        if options['owners'] < 1 or options['owners'] > options['users']:
+            raise CommandError('--owners должно быть от 1 до --users')
+        existing = User.objects.filter(email__startswith=f"{options['prefix']}-", email__endswith='@example.com')
+        if options['flush']:
+            # cascades to their hotels, bookings, likes and so on
+            existing.delete()
+        elif existing.exists():
+            raise CommandError(f"Каталог с префиксом {options['prefix']} уже есть, используйте --flush или другой --prefix")
+
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        started = time.perf_counter()
+        with transaction.atomic():
+            users = self.create_users(options)
+            hotels = self.create_hotels(users[:options['owners']], options)
+            rooms = self.create_rooms(hotels, options)
+            bookings = self.create_bookings(users, rooms, options)
+            counts = {
+                'лайков': self.create_pairs(Like, users, hotels, options['likes']),
+                'избранных': self.create_pairs(Favorite, users, hotels, options['favorites']),
+                'оценок': self.create_pairs(HotelRating, users, hotels, options['ratings'], rate=lambda: self.rng.choices(range(1, 6), (1, 1, 3, 6, 5))[0]),
+                'отзывов': self.create_reviews(users, hotels, options['reviews']),
+            }
+            hotel_ids = [hotel.pk for hotel in hotels]
+            Hotel.objects.filter(pk__in=hotel_ids).update(**hotel_counters())
+            refresh_leaderboard(hotel_ids)
+            rebuild_daily_stats(hotel_ids)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(users)} пользователей, {len(hotels)} отелей, {len(rooms)} комнат, {bookings} бронирований, '
+            + ', '.join(f'{count} {name}' for name, count in counts.items())
+            + f' за {time.perf_counter() - started:.1f} с'
+        ))
+
+    def text(self, words):
+        return ' '.join(self.rng.choice(WORDS) for _ in range(words))
+
+    def create_users(self, options):
+        # one hash for everybody: hashing every password would take most of the run
+        password = make_password(options['password'])
+        return User.objects.bulk_create(
+            [
+                User(
+                    email=f"{options['prefix']}-{i}@example.com", password=password,
+                    is_active=True, is_owner=i < options['owners'],
+                )
+                for i in range(options['users'])
+            ],
+            batch_size=self.batch_size,
+        )
+
+    def create_hotels(self, owners, options):
+        return Hotel.objects.bulk_create(
+            [
+                Hotel(
+                    name=f'{self.text(2).capitalize()} {i}', address=f'ул. {self.text(1).capitalize()}, {i}',
+                    description=self.text(20), stars=str(self.rng.randint(1, 5)), owner=owners[i % len(owners)],
+                )
+                for i in range(options['hotels'])
+            ],
+            batch_size=self.batch_size,
+        )
+
+    def create_rooms(self, hotels, options):
+        return Room.objects.bulk_create(
+            [
+                Room(
+                    hotel=hotel, room_number=str(number + 1), room_type=self.rng.choice((Room.STANDARD, Room.DELUXE)),
+                    capacity=self.rng.randint(1, 3), price_per_night=Decimal(self.rng.randint(20, 300)),
+                )
+                for hotel in hotels for number in range(options['rooms_per_hotel'])
+            ],
+            batch_size=self.batch_size,
+        )
+
+    def create_bookings(self, users, rooms, options):
+        # non-overlapping stays per room, spread over the coming months
+        created = 0
+        bookings = []
+        for room in rooms:
+            check_in = date.today()
+            for _ in range(options['bookings_per_room']):
+                check_in += timedelta(days=self.rng.randint(0, 30))
+                nights = self.rng.randint(1, 7)
+                bookings.append(Booking(
+                    user=self.rng.choice(users), room=room, check_in=check_in, check_out=check_in + timedelta(days=nights),
+                    guests=self.rng.randint(1, room.capacity), total_cost=room.price_per_night * nights,
+                ))
+                check_in += timedelta(days=nights)
+            if len(bookings) >= self.batch_size:
+                created += self.save_bookings(bookings)
+                bookings = []
+        return created + self.save_bookings(bookings)
+
+    def save_bookings(self, bookings):
+        Booking.objects.bulk_create(bookings)
+        RoomNight.objects.bulk_create(
+            [
+                RoomNight(room=booking.room, booking=booking, night=night)
+                for booking in bookings for night in stay_nights(booking.check_in, booking.check_out)
+            ],
+            batch_size=self.batch_size,
+        )
+        return len(bookings)
+
+    def create_pairs(self, model, users, hotels, count, **fields):
+        # (user, hotel) pairs are unique for likes, favorites and ratings
+        count = min(count, len(users) * len(hotels))
+        objects = []
+        for index in self.rng.sample(range(len(users) * len(hotels)), count):
+            user, hotel = divmod(index, len(hotels))
+            objects.append(model(
+                user=users[user], hotel=hotels[hotel], **{name: value() for name, value in fields.items()},
+            ))
+        model.objects.bulk_create(objects, batch_size=self.batch_size)
+        return count
+
+    def create_reviews(self, users, hotels, count):
+        reviews = []
+        for _ in range(count):
+            user = self.rng.choice(users)
+            reviews.append(Review(hotel=self.rng.choice(hotels), user=user, author=user.email, text=self.text(15)))
+        Review.objects.bulk_create(reviews, batch_size=self.batch_size)
+        return count
@@ -0,0 +1,88 @@
+import multiprocessing
+import random
+import time
+from datetime import date, timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+
+from hotels.booking import RoomUnavailable, book_room
+from hotels.models import Booking, Hotel, Room
+
+User = get_user_model()
+
+
+def _worker(args):
+    user_id, room_ids, attempts, seed = args
+    # every process needs its own database connection
+    connections.close_all()
+    rng = random.Random(seed)
+    user = User.objects.get(pk=user_id)
+    rooms = list(Room.objects.filter(pk__in=room_ids))
+    booked = conflicts = 0
+    for _ in range(attempts):
+        room = rng.choice(rooms)
+        check_in = date.today() + timedelta(days=rng.randint(0, 60))
+        try:
+            book_room(user, room, check_in, check_in + timedelta(days=rng.randint(1, 4)), 1)
+            booked += 1
+        except RoomUnavailable:
+            conflicts += 1
+    connections.close_all()
+    return booked, conflicts
+
+
+class Command(BaseCommand):
+    help = 'Бронирует одни и те же комнаты из нескольких процессов и проверяет, что пересечений нет'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=8)
+        parser.add_argument('--attempts', type=int, default=200, help='попыток бронирования на процесс')
+        parser.add_argument('--rooms', type=int, default=10)
+
+    def handle(self, *args, **options):
+        user = User.objects.create_user(email='stress-bookings@example.com', password=None, is_owner=True)
+        try:
+            hotel = Hotel.objects.create(name='Stress test', address='-', description='-', stars='3', owner=user)
+            rooms = Room.objects.bulk_create(
+                Room(hotel=hotel, room_number=str(i), room_type=Room.STANDARD, capacity=1, price_per_night=100)
+                for i in range(options['rooms'])
+            )
+            room_ids = [room.pk for room in rooms]
+            jobs = [(user.pk, room_ids, options['attempts'], seed) for seed in range(options['processes'])]
+
+            connections.close_all()
+            started = time.perf_counter()
+            with multiprocessing.get_context('fork').Pool(options['processes']) as pool:
+                results = pool.map(_worker, jobs)
+            elapsed = time.perf_counter() - started
+
+            booked = sum(result[0] for result in results)
+            conflicts = sum(result[1] for result in results)
+            overlaps = self.count_overlaps(room_ids)
+            hotel.refresh_from_db()
+            actual = Booking.objects.filter(room__hotel=hotel).count()
+
+            self.stdout.write(
+                f'{booked} бронирований, {conflicts} отказов за {elapsed:.2f} с: '
+                f'{booked / elapsed:.0f} бронирований/с, {(booked + conflicts) / elapsed:.0f} попыток/с'
+            )
+            if overlaps or actual != booked or hotel.bookings_count != booked:
+                raise CommandError(f'пересечений: {overlaps}, бронирований в базе: {actual}, счетчик отеля: {hotel.bookings_count}')
+            self.stdout.write(self.style.SUCCESS('Пересечений нет, счетчик бронирований верен'))
+        finally:
+            user.delete()
+
+    def count_overlaps(self, room_ids):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                '''
+                SELECT count(*) FROM hotels_booking a
+                JOIN hotels_booking b ON a.room_id = b.room_id AND a.id < b.id
+                    AND a.check_in < b.check_out AND b.check_in < a.check_out
+                WHERE a.room_id = ANY(%s)
+                ''',
+                [room_ids],
+            )
+            return cursor.fetchone()[0]
@@ -0,0 +1,58 @@
+# Generated by Django 4.2 on 2026-10-18 19:12
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    Hotel = apps.get_model('hotels', 'Hotel')
+    counters = {
+        'likes_count': ('Like', Count('pk')),
+        'favorites_count': ('Favorite', Count('pk')),
+        'rating_sum': ('HotelRating', Sum('rate')),
+        'rating_count': ('HotelRating', Count('pk')),
+        'reviews_count': ('Review', Count('pk')),
+    }
+    values = {}
+    for field, (model_name, aggregate) in counters.items():
+        model = apps.get_model('hotels', model_name)
+        subquery = model.objects.filter(hotel=OuterRef('pk')).order_by().values('hotel').annotate(value=aggregate).values('value')
+        values[field] = Coalesce(Subquery(subquery), 0)
+    Hotel.objects.update(**values)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hotels', '0012_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hotel',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='количество добавлений в избранное'),
+        ),
+        migrations.AddField(
+            model_name='hotel',
+            name='likes_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='количество лайков'),
+        ),
+        migrations.AddField(
+            model_name='hotel',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='количество оценок'),
+        ),
+        migrations.AddField(
+            model_name='hotel',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, verbose_name='сумма оценок'),
+        ),
+        migrations.AddField(
+            model_name='hotel',
+            name='reviews_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='количество отзывов'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 4.2 on 2026-10-18 19:16
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+CREATE_TRIGGER = """
+CREATE FUNCTION hotels_hotel_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('simple', coalesce(NEW.name, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(NEW.description, '')), 'B');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER hotels_hotel_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF name, description ON hotels_hotel
+    FOR EACH ROW EXECUTE FUNCTION hotels_hotel_search_vector_update();
+
+UPDATE hotels_hotel SET name = name;
+"""
+
+DROP_TRIGGER = """
+DROP TRIGGER IF EXISTS hotels_hotel_search_vector_trigger ON hotels_hotel;
+DROP FUNCTION IF EXISTS hotels_hotel_search_vector_update();
+"""
+
+
+def create_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(CREATE_TRIGGER)
+
+
+def drop_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_TRIGGER)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hotels', '0013_hotel_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hotel',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='hotel',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='hotel_search_vector_idx'),
+        ),
+        migrations.RunPython(create_trigger, drop_trigger),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2 on 2026-10-18 19:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hotels', '0014_hotel_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['room', 'check_in', 'check_out'], name='booking_room_dates_idx'),
+        ),
+    ]
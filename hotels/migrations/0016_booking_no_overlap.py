@@ -0,0 +1,44 @@
+# Generated by Django 4.2 on 2026-10-18 19:20
+
+import django.contrib.postgres.constraints
+import django.contrib.postgres.fields.ranges
+from django.db import migrations
+from django.db.models import Exists, OuterRef
+import hotels.models
+
+REPORT_LIMIT = 50
+
+
+def check_no_overlaps(apps, schema_editor):
+    # Stops before the constraint with the list of bookings that already overlap,
+    # instead of an IntegrityError halfway through. Which of two double bookings stays
+    # is for a person to decide: move or cancel the reported ones, then migrate again.
+    Booking = apps.get_model('hotels', 'Booking')
+    overlapping = Booking.objects.filter(Exists(
+        Booking.objects.filter(room_id=OuterRef('room_id'), check_in__lt=OuterRef('check_out'), check_out__gt=OuterRef('check_in'))
+        .exclude(pk=OuterRef('pk'))
+    )).order_by('room_id', 'check_in', 'id')
+    rows = list(overlapping.values_list('id', 'room_id', 'check_in', 'check_out')[:REPORT_LIMIT + 1])
+    if not rows:
+        return
+    report = '\n'.join(f'  бронирование {pk}: комната {room_id}, {check_in} - {check_out}' for pk, room_id, check_in, check_out in rows[:REPORT_LIMIT])
+    more = f'\n  ... и ещё {overlapping.count() - REPORT_LIMIT}' if len(rows) > REPORT_LIMIT else ''
+    raise RuntimeError(
+        'Нельзя добавить booking_no_overlap: эти бронирования пересекаются с другими '
+        f'бронированиями той же комнаты. Перенесите или отмените их и запустите migrate снова.\n{report}{more}'
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hotels', '0015_booking_room_dates_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_no_overlaps, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='booking',
+            constraint=django.contrib.postgres.constraints.ExclusionConstraint(expressions=[(hotels.models.Int8Range('room', 'room', django.contrib.postgres.fields.ranges.RangeBoundary(inclusive_upper=True)), '&&'), (hotels.models.DateRange('check_in', 'check_out', django.contrib.postgres.fields.ranges.RangeBoundary()), '&&')], name='booking_no_overlap'),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 4.2 on 2026-10-18 19:21
+
+from datetime import timedelta
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_ledger(apps, schema_editor):
+    Booking = apps.get_model('hotels', 'Booking')
+    RoomNight = apps.get_model('hotels', 'RoomNight')
+    nights = []
+    for booking_id, room_id, check_in, check_out in Booking.objects.values_list('id', 'room_id', 'check_in', 'check_out').iterator():
+        for i in range((check_out - check_in).days):
+            nights.append(RoomNight(booking_id=booking_id, room_id=room_id, night=check_in + timedelta(days=i)))
+        if len(nights) >= 5000:
+            RoomNight.objects.bulk_create(nights, ignore_conflicts=True)
+            nights = []
+    RoomNight.objects.bulk_create(nights, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hotels', '0016_booking_no_overlap'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoomNight',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('night', models.DateField()),
+            ],
+            options={
+                'verbose_name': 'Ночь бронирования',
+                'verbose_name_plural': 'Ночи бронирования',
+            },
+        ),
+        migrations.RemoveIndex(
+            model_name='booking',
+            name='booking_room_dates_idx',
+        ),
+        migrations.AddField(
+            model_name='roomnight',
+            name='booking',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='nights', to='hotels.booking'),
+        ),
+        migrations.AddField(
+            model_name='roomnight',
+            name='room',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='nights', to='hotels.room'),
+        ),
+        migrations.AddConstraint(
+            model_name='roomnight',
+            constraint=models.UniqueConstraint(fields=('room', 'night'), name='room_night_unique'),
+        ),
+        migrations.RunPython(fill_ledger, migrations.RunPython.noop),
+    ]
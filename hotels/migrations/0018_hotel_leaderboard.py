@@ -0,0 +1,51 @@
+# Generated by Django 4.2 on 2026-10-18 19:27
+
+from django.db import migrations, models
+from django.db.models import ExpressionWrapper, FloatField, Value
+from django.db.models.functions import Cast, Coalesce, NullIf
+import django.db.models.deletion
+
+
+def fill_leaderboard(apps, schema_editor):
+    # a frozen copy of hotels.models.leaderboard_score() with the TOP_HOTELS_SCORE of
+    # the time (bookings, the rating breaks ties); `manage.py rebuild_hotel_counters`
+    # re-scores every hotel with the configured weights
+    Hotel = apps.get_model('hotels', 'Hotel')
+    HotelLeaderboard = apps.get_model('hotels', 'HotelLeaderboard')
+    rating = Coalesce(Cast('rating_sum', FloatField()) / NullIf('rating_count', 0), Value(0.0))
+    score = ExpressionWrapper(Cast('bookings_count', FloatField()) * Value(1.0) + rating * Value(0.01), output_field=FloatField())
+    rows = Hotel.objects.annotate(score=score).values_list('pk', 'stars', 'score').iterator()
+    HotelLeaderboard.objects.bulk_create(
+        (HotelLeaderboard(hotel_id=pk, stars=stars, score=score) for pk, stars, score in rows), batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hotels', '0017_room_night_ledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HotelLeaderboard',
+            fields=[
+                ('hotel', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='leaderboard', serialize=False, to='hotels.hotel')),
+                ('stars', models.CharField(max_length=1)),
+                ('score', models.FloatField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Место в рейтинге отелей',
+                'verbose_name_plural': 'Рейтинг отелей',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='hotelleaderboard',
+            index=models.Index(models.OrderBy(models.F('score'), descending=True), models.F('hotel'), name='leaderboard_score_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='hotelleaderboard',
+            index=models.Index(models.F('stars'), models.OrderBy(models.F('score'), descending=True), models.F('hotel'), name='leaderboard_stars_score_idx'),
+        ),
+        migrations.RunPython(fill_leaderboard, migrations.RunPython.noop),
+    ]
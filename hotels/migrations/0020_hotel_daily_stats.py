@@ -0,0 +1,61 @@
+# Generated by Django 4.2 on 2026-10-18 19:55
+
+from django.db import migrations, models
+from django.utils import timezone
+import django.db.models.deletion
+
+
+def fill_daily_stats(apps, schema_editor):
+    # a frozen copy of hotels.models.rebuild_daily_stats() for all hotels: nights sold
+    # and revenue per night from the room night ledger, bookings per day of creation
+    table = apps.get_model('hotels', 'HotelDailyStats')._meta.db_table
+    schema_editor.execute(
+        f'''
+        INSERT INTO {table} (hotel_id, date, nights_sold, revenue, bookings)
+        SELECT hotel_id, date, sum(nights_sold), sum(revenue), sum(bookings) FROM (
+            SELECT r.hotel_id, n.night AS date, count(*) AS nights_sold,
+                   sum(round(b.total_cost / (b.check_out - b.check_in), 2)) AS revenue, 0 AS bookings
+            FROM hotels_roomnight n
+            JOIN hotels_booking b ON b.id = n.booking_id
+            JOIN hotels_room r ON r.id = n.room_id
+            GROUP BY r.hotel_id, n.night
+            UNION ALL
+            SELECT r.hotel_id, (b.created_at AT TIME ZONE %s)::date, 0, 0, count(*)
+            FROM hotels_booking b
+            JOIN hotels_room r ON r.id = b.room_id
+            GROUP BY 1, 2
+        ) days
+        GROUP BY hotel_id, date
+        ''',
+        [timezone.get_current_timezone_name()],
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hotels', '0019_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HotelDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('nights_sold', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('bookings', models.IntegerField(default=0)),
+                ('hotel', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='hotels.hotel')),
+            ],
+            options={
+                'verbose_name': 'Статистика отеля за день',
+                'verbose_name_plural': 'Статистика отелей по дням',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='hoteldailystats',
+            constraint=models.UniqueConstraint(fields=('hotel', 'date'), name='daily_stats_unique'),
+        ),
+        migrations.RunPython(fill_daily_stats, migrations.RunPython.noop),
+    ]
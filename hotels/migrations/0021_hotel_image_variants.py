@@ -0,0 +1,33 @@
+# Generated by Django 4.2 on 2026-10-18 20:01
+
+from django.db import migrations, models
+
+
+def queue_existing_images(apps, schema_editor):
+    Hotel = apps.get_model('hotels', 'Hotel')
+    Hotel.objects.exclude(image__isnull=True).exclude(image='').update(image_pending=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hotels', '0020_hotel_daily_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hotel',
+            name='image_pending',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddField(
+            model_name='hotel',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='hotel',
+            index=models.Index(condition=models.Q(('image_pending', True)), fields=['id'], name='hotel_image_pending_idx'),
+        ),
+        migrations.RunPython(queue_existing_images, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,209 @@
+import hashlib
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import F, Prefetch, prefetch_related_objects
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+
+
+def parse_flex_params(request):
+    fields = request.query_params.get('fields')
+    expand = request.query_params.get('expand')
+    fields = [name.strip() for name in fields.split(',') if name.strip()] if fields else None
+    expand = [name.strip() for name in expand.split(',') if name.strip()] if expand else []
+    return fields, expand
+
+
+def split_expand(expand):
+    # ['room.hotel', 'user'] -> {'room': ['hotel'], 'user': []}
+    nested = {}
+    for path in expand:
+        name, _, rest = path.partition('.')
+        nested.setdefault(name, [])
+        if rest:
+            nested[name].append(rest)
+    return nested
+
+
+# ?fields=id,name keeps only the listed fields, ?expand=room,room.hotel replaces foreign
+# key ids with the serializers declared in expandable_fields. prefetch_fields and
+# field_sources tell shape_queryset() what the other fields read.
+class FlexFieldsSerializerMixin:
+    expandable_fields = {}
+    prefetch_fields = {}
+    field_sources = {}
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        expand = kwargs.pop('expand', None)
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if fields is None and expand is None and request is not None:
+            fields, expand = parse_flex_params(request)
+
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+        for name, nested_expand in split_expand(expand or []).items():
+            if name in self.expandable_fields and name in self.fields:
+                source = self.fields[name].source
+                kwargs = {'source': source} if source != name else {}
+                self.fields[name] = self.expandable_fields[name](read_only=True, fields=None, expand=nested_expand, **kwargs)
+
+    def to_representation(self, instance):
+        # an object that didn't come through shape_queryset() (the response of a
+        # create/update) gets its prefetch_fields loaded here, not one row at a time
+        prefetched = getattr(instance, '_prefetched_objects_cache', {})
+        missing = [
+            lookup
+            for name, lookups in self.prefetch_fields.items() if name in self.fields
+            for lookup in lookups
+            if (lookup.prefetch_through if isinstance(lookup, Prefetch) else lookup).split('__')[0] not in prefetched
+        ]
+        if missing:
+            prefetch_related_objects([instance], *missing)
+        return super().to_representation(instance)
+
+
+def shape_queryset(queryset, serializer_class, fields=None, expand=(), keep=()):
+    # only()/select_related()/prefetch_related() matching what serializer_class
+    # will read for the requested ?fields= and ?expand=
+    only, select, prefetch = _shape(queryset.model, serializer_class, fields, expand, '')
+    if select:
+        queryset = queryset.select_related(*select)
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch)
+    if only is not None:
+        queryset = queryset.only(*only, *keep)
+    return queryset
+
+
+def _shape(model, serializer_class, fields, expand, prefix):
+    serializer_fields = serializer_class(fields=fields, expand=[]).fields
+    expand = split_expand(expand)
+    only, select, prefetch = [prefix + model._meta.pk.name], [], []
+    restrict = True
+    for name, field in serializer_fields.items():
+        if name in serializer_class.prefetch_fields:
+            for lookup in serializer_class.prefetch_fields[name]:
+                if isinstance(lookup, Prefetch):
+                    prefetch.append(Prefetch(prefix + lookup.prefetch_through, queryset=lookup.queryset))
+                else:
+                    prefetch.append(prefix + lookup)
+            continue
+        if name in serializer_class.field_sources:
+            only += [prefix + attname for attname in serializer_class.field_sources[name]]
+            continue
+        attname, _, related = field.source.partition('.')
+        try:
+            model_field = model._meta.get_field(attname)
+        except FieldDoesNotExist:
+            # computed in python (or source='*'): can't tell which columns it needs
+            restrict = False
+            continue
+
+        if name in expand and name in serializer_class.expandable_fields:
+            select.append(prefix + attname)
+            nested_only, nested_select, nested_prefetch = _shape(
+                model_field.related_model, serializer_class.expandable_fields[name],
+                None, expand[name], f'{prefix}{attname}__',
+            )
+            select += nested_select
+            prefetch += nested_prefetch
+            if nested_only is None:
+                restrict = False
+            else:
+                only += nested_only
+        elif related and model_field.is_relation:
+            select.append(prefix + attname)
+            only.append(f"{prefix}{attname}__{related.replace('.', '__')}")
+        else:
+            only.append(prefix + attname)
+    return (only if restrict else None), select, prefetch
+
+
+class FlexFieldsViewMixin:
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        serializer_class = self.get_serializer_class()
+        if self.request.method != 'GET' or not issubclass(serializer_class, FlexFieldsSerializerMixin):
+            return queryset
+        fields, expand = parse_flex_params(self.request)
+        # the paginator reads its ordering fields from the page rows
+        keep = [field.lstrip('-') for field in getattr(self.pagination_class, 'ordering', ())]
+        return shape_queryset(queryset, serializer_class, fields, expand, keep)
+
+
+# ETag / Last-Modified for list and retrieve. A detail's version is read with one
+# indexed pk lookup of its version_fields; a list's ETag is hashed from the rows of the
+# page itself (pk and version_fields, read in the page query), so a list revalidation
+# costs the page query and nothing else - no COUNT or MAX over the whole filter. A
+# matching If-None-Match or a fresh If-Modified-Since answers 304 without running the
+# serializer. Lists send no Last-Modified: a deleted row wouldn't make it newer.
+class ConditionalGetMixin:
+    version_fields = ('updated_at',)
+
+    def list(self, request, *args, **kwargs):
+        queryset, prefetch = deferred_prefetch(self.filter_queryset(self.get_queryset()).annotate(**version_annotations(self.version_fields)))
+        page = self.paginate_queryset(queryset)
+        rows = list(queryset) if page is None else page
+        etag = page_etag(request, rows, self.version_fields, self.paginator if page is not None else None)
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            prefetch_related_objects(rows, *prefetch)
+            serializer = self.get_serializer(rows, many=True)
+            response = self.get_paginated_response(serializer.data) if page is not None else Response(serializer.data)
+            set_version_headers(response, etag, None)
+        return response
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        versions = self.get_queryset().filter(**{self.lookup_field: kwargs[lookup_url_kwarg]}).values_list(*self.version_fields).first()
+        if versions is None:
+            return super().retrieve(request, *args, **kwargs)
+        return self._conditional(versions, super().retrieve, request, *args, **kwargs)
+
+    def _conditional(self, versions, render, request, *args, **kwargs):
+        etag, last_modified = representation_version(request, versions)
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = render(request, *args, **kwargs)
+            if response.status_code == 200:
+                set_version_headers(response, etag, last_modified)
+        return response
+
+
+def version_annotations(version_fields):
+    return {f'version_{i}': F(field) for i, field in enumerate(version_fields)}
+
+
+def deferred_prefetch(queryset):
+    # the queryset without its prefetch_related() lookups, and the lookups: a 304
+    # needs only the page rows, the prefetches run once the page is to be serialized
+    return queryset.prefetch_related(None), queryset._prefetch_related_lookups
+
+
+def page_etag(request, rows, version_fields, paginator=None):
+    # ETag of a list response from its rows, annotated with version_annotations(); the
+    # paginator adds whether there are next/previous links (the next link comes from
+    # the extra row past the page)
+    versions = [(row.pk, *(getattr(row, f'version_{i}') for i in range(len(version_fields)))) for row in rows]
+    if paginator is not None:
+        versions.append((paginator.next_values is not None, paginator.previous_values is not None))
+    return representation_version(request, versions)[0]
+
+
+def representation_version(request, versions):
+    # (ETag, Last-Modified timestamp or None) of the response to request
+    versions = list(versions)
+    # the query string picks ?fields=, ?expand= and the page, so it is part of the version
+    etag = quote_etag(hashlib.md5(repr([request.get_full_path(), *versions]).encode()).hexdigest())
+    timestamps = [value for value in versions if hasattr(value, 'timestamp')]
+    return etag, int(max(timestamps).timestamp()) if timestamps else None
+
+
+def set_version_headers(response, etag, last_modified):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
@@ -1,9 +1,52 @@
-from django.db import models
+from django.conf import settings
+from datetime import timedelta
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import connection, models
+from django.db.models.signals import post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+from django.contrib.postgres.constraints import ExclusionConstraint
+from django.contrib.postgres.fields import BigIntegerRangeField, DateRangeField, RangeBoundary, RangeOperators
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.db.models import Count, Exists, ExpressionWrapper, F, FloatField, Func, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce, NullIf
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
 
 
+class HotelQuerySet(models.QuerySet):
+    def bump(self, pk, **deltas):
+        # also moves updated_at: likes, ratings and reviews are part of the hotel's representation
+        updated = self.filter(pk=pk).update(updated_at=timezone.now(), **{field: F(field) + delta for field, delta in deltas.items()})
+        # re-score the hotel's leaderboard row in the same transaction, only if the
+        # score actually depends on one of the bumped counters
+        if set(deltas) & leaderboard_fields():
+            score = Hotel.objects.filter(pk=OuterRef('hotel_id')).annotate(score=leaderboard_score()).values('score')
+            HotelLeaderboard.objects.filter(hotel_id=pk).update(score=Subquery(score))
+        return updated
+
+
+class DateRange(Func):
+    function = 'daterange'
+    output_field = DateRangeField()
+
+
+class Int8Range(Func):
+    function = 'int8range'
+    output_field = BigIntegerRangeField()
+
+
+class RoomQuerySet(models.QuerySet):
+    def available(self, check_in, check_out):
+        # one anti-join over the (room, night) ledger index for every room at once;
+        # stays are half-open, the check-out day is free for the next guest
+        nights = RoomNight.objects.filter(room=OuterRef('pk'), night__gte=check_in, night__lt=check_out)
+        return self.filter(~Exists(nights))
+
+
 class Hotel(models.Model):
     name = models.CharField(max_length=100)
     address = models.CharField(max_length=200)
@@ -12,11 +55,37 @@ class Hotel(models.Model):
     description = models.TextField()
     stars = models.CharField(choices=(('1', '1 звезда'), ('2', '2 звезды'), ('3', '3 звезды'), ('4', '4 звезды'), ('5', '5 звезд')))
     bookings_count = models.PositiveIntegerField(default=0, verbose_name='количество бронирований')
+    likes_count = models.PositiveIntegerField(default=0, verbose_name='количество лайков')
+    favorites_count = models.PositiveIntegerField(default=0, verbose_name='количество добавлений в избранное')
+    rating_sum = models.PositiveIntegerField(default=0, verbose_name='сумма оценок')
+    rating_count = models.PositiveIntegerField(default=0, verbose_name='количество оценок')
+    reviews_count = models.PositiveIntegerField(default=0, verbose_name='количество отзывов')
+    # filled by a database trigger from name and description, see hotels.search
+    search_vector = SearchVectorField(null=True, editable=False)
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='дата изменения')
+    # resized copies of image, {variant: {extension: storage path}}, rendered by
+    # `manage.py process_images` (hotels.images) while image_pending is set
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
+    image_pending = models.BooleanField(default=False, editable=False)
+
+    objects = HotelQuerySet.as_manager()
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['stars', 'id'], name='hotel_stars_id_idx'),
+            GinIndex(fields=['search_vector'], name='hotel_search_vector_idx'),
+            models.Index(fields=['id'], condition=models.Q(image_pending=True), name='hotel_image_pending_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
+    @property
+    def rating(self):
+        if not self.rating_count:
+            return None
+        return self.rating_sum / self.rating_count
+
 
 
 class Room(models.Model):
@@ -48,7 +117,12 @@ class Room(models.Model):
     capacity = models.PositiveSmallIntegerField(choices=ROOM_CAPACITY_CHOICES)
     price_per_night = models.DecimalField(max_digits=8, decimal_places=2)
     status = models.CharField(max_length=6, choices=STATUS_CHOICES, default='Loose')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='дата изменения')
+
+    objects = RoomQuerySet.as_manager()
 
+    class Meta:
+        indexes = [models.Index(fields=['price_per_night', 'id'], name='room_price_id_idx')]
 
     def __str__(self):
         return f"{self.hotel.name} - Room {self.room_number}"
@@ -64,12 +138,110 @@ class Booking(models.Model):
     total_cost = models.DecimalField(max_digits=8, decimal_places=2)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [models.Index(fields=['user', 'created_at', 'id'], name='booking_user_created_id_idx')]
+        constraints = [
+            # no two stays of the same room may share a night, whatever the code path;
+            # the room is compared as a one-point range so plain GiST works without btree_gist
+            ExclusionConstraint(
+                name='booking_no_overlap',
+                expressions=[
+                    (Int8Range('room', 'room', RangeBoundary(inclusive_upper=True)), RangeOperators.OVERLAPS),
+                    (DateRange('check_in', 'check_out', RangeBoundary()), RangeOperators.OVERLAPS),
+                ],
+            ),
+        ]
 
     def __str__(self):
         return f"{self.user.email} - {self.room.hotel.name} - Room {self.room.room_number}"
 
 
 
+class RoomNight(models.Model):
+    # one row per booked night of a room, written and deleted together with the booking
+    # room_night_unique already indexes room first
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='nights', db_index=False)
+    night = models.DateField()
+    booking = models.ForeignKey(Booking, on_delete=models.CASCADE, related_name='nights')
+
+    class Meta:
+        verbose_name = 'Ночь бронирования'
+        verbose_name_plural = 'Ночи бронирования'
+        constraints = [models.UniqueConstraint(fields=['room', 'night'], name='room_night_unique')]
+
+    def __str__(self):
+        return f'{self.room} - {self.night}'
+
+
+class HotelDailyStatsQuerySet(models.QuerySet):
+    def record(self, hotel_id, booking, sign=1):
+        # adds (sign=1) or takes back (sign=-1) a booking: a sold night and its share of
+        # total_cost on every night of the stay, a new booking on the day it was made.
+        # One upsert for all the days, in date order so concurrent bookings lock the
+        # rows in the same order.
+        nights = (booking.check_out - booking.check_in).days
+        # rounded like PostgreSQL's round() in rebuild_daily_stats()
+        per_night = (Decimal(booking.total_cost) / nights).quantize(Decimal('0.01'), ROUND_HALF_UP)
+        days = {}
+        for i in range(nights):
+            days[booking.check_in + timedelta(days=i)] = [sign, sign * per_night, 0]
+        days.setdefault(timezone.localdate(booking.created_at), [0, 0, 0])[2] = sign
+        table = self.model._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'''
+                INSERT INTO {table} (hotel_id, date, nights_sold, revenue, bookings)
+                VALUES {', '.join(['(%s, %s, %s, %s, %s)'] * len(days))}
+                ON CONFLICT (hotel_id, date) DO UPDATE SET
+                    nights_sold = {table}.nights_sold + EXCLUDED.nights_sold,
+                    revenue = {table}.revenue + EXCLUDED.revenue,
+                    bookings = {table}.bookings + EXCLUDED.bookings
+                ''',
+                [value for day in sorted(days) for value in (hotel_id, day, *days[day])],
+            )
+
+
+class HotelDailyStats(models.Model):
+    # per hotel and day: nights sold and their revenue (a stay's total_cost spread over
+    # its nights) and bookings made that day. Kept up to date by book_room() and
+    # cancel_booking(), rebuilt from the bookings by rebuild_daily_stats().
+    # daily_stats_unique already indexes hotel first
+    hotel = models.ForeignKey(Hotel, on_delete=models.CASCADE, related_name='daily_stats', db_index=False)
+    date = models.DateField()
+    nights_sold = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    bookings = models.IntegerField(default=0)
+
+    objects = HotelDailyStatsQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Статистика отеля за день'
+        verbose_name_plural = 'Статистика отелей по дням'
+        constraints = [models.UniqueConstraint(fields=['hotel', 'date'], name='daily_stats_unique')]
+
+    def __str__(self):
+        return f'{self.hotel_id} - {self.date}'
+
+
+class HotelLeaderboard(models.Model):
+    # one row per hotel with its current TOP_HOTELS_SCORE, kept up to date by
+    # Hotel.objects.bump() and the Hotel post_save receiver below
+    hotel = models.OneToOneField(Hotel, on_delete=models.CASCADE, primary_key=True, related_name='leaderboard')
+    stars = models.CharField(max_length=1)
+    score = models.FloatField(default=0)
+
+    class Meta:
+        verbose_name = 'Место в рейтинге отелей'
+        verbose_name_plural = 'Рейтинг отелей'
+        indexes = [
+            models.Index(F('score').desc(), 'hotel', name='leaderboard_score_idx'),
+            models.Index('stars', F('score').desc(), 'hotel', name='leaderboard_stars_score_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.hotel_id}: {self.score}'
+
+
 class HotelRating(models.Model):
     RATES = (
         (1, '1'),
@@ -115,6 +287,7 @@ class Favorite(models.Model):
         verbose_name = 'Избранное'
         verbose_name_plural = 'Избранные'
         unique_together = ('user', 'hotel')
+        indexes = [models.Index(fields=['user', 'id'], name='favorite_user_id_idx')]
 
     def __str__(self):
         return f'{self.hotel.name} Added to favorites by {self.user.email}'
@@ -131,8 +304,103 @@ class Review(models.Model):
     class Meta:
         verbose_name = 'Отзыв'
         verbose_name_plural = 'Отзывы'
+        indexes = [models.Index(fields=['created_at', 'id'], name='review_created_id_idx')]
     
     def __str__(self) -> str:
         return f'Отзыв от {self.user.email}'
-    
 
+
+
+def hotel_counters():
+    # the value every Hotel counter column should hold, as correlated subqueries
+    # over the child tables; used to rebuild and verify the counters
+    counters = {
+        'bookings_count': (Booking, 'room__hotel', Count('pk')),
+        'likes_count': (Like, 'hotel', Count('pk')),
+        'favorites_count': (Favorite, 'hotel', Count('pk')),
+        'rating_sum': (HotelRating, 'hotel', Sum('rate')),
+        'rating_count': (HotelRating, 'hotel', Count('pk')),
+        'reviews_count': (Review, 'hotel', Count('pk')),
+    }
+    return {
+        field: Coalesce(Subquery(
+            model.objects.filter(**{lookup: OuterRef('pk')}).order_by().values(lookup).annotate(value=aggregate).values('value')
+        ), 0)
+        for field, (model, lookup, aggregate) in counters.items()
+    }
+
+
+def leaderboard_fields():
+    # Hotel columns the configured score is computed from
+    fields = set()
+    for name, weight in settings.TOP_HOTELS_SCORE.items():
+        if weight:
+            fields |= {'rating_sum', 'rating_count'} if name == 'rating' else {name}
+    return fields
+
+
+def leaderboard_score():
+    # sum of weight * value over TOP_HOTELS_SCORE, evaluated on Hotel rows;
+    # 'rating' is the average rate, 0 for hotels nobody has rated
+    terms = []
+    for name, weight in settings.TOP_HOTELS_SCORE.items():
+        if name == 'rating':
+            value = Coalesce(Cast('rating_sum', FloatField()) / NullIf('rating_count', 0), Value(0.0))
+        else:
+            value = Cast(name, FloatField())
+        terms.append(value * Value(float(weight)))
+    return ExpressionWrapper(sum(terms[1:], terms[0]) if terms else Value(0.0), output_field=FloatField())
+
+
+def refresh_leaderboard(hotels=None):
+    queryset = Hotel.objects.all() if hotels is None else Hotel.objects.filter(pk__in=hotels)
+    rows = [
+        HotelLeaderboard(hotel_id=pk, stars=stars, score=score)
+        for pk, stars, score in queryset.annotate(score=leaderboard_score()).values_list('pk', 'stars', 'score').iterator()
+    ]
+    HotelLeaderboard.objects.bulk_create(rows, update_conflicts=True, unique_fields=['hotel'], update_fields=['stars', 'score'], batch_size=1000)
+
+
+def rebuild_daily_stats(hotels=None):
+    # recomputes HotelDailyStats from the room nights and bookings of the given hotels (all by default)
+    table = HotelDailyStats._meta.db_table
+    only = 'WHERE r.hotel_id = ANY(%(hotels)s)' if hotels is not None else ''
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'''
+            DELETE FROM {table} {'WHERE hotel_id = ANY(%(hotels)s)' if hotels is not None else ''};
+            INSERT INTO {table} (hotel_id, date, nights_sold, revenue, bookings)
+            SELECT hotel_id, date, sum(nights_sold), sum(revenue), sum(bookings) FROM (
+                SELECT r.hotel_id, n.night AS date, count(*) AS nights_sold,
+                       sum(round(b.total_cost / (b.check_out - b.check_in), 2)) AS revenue, 0 AS bookings
+                FROM hotels_roomnight n
+                JOIN hotels_booking b ON b.id = n.booking_id
+                JOIN hotels_room r ON r.id = n.room_id
+                {only}
+                GROUP BY r.hotel_id, n.night
+                UNION ALL
+                SELECT r.hotel_id, (b.created_at AT TIME ZONE %(tz)s)::date, 0, 0, count(*)
+                FROM hotels_booking b
+                JOIN hotels_room r ON r.id = b.room_id
+                {only}
+                GROUP BY 1, 2
+            ) days
+            GROUP BY hotel_id, date
+            ''',
+            {'hotels': list(hotels or []), 'tz': timezone.get_current_timezone_name()},
+        )
+
+
+@receiver(pre_save, sender=Hotel)
+def hotel_image_changed(sender, instance, update_fields=None, **kwargs):
+    # a new upload (not in the storage yet) or a removed image: the variants are stale
+    if update_fields is not None and 'image' not in update_fields:
+        return
+    if (instance.image and not instance.image._committed) or (not instance.image and instance.image_variants):
+        instance.image_pending = True
+
+
+@receiver(post_save, sender=Hotel)
+def hotel_saved(sender, instance, created, update_fields=None, **kwargs):
+    if created or update_fields is None or 'stars' in update_fields:
+        refresh_leaderboard([instance.pk])
@@ -0,0 +1,162 @@
+import base64
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
+from rest_framework.utils.urls import replace_query_param
+
+
+def _encode_value(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f'{type(value).__name__} cannot be used in a cursor')
+
+
+# Seeks on the whole ordering tuple, e.g. (stars, id), instead of CursorPagination's
+# "first field + offset": every page is an index range scan of page_size + 1 rows
+# with no COUNT(*) and no OFFSET, so deep pages cost the same as the first one.
+class KeysetPagination(CursorPagination):
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-id',)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.page(list(self.page_queryset(queryset, request, view)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        # the same page for async views, fetched with the async ORM
+        return self.page([obj async for obj in self.page_queryset(queryset, request, view)])
+
+    def page_queryset(self, queryset, request, view):
+        # the page_size + 1 rows past the cursor; one more than a page tells if there is a next one
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.next_values = self.previous_values = None
+
+        self.cursor = self.decode_cursor(request, queryset)
+        ordering = self.reverse_ordering(self.ordering) if self.is_reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if self.cursor is not None:
+            queryset = queryset.filter(self.seek(ordering, self.cursor['v']))
+        return queryset[:self.page_size + 1]
+
+    @property
+    def is_reverse(self):
+        return self.cursor is not None and self.cursor['r']
+
+    def page(self, results):
+        reverse = self.is_reverse
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+
+        if results:
+            has_next = True if reverse else has_more
+            has_previous = has_more if reverse else self.cursor is not None
+            if has_next:
+                self.next_values = self.get_values(results[-1])
+            if has_previous:
+                self.previous_values = self.get_values(results[0])
+        return results
+
+    def get_ordering(self, request, queryset, view):
+        return self.ordering
+
+    def get_page_size(self, request):
+        return super().get_page_size(request) or self.page_size
+
+    def get_next_link(self):
+        if self.next_values is None:
+            return None
+        return self.encode_cursor({'v': self.next_values, 'r': 0})
+
+    def get_previous_link(self):
+        if self.previous_values is None:
+            return None
+        return self.encode_cursor({'v': self.previous_values, 'r': 1})
+
+    def get_values(self, obj):
+        return [getattr(obj, field.lstrip('-')) for field in self.ordering]
+
+    def reverse_ordering(self, ordering):
+        return tuple(field[1:] if field.startswith('-') else f'-{field}' for field in ordering)
+
+    def seek(self, ordering, values):
+        # (a, b) > (x, y)  ->  a >= x AND (a > x OR (a = x AND b > y)); the leading
+        # range condition lets the database start the index scan at the cursor
+        first = ordering[0]
+        condition = Q(**{f"{first.lstrip('-')}__{'lte' if first.startswith('-') else 'gte'}": values[0]})
+        seek = Q()
+        for i, field in enumerate(ordering):
+            step = Q(**{f"{field.lstrip('-')}__{'lt' if field.startswith('-') else 'gt'}": values[i]})
+            for previous, value in zip(ordering[:i], values):
+                step &= Q(**{previous.lstrip('-'): value})
+            seek |= step
+        return condition & seek
+
+    def encode_cursor(self, cursor):
+        data = json.dumps(cursor, default=_encode_value, separators=(',', ':'))
+        encoded = base64.urlsafe_b64encode(data.encode()).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def decode_cursor(self, request, queryset=None):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+            values, reverse = cursor['v'], bool(cursor['r'])
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        if queryset is not None:
+            # a tampered cursor must not reach the query as a dict or a non-number
+            try:
+                values = [self.to_python(queryset, field, value) for field, value in zip(self.ordering, values)]
+            except (TypeError, ValueError, ValidationError):
+                raise NotFound(self.invalid_cursor_message)
+        return {'v': values, 'r': reverse}
+
+    def to_python(self, queryset, field, value):
+        name = field.lstrip('-')
+        annotation = queryset.query.annotations.get(name)
+        model_field = annotation.output_field if annotation is not None else queryset.model._meta.get_field(name)
+        value = model_field.to_python(value)
+        if value is None:
+            raise ValueError(f'{name} is None')
+        return value
+
+
+class HotelPagination(KeysetPagination):
+    ordering = ('-stars', '-id')
+
+    def get_ordering(self, request, queryset, view):
+        if 'search_rank' in queryset.query.annotations:
+            return ('-search_rank', '-id')
+        return self.ordering
+
+
+class RoomPagination(KeysetPagination):
+    ordering = ('price_per_night', 'id')
+
+
+class BookingPagination(KeysetPagination):
+    ordering = ('-created_at', '-id')
+
+
+class FavoritePagination(KeysetPagination):
+    ordering = ('-id',)
+
+
+class ReviewPagination(KeysetPagination):
+    ordering = ('-created_at', '-id')
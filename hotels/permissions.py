@@ -9,17 +9,17 @@ class IsOwner(BasePermission):
 class IsOwnerAndAuthor(BasePermission):
     def has_object_permission(self, request, view, obj):
         if request.user.is_authenticated:
-            return request.user.is_owner and obj.owner == request.user
+            return request.user.is_owner and obj.owner_id == request.user.pk
         return False
 
 
 class IsHisHotel(BasePermission):
     def has_object_permission(self, request, view, obj):
         if request.user.is_authenticated:
-            return request.user.is_owner and obj.hotel.owner == request.user
+            return request.user.is_owner and obj.hotel.owner_id == request.user.pk
         return False
 
 
 class IsAuthor(BasePermission):
     def has_object_permission(self, request, view, obj):
-        return request.user.is_authenticated and request.user == obj.user
\ No newline at end of file
+        return request.user.is_authenticated and obj.user_id == request.user.pk
\ No newline at end of file
@@ -0,0 +1,83 @@
+from contextlib import asynccontextmanager, contextmanager
+
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import OperationalError, connection, transaction
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import Cast
+from rest_framework import filters, status
+from rest_framework.exceptions import APIException
+
+# must match the text search configuration used by the trigger in 0014_hotel_search_vector
+SEARCH_CONFIG = 'simple'
+QUERY_CANCELED = '57014'
+
+
+class SearchTimeout(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Поиск занял слишком много времени, уточните запрос.'
+    default_code = 'search_timeout'
+
+
+class HotelSearchFilter(filters.SearchFilter):
+    # PostgreSQL: websearch query over the trigger-maintained Hotel.search_vector
+    # (GIN index, name weighted A, description B), ranked by ts_rank. Other
+    # databases fall back to SearchFilter's icontains over search_fields.
+    def get_search_term(self, request):
+        return request.query_params.get(self.search_param, '').replace('\x00', '').strip()[:settings.HOTEL_SEARCH_MAX_LENGTH]
+
+    def filter_queryset(self, request, queryset, view):
+        term = self.get_search_term(request)
+        if not term:
+            return queryset
+        if connection.vendor != 'postgresql':
+            return super().filter_queryset(request, queryset, view).annotate(search_rank=Value(1.0, output_field=FloatField()))
+        query = SearchQuery(term, config=SEARCH_CONFIG, search_type='websearch')
+        # ts_rank is a float4; cast so the rank survives the round trip through a pagination cursor
+        rank = Cast(SearchRank(F('search_vector'), query), FloatField())
+        return queryset.filter(search_vector=query).annotate(search_rank=rank)
+
+
+@contextmanager
+def statement_timeout(milliseconds):
+    if connection.vendor != 'postgresql':
+        yield
+        return
+    try:
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL statement_timeout = %s', [milliseconds])
+            yield
+    except OperationalError as exc:
+        if getattr(exc.__cause__, 'pgcode', None) == QUERY_CANCELED:
+            raise SearchTimeout()
+        raise
+
+
+@asynccontextmanager
+async def astatement_timeout(milliseconds):
+    # statement_timeout for async views. There is no transaction to SET LOCAL in: the
+    # async ORM runs all queries of a request on one connection (the request's thread),
+    # so the timeout is set on that session and reset afterwards.
+    if connection.vendor != 'postgresql':
+        yield
+        return
+    await sync_to_async(_set_statement_timeout)(milliseconds)
+    try:
+        yield
+    except OperationalError as exc:
+        if getattr(exc.__cause__, 'pgcode', None) == QUERY_CANCELED:
+            raise SearchTimeout()
+        raise
+    finally:
+        await sync_to_async(_set_statement_timeout)(None)
+
+
+def _set_statement_timeout(milliseconds):
+    with connection.cursor() as cursor:
+        if milliseconds is None:
+            cursor.execute('RESET statement_timeout')
+        else:
+            cursor.execute('SET statement_timeout = %s', [milliseconds])
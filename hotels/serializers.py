@@ -1,6 +1,12 @@
+from datetime import timedelta
+
 from rest_framework import serializers
-from django.db.models import Avg
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db.models import Prefetch
+from django.utils import timezone
 
+from hotels.mixins import FlexFieldsSerializerMixin
 from hotels.models import Booking, Favorite, Hotel, HotelRating, Like, Review, Room
 
 
@@ -13,6 +19,21 @@ class LikeSerializer(serializers.ModelSerializer):
         fields = ('user',)
 
 
+class ReviewSerializer(serializers.ModelSerializer):
+    user = serializers.PrimaryKeyRelatedField(read_only=True, default=serializers.CurrentUserDefault())
+
+    class Meta:
+        model = Review
+        fields = ('id', 'user', 'hotel', 'text', 'created_at', 'updated_at')
+        read_only_fields = ['hotel']
+
+
+class ReviewCreateSerializer(ReviewSerializer):
+    # POST /review/ names the hotel; it can't be moved to another one afterwards
+    class Meta(ReviewSerializer.Meta):
+        read_only_fields = []
+
+
 class HotelListSerializer(serializers.ListSerializer):
     class Meta:
         model = Hotel
@@ -20,44 +41,66 @@ class HotelListSerializer(serializers.ListSerializer):
 
 
 
-class HotelSerializer(serializers.ModelSerializer):
-    likes = serializers.SerializerMethodField(method_name='get_likes_count')
+class HotelSerializer(FlexFieldsSerializerMixin, serializers.ModelSerializer):
+    likes = serializers.IntegerField(source='likes_count', read_only=True)
     image = serializers.ImageField(max_length=None, use_url=True)
-    
+    liked_users = LikeSerializer(source='likes', many=True, read_only=True)
+    rating = serializers.FloatField(read_only=True)
+    reviews = ReviewSerializer(many=True, read_only=True)
+    image_variants = serializers.SerializerMethodField()
+
+    prefetch_fields = {
+        'liked_users': [Prefetch('likes', queryset=Like.objects.select_related('user').only('hotel', 'user__email'))],
+        'reviews': ['reviews'],
+    }
+    field_sources = {'rating': ['rating_sum', 'rating_count'], 'image_variants': ['image_variants', 'image_pending']}
+
 
     class Meta:
         model = Hotel
-        fields = '__all__'
-        read_only_fields = ['owner', 'id']
+        exclude = ('likes_count', 'rating_sum', 'rating_count', 'search_vector', 'image_pending')
+        read_only_fields = ['owner', 'id', 'bookings_count', 'favorites_count', 'reviews_count']
         list_serializer_class = HotelListSerializer
 
-
-    def get_likes_count(self, instance) -> int:
-        return Like.objects.filter(hotel=instance).count()
     
 
     def create(self, validated_data):
         validated_data['owner'] = self.context['request'].user
         return super().create(validated_data)
-    
 
-    def to_representation(self, instance):
-        representation = super().to_representation(instance)
-        representation['liked_users'] = LikeSerializer(instance.likes.all(), many=True).data
-        representation['rating'] = instance.ratings.aggregate(Avg('rate'))['rate__avg']
-        representation['reviews'] = ReviewSerializer(instance.reviews.all(), many=True).data
-        return representation
+    def get_image_variants(self, obj):
+        # {'thumb': {'webp': url, 'jpeg': url}, 'card': ..., 'full': ...}; empty until
+        # the current image is processed, clients fall back to `image` meanwhile
+        if obj.image_pending:
+            return {}
+        request = self.context.get('request')
+        return {
+            name: {
+                extension: request.build_absolute_uri(default_storage.url(path)) if request else default_storage.url(path)
+                for extension, path in files.items()
+            }
+            for name, files in obj.image_variants.items()
+        }
     
 
 
 
+class HotelShortSerializer(FlexFieldsSerializerMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Hotel
+        fields = ('id', 'name', 'stars', 'address', 'description', 'image')
+
+
+
 class RoomListSerializer(serializers.ListSerializer):
     class Meta:
         model = Room
         fields = ('id', 'room_number', 'room_type', 'capacity', 'price_per_night', 'status')
 
 
-class RoomSerializer(serializers.ModelSerializer):
+class RoomSerializer(FlexFieldsSerializerMixin, serializers.ModelSerializer):
+    expandable_fields = {'hotel': HotelShortSerializer}
+
     class Meta:
         model = Room
         fields = ('hotel', 'id', 'room_number', 'room_type', 'capacity', 'price_per_night', 'status')
@@ -65,19 +108,165 @@ class RoomSerializer(serializers.ModelSerializer):
         list_serializer_class = RoomListSerializer
 
     def validate_hotel(self, value):
-        if value.owner != self.context['request'].user:
+        if value.owner_id != self.context['request'].user.pk:
             raise serializers.ValidationError("Нельзя создать комнату в чужом отеле")
         return value
 
 
 
 
-class BookingSerializer(serializers.ModelSerializer):
+class HotelImportSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Hotel
+        fields = ('name', 'address', 'description', 'stars')
+
+
+class RoomImportSerializer(serializers.ModelSerializer):
+    # the hotel reference is resolved by hotels.importer for a whole chunk at once
+    class Meta:
+        model = Room
+        fields = ('room_number', 'room_type', 'capacity', 'price_per_night')
+
+
+class RoomBatchItemSerializer(RoomImportSerializer):
+    hotel = serializers.IntegerField(min_value=1)
+
+    class Meta(RoomImportSerializer.Meta):
+        fields = ('hotel',) + RoomImportSerializer.Meta.fields
+
+
+class RoomBatchCreateSerializer(serializers.Serializer):
+    rooms = RoomBatchItemSerializer(many=True, allow_empty=False, max_length=settings.ROOM_BATCH_MAX_SIZE)
+
+    def validate_rooms(self, rooms):
+        # one query for the hotels of the whole batch instead of one per room
+        hotels = {room['hotel'] for room in rooms}
+        owned = set(Hotel.objects.filter(pk__in=hotels, owner=self.context['request'].user).values_list('pk', flat=True))
+        if hotels - owned:
+            raise serializers.ValidationError([
+                {} if room['hotel'] in owned else {'hotel': ['Нельзя создать комнату в чужом отеле']} for room in rooms
+            ])
+        return rooms
+
+
+class RoomBatchFilterSerializer(serializers.Serializer):
+    hotels = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False)
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False, required=False)
+    room_type = serializers.ChoiceField(choices=Room.ROOM_TYPE_CHOICES, required=False)
+    capacity = serializers.ChoiceField(choices=Room.ROOM_CAPACITY_CHOICES, required=False)
+
+    def validate_hotels(self, hotels):
+        owned = set(Hotel.objects.filter(pk__in=hotels, owner=self.context['request'].user).values_list('pk', flat=True))
+        foreign = sorted(set(hotels) - owned)
+        if foreign:
+            raise serializers.ValidationError(f'Нельзя менять комнаты в чужих отелях: {foreign}')
+        return hotels
+
+
+class RoomBatchChangesSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Room
+        fields = ('room_type', 'capacity', 'price_per_night')
+        extra_kwargs = {field: {'required': False} for field in fields}
+
+    def validate(self, attrs):
+        if not attrs:
+            raise serializers.ValidationError('Укажите хотя бы одно изменение')
+        return attrs
+
+
+class RoomBatchUpdateSerializer(serializers.Serializer):
+    filter = RoomBatchFilterSerializer()
+    changes = RoomBatchChangesSerializer()
+
+
+
+
+class BookingSerializer(FlexFieldsSerializerMixin, serializers.ModelSerializer):
+    expandable_fields = {'room': RoomSerializer}
+
     class Meta:
         model = Booking
         fields = ('id', 'user', 'check_in', 'check_out', 'guests', 'room')
         read_only_fields = ['id', 'user', 'room']
 
+    def validate(self, attrs):
+        if attrs['check_in'] < timezone.localdate():
+            raise serializers.ValidationError({'check_in': 'Дата заезда уже прошла'})
+        if attrs['check_out'] <= attrs['check_in']:
+            raise serializers.ValidationError({'check_out': 'Дата выезда должна быть позже даты заезда'})
+        if (attrs['check_out'] - attrs['check_in']).days > settings.MAX_STAY_NIGHTS:
+            raise serializers.ValidationError({'check_out': f'Бронирование не может быть длиннее {settings.MAX_STAY_NIGHTS} ночей'})
+        room = self.context.get('room')
+        if room is not None and attrs['guests'] > room.capacity:
+            raise serializers.ValidationError({'guests': 'Количество гостей превышает вместимость комнаты'})
+        return attrs
+
+
+
+class AvailabilitySerializer(serializers.Serializer):
+    check_in = serializers.DateField()
+    check_out = serializers.DateField()
+    guests = serializers.IntegerField(min_value=1, default=1)
+    stars = serializers.ChoiceField(choices=Hotel._meta.get_field('stars').choices, required=False)
+    max_price = serializers.DecimalField(max_digits=8, decimal_places=2, required=False)
+
+    def validate(self, attrs):
+        if attrs['check_out'] <= attrs['check_in']:
+            raise serializers.ValidationError({'check_out': 'Дата выезда должна быть позже даты заезда'})
+        return attrs
+
+
+class BookingExportSerializer(serializers.Serializer):
+    # mine: the user's own bookings, hotels: bookings in the owner's hotels
+    scope = serializers.ChoiceField(choices=('mine', 'hotels'), default='mine')
+    hotel = serializers.IntegerField(min_value=1, required=False)
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+
+    def validate_scope(self, value):
+        if value == 'hotels' and not self.context['request'].user.is_owner:
+            raise serializers.ValidationError('Бронирования отелей доступны только владельцам')
+        return value
+
+    def validate(self, attrs):
+        if 'date_from' in attrs and 'date_to' in attrs and attrs['date_to'] < attrs['date_from']:
+            raise serializers.ValidationError({'date_to': 'Конец периода раньше начала'})
+        return attrs
+
+
+class OwnerAnalyticsSerializer(serializers.Serializer):
+    # ?hotel=&from=&to=&granularity=; all the owner's hotels and the last
+    # ANALYTICS_DEFAULT_DAYS days by default
+    hotel = serializers.IntegerField(min_value=1, required=False)
+    granularity = serializers.ChoiceField(choices=('day', 'week', 'month'), default='day')
+
+    def get_fields(self):
+        # `from` can't be a class attribute
+        fields = super().get_fields()
+        fields['from'] = serializers.DateField(required=False)
+        fields['to'] = serializers.DateField(required=False)
+        return fields
+
+    def validate_hotel(self, value):
+        if not Hotel.objects.filter(pk=value, owner=self.context['request'].user).exists():
+            raise serializers.ValidationError('Отель не найден среди ваших отелей')
+        return value
+
+    def validate(self, attrs):
+        attrs.setdefault('to', timezone.localdate())
+        attrs.setdefault('from', attrs['to'] - timedelta(days=settings.ANALYTICS_DEFAULT_DAYS - 1))
+        if attrs['to'] < attrs['from']:
+            raise serializers.ValidationError({'to': 'Конец периода раньше начала'})
+        if (attrs['to'] - attrs['from']).days >= settings.ANALYTICS_MAX_DAYS:
+            raise serializers.ValidationError({'to': f'Период не длиннее {settings.ANALYTICS_MAX_DAYS} дней'})
+        return attrs
+
+
+class TopHotelsSerializer(serializers.Serializer):
+    limit = serializers.IntegerField(min_value=1, max_value=settings.TOP_HOTELS_MAX_LIMIT, default=settings.TOP_HOTELS_LIMIT)
+    stars = serializers.ChoiceField(choices=Hotel._meta.get_field('stars').choices, required=False)
+
 
 
 class RatingSerializer(serializers.ModelSerializer):
@@ -100,19 +289,10 @@ class RatingSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
     
 
-class FavoriteSerializer(serializers.ModelSerializer):
+class FavoriteSerializer(FlexFieldsSerializerMixin, serializers.ModelSerializer):
     user = serializers.ReadOnlyField(source='user.email')
+    expandable_fields = {'hotel': HotelShortSerializer}
 
     class Meta:
         model = Favorite
         fields = ('user', 'hotel')
-
-
-
-class ReviewSerializer(serializers.ModelSerializer):
-    user = serializers.PrimaryKeyRelatedField(read_only=True, default=serializers.CurrentUserDefault())
-
-    class Meta:
-        model = Review
-        fields = ('id', 'user', 'hotel', 'text', 'created_at', 'updated_at')
-        read_only_fields = ['hotel']
\ No newline at end of file
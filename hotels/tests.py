@@ -1,14 +1,29 @@
-from django.test import TestCase, RequestFactory
+from django.test import LiveServerTestCase, TestCase, TransactionTestCase, RequestFactory, override_settings
 from django.urls import reverse
 from rest_framework.test import force_authenticate
 from rest_framework import status
-from hotels.models import Booking, Favorite, Hotel, HotelRating, Like, Review, Room
+from hotels.models import Booking, Favorite, Hotel, HotelDailyStats, HotelLeaderboard, HotelRating, Like, Review, Room, RoomNight
 from hotels.serializers import BookingSerializer, RoomSerializer
 from hotels.views import BookingListAPIView, HotelViewSet, TopHotelsAPIView
 from django.contrib.auth import get_user_model
 from rest_framework.test import APIRequestFactory, APIClient, APITestCase
-from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.utils import timezone
 from datetime import datetime, timedelta
+from io import BytesIO, StringIO
+import base64
+import csv
+import json
+import os
+import tempfile
+from threading import Barrier, Thread
+from PIL import Image
+from django.db import IntegrityError, connection
+from hotels.booking import RoomUnavailable, book_room, cancel_booking
 
 User = get_user_model()
 
@@ -178,6 +193,15 @@ class BookingCreateAPIViewTestCase(APITestCase):
         self.assertEqual(booking.guests, 2)
         self.assertEqual(booking.total_cost, 300)
 
+    def test_only_overlaps_are_unavailable(self):
+        check_in = datetime(2023, 5, 1).date()
+        book_room(self.user, self.room, check_in, check_in + timedelta(days=3), 1)
+        with self.assertRaises(RoomUnavailable):
+            book_room(self.user, self.room, check_in + timedelta(days=2), check_in + timedelta(days=4), 1)
+        # a violated check constraint is not a taken room
+        with self.assertRaises(IntegrityError):
+            book_room(self.user, self.room, check_in + timedelta(days=5), check_in + timedelta(days=6), -1)
+
 
 
 
@@ -206,4 +230,923 @@ class BookingCreateAPIViewTestCase(APITestCase):
 #         force_authenticate(request, user=self.user)
 #         response = self.view(request)
 #         self.assertEqual(response.status_code, status.HTTP_200_OK)
-#         self.assertEqual(response.data, BookingSerializer([self.booking], many=True).data)
\ No newline at end of file
+#         self.assertEqual(response.data, BookingSerializer([self.booking], many=True).data)
+
+
+class HotelCountersTestCase(APITestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(email='owner@gmail.com', password='12345', is_owner=True)
+        self.user = User.objects.create_user(email='guest@gmail.com', password='12345')
+        self.hotel = Hotel.objects.create(name='Hotel', address='Address', description='Description', stars='3', owner=self.owner)
+        self.client.force_authenticate(user=self.user)
+
+    def test_like_toggle(self):
+        response = self.client.post(f'/hotel/{self.hotel.id}/like/')
+        self.assertEqual(response.data, {'liked': True, 'likes_count': 1})
+        response = self.client.post(f'/hotel/{self.hotel.id}/like/')
+        self.assertEqual(response.data, {'liked': False, 'likes_count': 0})
+
+    def test_counters(self):
+        self.client.post(f'/hotel/{self.hotel.id}/favorite/')
+        self.client.post(f'/hotel/{self.hotel.id}/rate/', {'rate': 4})
+        self.client.post(f'/hotel/{self.hotel.id}/review/', {'text': 'Nice'})
+        self.hotel.refresh_from_db()
+        self.assertEqual((self.hotel.favorites_count, self.hotel.rating_sum, self.hotel.rating_count, self.hotel.reviews_count), (1, 4, 1, 1))
+        self.assertEqual(self.hotel.rating, 4)
+        call_command('rebuild_hotel_counters', '--check', stdout=StringIO())
+
+    def test_review_endpoint(self):
+        response = self.client.post('/review/', {'hotel': self.hotel.id, 'text': 'Nice'})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual((response.data['hotel'], response.data['user']), (self.hotel.id, self.user.id))
+        url = f'/review/{response.data["id"]}/'
+        other = Hotel.objects.create(name='Other', address='Address', description='Description', stars='3', owner=self.owner)
+        self.assertEqual(self.client.patch(url, {'hotel': other.id, 'text': 'Fine'}).data['hotel'], self.hotel.id)
+        self.hotel.refresh_from_db()
+        self.assertEqual(self.hotel.reviews_count, 1)
+        call_command('rebuild_hotel_counters', '--check', stdout=StringIO())
+
+        self.assertEqual(self.client.delete(url).status_code, status.HTTP_204_NO_CONTENT)
+        self.hotel.refresh_from_db()
+        self.assertEqual(self.hotel.reviews_count, 0)
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.post('/review/', {'hotel': self.hotel.id, 'text': 'Nice'}).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_rebuild_command(self):
+        untouched = Hotel.objects.create(name='Other', address='Address', description='Description', stars='3', owner=self.owner)
+        updated_at = self.hotel.updated_at
+        Like.objects.create(user=self.user, hotel=self.hotel)
+        HotelRating.objects.create(user=self.user, hotel=self.hotel, rate=5)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_hotel_counters', '--check', stdout=StringIO())
+        call_command('rebuild_hotel_counters', stdout=StringIO())
+        call_command('rebuild_hotel_counters', '--check', stdout=StringIO())
+        self.hotel.refresh_from_db()
+        self.assertEqual((self.hotel.likes_count, self.hotel.rating_sum, self.hotel.rating_count), (1, 5, 1))
+        # the repaired hotel's ETag changes, the other one's stays valid
+        self.assertGreater(self.hotel.updated_at, updated_at)
+        self.assertEqual(Hotel.objects.get(pk=untouched.pk).updated_at, untouched.updated_at)
+
+
+class HotelQueryCountTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user(email='owner@gmail.com', password='12345', is_owner=True)
+        self.hotels = [
+            Hotel.objects.create(name=f'Hotel {i}', address='Address', description='Description', stars='3', owner=self.owner)
+            for i in range(5)
+        ]
+        for i in range(5):
+            user = User.objects.create_user(email=f'guest{i}@gmail.com', password='12345')
+            for hotel in self.hotels:
+                Like.objects.create(user=user, hotel=hotel)
+                HotelRating.objects.create(user=user, hotel=hotel, rate=i + 1)
+                Review.objects.create(user=user, hotel=hotel, author=user.email, text='Nice')
+        call_command('rebuild_hotel_counters', stdout=StringIO())
+
+    # a hotel detail starts with one version query for the ETag (ConditionalGetMixin),
+    # a list reads its versions in the page query
+    def test_list_queries(self):
+        with self.assertNumQueries(3):
+            response = self.client.get('/hotel/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        hotel = response.data['results'][0]
+        self.assertEqual(hotel['likes'], 5)
+        self.assertEqual(hotel['rating'], 3)
+        self.assertEqual(len(hotel['liked_users']), 5)
+        self.assertEqual(len(hotel['reviews']), 5)
+
+    def test_detail_queries(self):
+        with self.assertNumQueries(4):
+            response = self.client.get(f'/hotel/{self.hotels[0].id}/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['likes'], 5)
+
+    def test_top_hotels_queries(self):
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('top-hotels'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+
+class LeaderboardTestCase(APITestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(email='owner@gmail.com', password='12345', is_owner=True)
+        self.user = User.objects.create_user(email='guest@gmail.com', password='12345')
+        self.hotels = [
+            Hotel.objects.create(name=f'Hotel {i}', address='Address', description='Description', stars=stars, owner=self.owner)
+            for i, stars in enumerate(['3', '4', '4'])
+        ]
+        self.rooms = [
+            Room.objects.create(hotel=hotel, room_number='101', room_type='Standard', capacity=2, price_per_night=100)
+            for hotel in self.hotels
+        ]
+        self.client.force_authenticate(user=self.user)
+
+    def get_ids(self, query=''):
+        response = self.client.get(reverse('top-hotels') + query)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [hotel['id'] for hotel in response.data]
+
+    def book(self, room, day):
+        check_in = datetime(2023, 5, day).date()
+        return book_room(self.user, room, check_in, check_in + timedelta(days=1), 1)
+
+    def test_bookings_and_ratings_update_ranking(self):
+        self.book(self.rooms[2], 1)
+        self.book(self.rooms[2], 2)
+        self.book(self.rooms[1], 1)
+        self.assertEqual(self.get_ids(), [self.hotels[2].id, self.hotels[1].id, self.hotels[0].id])
+
+        self.client.post(f'/hotel/{self.hotels[0].id}/rate/', {'rate': 5})
+        self.assertEqual(self.get_ids(), [self.hotels[2].id, self.hotels[1].id, self.hotels[0].id])
+        self.book(self.rooms[0], 1)
+        # same number of bookings, the rating breaks the tie
+        self.assertEqual(self.get_ids(), [self.hotels[2].id, self.hotels[0].id, self.hotels[1].id])
+
+    def test_cancel_lowers_score(self):
+        booking = self.book(self.rooms[1], 1)
+        self.assertEqual(self.get_ids('?limit=1'), [self.hotels[1].id])
+        cancel_booking(booking)
+        self.assertEqual(self.get_ids('?limit=1'), [self.hotels[0].id])
+
+    def test_limit_and_stars(self):
+        self.book(self.rooms[0], 1)
+        self.assertEqual(self.get_ids('?stars=4'), [self.hotels[1].id, self.hotels[2].id])
+        self.assertEqual(self.get_ids('?limit=1&stars=3'), [self.hotels[0].id])
+        self.hotels[0].stars = '4'
+        self.hotels[0].save()
+        self.assertEqual(self.get_ids('?limit=2&stars=4'), [self.hotels[0].id, self.hotels[1].id])
+        response = self.client.get(reverse('top-hotels') + '?limit=0')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_unscored_hotel_is_left_out(self):
+        self.book(self.rooms[1], 1)
+        # bulk_create skips the post_save that adds the leaderboard row
+        unscored = Hotel.objects.bulk_create([
+            Hotel(name='Imported', address='Address', description='Description', stars='4', owner=self.owner),
+        ])[0]
+        self.assertFalse(HotelLeaderboard.objects.filter(hotel=unscored).exists())
+        self.assertEqual(self.get_ids('?limit=1'), [self.hotels[1].id])
+        self.assertNotIn(unscored.id, self.get_ids('?limit=50'))
+        call_command('rebuild_hotel_counters', stdout=StringIO())
+        self.assertIn(unscored.id, self.get_ids('?limit=50'))
+
+    @override_settings(TOP_HOTELS_SCORE={'likes_count': 1.0})
+    def test_configurable_score(self):
+        call_command('rebuild_hotel_counters', stdout=StringIO())
+        self.client.post(f'/hotel/{self.hotels[2].id}/like/')
+        self.book(self.rooms[1], 1)
+        self.assertEqual(self.get_ids('?limit=1'), [self.hotels[2].id])
+
+
+
+class ConditionalGetTestCase(APITestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(email='owner@gmail.com', password='12345', is_owner=True)
+        self.user = User.objects.create_user(email='guest@gmail.com', password='12345')
+        self.hotel = Hotel.objects.create(name='Hotel', address='Address', description='Description', stars='4', owner=self.owner)
+        self.room = Room.objects.create(hotel=self.hotel, room_number='101', room_type='Standard', capacity=2, price_per_night=100)
+
+    def revalidate(self, url, etag):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_detail_not_modified_until_like(self):
+        url = f'/hotel/{self.hotel.id}/'
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(1):
+            response = self.revalidate(url, etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.client.force_authenticate(user=self.user)
+        self.client.post(f'/hotel/{self.hotel.id}/like/')
+        response = self.revalidate(url, etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.data['likes'], 1)
+
+    def test_if_modified_since(self):
+        url = f'/hotel/{self.hotel.id}/'
+        last_modified = self.client.get(url)['Last-Modified']
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_list_changes_with_rows_and_query(self):
+        etag = self.client.get('/hotel/')['ETag']
+        self.assertEqual(self.revalidate('/hotel/', etag).status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(self.revalidate('/hotel/?fields=id', etag).status_code, status.HTTP_200_OK)
+        Hotel.objects.create(name='Other', address='Address', description='Description', stars='3', owner=self.owner).delete()
+        self.assertEqual(self.revalidate('/hotel/', etag).status_code, status.HTTP_304_NOT_MODIFIED)
+        Hotel.objects.filter(pk=self.hotel.pk).update(stars='5')
+        Hotel.objects.bump(self.hotel.pk)
+        response = self.revalidate('/hotel/', etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('Last-Modified', response)
+
+        other = Hotel.objects.create(name='Other', address='Address', description='Description', stars='3', owner=self.owner)
+        etag = self.client.get('/hotel/')['ETag']
+        # only the page query, no COUNT/MAX over the list
+        with self.assertNumQueries(1):
+            self.assertEqual(self.revalidate('/hotel/', etag).status_code, status.HTTP_304_NOT_MODIFIED)
+        other.delete()
+        self.assertEqual(self.revalidate('/hotel/', etag).status_code, status.HTTP_200_OK)
+
+    def test_list_etag_follows_page(self):
+        for i in range(3):
+            Hotel.objects.create(name=f'Hotel {i}', address='Address', description='Description', stars='3', owner=self.owner)
+        first = self.client.get('/hotel/?page_size=2')
+        second_url = first.data['next']
+        etag = self.client.get(second_url)['ETag']
+        self.assertNotEqual(etag, first['ETag'])
+        # a change on the first page leaves the second one valid
+        Hotel.objects.bump(self.hotel.pk)
+        self.assertEqual(self.revalidate(second_url, etag).status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_room_follows_hotel_and_booking(self):
+        url = f'/room/{self.room.id}/?expand=hotel'
+        etag = self.client.get(url)['ETag']
+        self.hotel.name = 'Renamed'
+        self.hotel.save()
+        response = self.revalidate(url, etag)
+        self.assertEqual(response.data['hotel']['name'], 'Renamed')
+
+        etag = response['ETag']
+        book_room(self.user, self.room, datetime(2023, 5, 1).date(), datetime(2023, 5, 2).date(), 1)
+        response = self.revalidate(url, etag)
+        self.assertEqual(response.data['status'], 'Booked')
+
+    def test_review_not_modified_until_edit(self):
+        review = Review.objects.create(hotel=self.hotel, user=self.user, text='Nice')
+        url = f'/review/{review.id}/'
+        etag = self.client.get(url)['ETag']
+        list_etag = self.client.get('/review/')['ETag']
+        self.assertEqual(self.revalidate(url, etag).status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(self.revalidate('/review/', list_etag).status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.client.force_authenticate(user=self.owner)
+        self.assertEqual(self.client.patch(url, {'text': 'Bad'}).status_code, status.HTTP_403_FORBIDDEN)
+        self.client.force_authenticate(user=self.user)
+        self.assertEqual(self.client.patch(url, {'text': 'Very nice'}).status_code, status.HTTP_200_OK)
+        response = self.revalidate(url, etag)
+        self.assertEqual(response.data['text'], 'Very nice')
+        self.assertEqual(self.revalidate('/review/', list_etag).status_code, status.HTTP_200_OK)
+
+
+
+class KeysetPaginationTestCase(APITestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(email='owner@gmail.com', password='12345', is_owner=True)
+        for i in range(25):
+            Hotel.objects.create(name=f'Hotel {i}', address='Address', description='Description', stars=str(i % 3 + 1), owner=self.owner)
+
+    def test_walk_all_pages(self):
+        url, seen = '/hotel/?page_size=4', []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn('count', response.data)
+            seen += [(hotel['stars'], hotel['id']) for hotel in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(len(seen), 25)
+        self.assertEqual(seen, sorted(seen, reverse=True))
+
+    def test_previous_page(self):
+        first = self.client.get('/hotel/?page_size=5').data
+        second = self.client.get(first['next']).data
+        previous = self.client.get(second['previous']).data
+        self.assertEqual([h['id'] for h in previous['results']], [h['id'] for h in first['results']])
+        self.assertIsNone(first['previous'])
+
+    def test_review_pages(self):
+        user = User.objects.create_user(email='guest@gmail.com', password='12345')
+        hotel = Hotel.objects.first()
+        reviews = [Review.objects.create(hotel=hotel, user=user, text=f'Review {i}') for i in range(7)]
+        # reviews written in the same instant are ordered by id
+        Review.objects.filter(pk__in=[r.pk for r in reviews[2:5]]).update(created_at=reviews[2].created_at)
+        expected = list(Review.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+
+        url, pages, seen = '/review/?page_size=3', [], []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            pages.append(response.data)
+            seen += [review['id'] for review in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(seen, expected)
+        previous = self.client.get(pages[2]['previous']).data
+        self.assertEqual(previous['results'], pages[1]['results'])
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/hotel/?cursor=bad')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_cursor_with_bad_values(self):
+        def cursor(values):
+            return base64.urlsafe_b64encode(json.dumps({'v': values, 'r': 0}).encode()).decode()
+
+        for values in (['x', {}], ['3', 'x'], ['3', None], ['3', [1]]):
+            response = self.client.get(f'/hotel/?cursor={cursor(values)}')
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND, values)
+        self.assertEqual(self.client.get(f'/room/?cursor={cursor(["abc", 1])}').status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get(f'/hotel/?search=Hotel&cursor={cursor(["x", 1])}').status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get(f'/hotel/?cursor={cursor(["3", 10])}')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+
+class FlexFieldsTestCase(APITestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(email='owner@gmail.com', password='12345', is_owner=True)
+        self.user = User.objects.create_user(email='guest@gmail.com', password='12345')
+        self.hotels = [
+            Hotel.objects.create(name=f'Hotel {i}', address='Address', description='Description', stars='3', owner=self.owner)
+            for i in range(3)
+        ]
+        for hotel in self.hotels:
+            room = Room.objects.create(hotel=hotel, room_number='101', room_type='Deluxe', capacity=2, price_per_night=100)
+            Booking.objects.create(user=self.user, room=room, check_in='2023-05-01', check_out='2023-05-03', guests=2, total_cost=200)
+            Favorite.objects.create(user=self.user, hotel=hotel)
+            Like.objects.create(user=self.user, hotel=hotel)
+        self.client.force_authenticate(user=self.user)
+
+    def test_sparse_hotel_fields(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/hotel/?fields=id,name,rating')
+        self.assertEqual(set(response.data['results'][0]), {'id', 'name', 'rating'})
+
+    def test_expand_booking_room_hotel(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('booking-history') + '?expand=room.hotel')
+        booking = response.data['results'][0]
+        self.assertEqual(booking['room']['room_number'], '101')
+        self.assertEqual(booking['room']['hotel']['name'], 'Hotel 2')
+
+    def test_expand_favorite_hotel(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('favorites') + '?expand=hotel&fields=user,hotel')
+        favorite = response.data['results'][0]
+        self.assertEqual(favorite['user'], 'guest@gmail.com')
+        self.assertEqual(favorite['hotel']['name'], 'Hotel 2')
+
+
+class HotelSearchTestCase(APITestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(email='owner@gmail.com', password='12345', is_owner=True)
+        self.in_description = Hotel.objects.create(name='Ala-Too', address='Address', description='Quiet hotel near the mountains', stars='5', owner=self.owner)
+        self.in_name = Hotel.objects.create(name='Mountains Resort', address='Address', description='Spa and pool', stars='3', owner=self.owner)
+        Hotel.objects.create(name='City Inn', address='Address', description='Downtown', stars='4', owner=self.owner)
+
+    def test_ranked_results(self):
+        response = self.client.get('/hotel/?search=mountains')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([hotel['id'] for hotel in response.data['results']], [self.in_name.id, self.in_description.id])
+        self.assertNotIn('search_vector', response.data['results'][0])
+
+    def test_vector_follows_updates(self):
+        self.in_name.name = 'Sunrise Resort'
+        self.in_name.save()
+        response = self.client.get('/hotel/?search=sunrise')
+        self.assertEqual([hotel['id'] for hotel in response.data['results']], [self.in_name.id])
+
+    def test_paginated_search(self):
+        first = self.client.get('/hotel/?search=mountains&page_size=1').data
+        second = self.client.get(first['next']).data
+        self.assertEqual(first['results'][0]['id'], self.in_name.id)
+        self.assertEqual(second['results'][0]['id'], self.in_description.id)
+        self.assertIsNone(second['next'])
+
+
+class AvailabilityTestCase(APITestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(email='owner@gmail.com', password='12345', is_owner=True)
+        self.hotel = Hotel.objects.create(name='Hotel', address='Address', description='Description', stars='4', owner=self.owner)
+        self.booked = Room.objects.create(hotel=self.hotel, room_number='101', room_type='Deluxe', capacity=2, price_per_night=100)
+        self.free = Room.objects.create(hotel=self.hotel, room_number='102', room_type='Deluxe', capacity=2, price_per_night=150)
+        self.small = Room.objects.create(hotel=self.hotel, room_number='103', room_type='Standard', capacity=1, price_per_night=50)
+        self.booking = book_room(self.owner, self.booked, datetime(2023, 5, 1).date(), datetime(2023, 5, 5).date(), 2)
+
+    def get_ids(self, query):
+        response = self.client.get(reverse('availability') + query)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [room['id'] for room in response.data['results']]
+
+    def test_free_rooms(self):
+        self.assertEqual(self.get_ids('?check_in=2023-05-03&check_out=2023-05-07&guests=2'), [self.free.id])
+        self.assertEqual(self.get_ids('?check_in=2023-05-05&check_out=2023-05-07&guests=2'), [self.booked.id, self.free.id])
+        self.assertEqual(self.get_ids('?check_in=2023-05-03&check_out=2023-05-07&max_price=120'), [self.small.id])
+        self.assertEqual(self.get_ids('?check_in=2023-05-03&check_out=2023-05-07&stars=5'), [])
+
+    def test_invalid_range(self):
+        response = self.client.get(reverse('availability') + '?check_in=2023-05-07&check_out=2023-05-03')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_room_calendar(self):
+        response = self.client.get(f'/room/{self.booked.id}/calendar/?month=2023-05')
+        self.assertEqual(response.data, {'room': self.booked.id, 'month': '2023-05', 'nights': '1111' + '0' * 27})
+
+    def test_cancel_frees_nights(self):
+        self.client.force_authenticate(user=self.owner)
+        response = self.client.delete(reverse('booking-cancel', kwargs={'pk': self.booking.id}))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(RoomNight.objects.exists())
+        self.hotel.refresh_from_db()
+        self.assertEqual(self.hotel.bookings_count, 0)
+        self.assertEqual(self.get_ids('?check_in=2023-05-03&check_out=2023-05-07&guests=2'), [self.booked.id, self.free.id])
+
+
+
+class ConcurrentBookingTestCase(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='guest@gmail.com', password='12345')
+        self.hotel = Hotel.objects.create(name='Hotel', address='Address', description='Description', stars='3', owner=self.user)
+        self.room = Room.objects.create(hotel=self.hotel, room_number='101', room_type='Deluxe', capacity=2, price_per_night=100)
+
+    def test_only_one_of_concurrent_bookings_wins(self):
+        barrier, results = Barrier(8), []
+
+        def attempt(offset):
+            barrier.wait()
+            check_in = datetime(2023, 5, 1).date() + timedelta(days=offset % 2)
+            try:
+                book_room(self.user, self.room, check_in, check_in + timedelta(days=3), 1)
+                results.append(True)
+            except RoomUnavailable:
+                results.append(False)
+            finally:
+                connection.close()
+
+        threads = [Thread(target=attempt, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results.count(True), 1)
+        self.assertEqual(Booking.objects.count(), 1)
+        self.hotel.refresh_from_db()
+        self.assertEqual(self.hotel.bookings_count, 1)
+
+    def test_rejects_invalid_stay(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        url = reverse('booking-create', kwargs={'room_id': self.room.id})
+        today = timezone.localdate()
+        response = self.client.post(url, {'check_in': today + timedelta(days=3), 'check_out': today + timedelta(days=1), 'guests': 1})
+        self.assertEqual(set(response.data), {'check_out'})
+        response = self.client.post(url, {'check_in': today + timedelta(days=1), 'check_out': today + timedelta(days=3), 'guests': 3})
+        self.assertEqual(set(response.data), {'guests'})
+
+    def test_rejects_past_check_in(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        url = reverse('booking-create', kwargs={'room_id': self.room.id})
+        today = timezone.localdate()
+        response = self.client.post(url, {'check_in': today - timedelta(days=1), 'check_out': today + timedelta(days=1), 'guests': 1})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(set(response.data), {'check_in'})
+
+    @override_settings(MAX_STAY_NIGHTS=10)
+    def test_rejects_too_long_stay(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        url = reverse('booking-create', kwargs={'room_id': self.room.id})
+        today = timezone.localdate()
+        response = self.client.post(url, {'check_in': today, 'check_out': today + timedelta(days=11), 'guests': 1})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(set(response.data), {'check_out'})
+        response = self.client.post(url, {'check_in': today, 'check_out': '9999-12-31', 'guests': 1})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(RoomNight.objects.exists())
+        response = self.client.post(url, {'check_in': today, 'check_out': today + timedelta(days=10), 'guests': 1})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(RoomNight.objects.count(), 10)
+
+
+
+class SeedCatalogTestCase(TestCase):
+    def test_seeds_consistent_catalog(self):
+        options = dict(users=20, owners=3, hotels=6, rooms_per_hotel=4, bookings_per_room=3, likes=30, favorites=10, ratings=30, reviews=15, stdout=StringIO())
+        call_command('seed_catalog', **options)
+
+        self.assertEqual(User.objects.filter(email__startswith='seed-').count(), 20)
+        self.assertEqual(User.objects.filter(email__startswith='seed-', is_owner=True).count(), 3)
+        self.assertEqual(Room.objects.filter(hotel__owner__email__startswith='seed-').count(), 24)
+        self.assertEqual(Booking.objects.count(), 72)
+        self.assertEqual(RoomNight.objects.count(), sum((b.check_out - b.check_in).days for b in Booking.objects.all()))
+        self.assertEqual((Like.objects.count(), HotelRating.objects.count(), Review.objects.count()), (30, 30, 15))
+        self.assertTrue(self.client.login(email='seed-5@example.com', password='loadtest123'))
+        call_command('rebuild_hotel_counters', check=True, stdout=StringIO())
+
+        with self.assertRaises(CommandError):
+            call_command('seed_catalog', **options)
+        call_command('seed_catalog', flush=True, **options)
+        self.assertEqual(Hotel.objects.count(), 6)
+
+
+class LoadTestCommandTestCase(LiveServerTestCase):
+    def test_reports_latency_percentiles(self):
+        call_command('seed_catalog', users=4, owners=1, hotels=3, rooms_per_hotel=2, bookings_per_room=1, likes=2, favorites=0, ratings=2, reviews=2, stdout=StringIO())
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'run.json')
+            call_command('loadtest', url=self.live_server_url, clients=2, requests=40, output=output, stdout=StringIO())
+            again = os.path.join(directory, 'again.json')
+            call_command('loadtest', url=self.live_server_url, clients=2, requests=10, mix='top-hotels=1,hotel-detail=1', async_reads=True, compare=output, output=again, stdout=StringIO())
+            with open(output) as file:
+                results = json.load(file)
+            with open(again) as file:
+                async_results = json.load(file)
+
+        self.assertEqual(results['total']['requests'], 40)
+        self.assertEqual(results['total']['errors'], 0)
+        self.assertEqual(sum(row['requests'] for row in results['scenarios'].values()), 40)
+        self.assertLessEqual(results['total']['p50_ms'], results['total']['p95_ms'])
+        self.assertLessEqual(results['total']['p95_ms'], results['total']['p99_ms'])
+        self.assertGreater(results['total']['throughput_rps'], 0)
+        self.assertTrue(async_results['async_reads'])
+        self.assertEqual((async_results['total']['requests'], async_results['total']['errors']), (10, 0))
+
+
+class BenchResponsesTestCase(TestCase):
+    def test_reports_render_time_and_sizes(self):
+        call_command('seed_catalog', users=4, owners=1, hotels=3, rooms_per_hotel=2, bookings_per_room=3, likes=2, favorites=0, ratings=2, reviews=6, stdout=StringIO())
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'bench.json')
+            call_command('bench_responses', repeat=2, output=output, stdout=StringIO())
+            with open(output) as file:
+                results = json.load(file)
+
+        self.assertEqual(set(results['paths']), {'/hotel/', '/bookings/?expand=room'})
+        hotels = results['paths']['/hotel/']
+        self.assertEqual(hotels['rows'], 3)
+        self.assertLess(hotels['gzip_bytes'], hotels['bytes'])
+        self.assertLess(hotels['br_bytes'], hotels['bytes'])
+
+
+
+@override_settings(IMPORT_BATCH_SIZE=2)
+class CatalogImportTestCase(APITestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(email='chain@gmail.com', password='12345', is_owner=True)
+        self.other = User.objects.create_user(email='other@gmail.com', password='12345', is_owner=True)
+        self.existing = Hotel.objects.create(name='Old', address='A', description='D', stars='3', owner=self.owner)
+        self.foreign = Hotel.objects.create(name='Foreign', address='A', description='D', stars='3', owner=self.other)
+        self.client.force_authenticate(self.owner)
+
+    def upload(self, name, content, **data):
+        return self.client.post(reverse('catalog-import'), {'file': SimpleUploadedFile(name, content.encode()), **data}, format='multipart')
+
+    def test_csv_import(self):
+        content = '\n'.join([
+            'kind,ref,name,address,description,stars,hotel,room_number,room_type,capacity,price_per_night',
+            'hotel,H1,Chain One,Street 1,Nice,4,,,,,',
+            'room,,,,,,H1,101,Standard,2,80',
+            'room,,,,,,H1,102,Deluxe,3,120.50',
+            f'room,,,,,,{self.existing.pk},201,Standard,1,50',
+            f'room,,,,,,{self.foreign.pk},301,Standard,1,50',
+            'room,,,,,,H1,103,Standard,9,80',
+            'hotel,H1,Duplicate,Street 2,Nice,4,,,,,',
+            'suite,,,,,,,,,,',
+            'hotel,H2,Chain Two,Street 3,Fine,5,,,,,',
+            'room,,,,,,H2,1,Standard,2,60',
+        ])
+        response = self.upload('chain.csv', content)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            {key: response.data[key] for key in ('rows', 'hotels_created', 'rooms_created', 'errors_count')},
+            {'rows': 10, 'hotels_created': 2, 'rooms_created': 4, 'errors_count': 4},
+        )
+        self.assertEqual([error['line'] for error in response.data['errors']], [6, 7, 8, 9])
+        self.assertIn('hotel', response.data['errors'][0]['errors'])
+        self.assertIn('capacity', response.data['errors'][1]['errors'])
+        one = Hotel.objects.get(name='Chain One', owner=self.owner)
+        self.assertEqual(sorted(one.rooms.values_list('room_number', flat=True)), ['101', '102'])
+        self.assertEqual(self.existing.rooms.count(), 1)
+        self.assertFalse(self.foreign.rooms.exists())
+        self.assertTrue(HotelLeaderboard.objects.filter(hotel=one, stars='4').exists())
+
+    def test_jsonl_import_reports_broken_lines(self):
+        content = '\n'.join([
+            json.dumps({'kind': 'hotel', 'ref': 'A', 'name': 'Json', 'address': 'S', 'description': 'D', 'stars': 2}),
+            '{not json',
+            '',
+            json.dumps({'kind': 'room', 'hotel': 'A', 'room_number': '1', 'room_type': 'Standard', 'capacity': 1, 'price_per_night': 10}),
+        ])
+        response = self.upload('chain.data', content, format='jsonl')
+        self.assertEqual((response.data['hotels_created'], response.data['rooms_created']), (1, 1))
+        self.assertEqual(response.data['errors'][0]['line'], 2)
+
+    def test_non_ascii_digit_hotel_is_a_row_error(self):
+        content = '\n'.join([
+            'kind,hotel,room_number,room_type,capacity,price_per_night',
+            'room,²,1,Standard,2,60',
+            'room,٣,2,Standard,2,60',
+            f'room,{self.existing.pk},3,Standard,2,60',
+        ])
+        response = self.upload('chain.csv', content)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([error['line'] for error in response.data['errors']], [2, 3])
+        self.assertEqual(response.data['rooms_created'], 1)
+
+    def test_rejects_non_owners_and_unknown_formats(self):
+        self.assertEqual(self.upload('chain.xml', '<hotels/>').status_code, status.HTTP_400_BAD_REQUEST)
+        self.client.force_authenticate(User.objects.create_user(email='guest@gmail.com', password='12345'))
+        self.assertEqual(self.upload('chain.csv', 'kind\n').status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_management_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False) as file:
+            for i in range(5):
+                file.write(json.dumps({'kind': 'room', 'hotel': self.existing.pk, 'room_number': str(i), 'room_type': 'Standard', 'capacity': 1, 'price_per_night': 10}) + '\n')
+        try:
+            call_command('import_catalog', file.name, owner='chain@gmail.com', stdout=StringIO(), stderr=StringIO())
+        finally:
+            os.remove(file.name)
+        self.assertEqual(self.existing.rooms.count(), 5)
+
+
+
+class RoomBatchTestCase(APITestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(email='chain@gmail.com', password='12345', is_owner=True)
+        self.other = User.objects.create_user(email='other@gmail.com', password='12345', is_owner=True)
+        self.hotels = [Hotel.objects.create(name=f'Hotel {i}', address='A', description='D', stars='3', owner=self.owner) for i in range(2)]
+        self.foreign = Hotel.objects.create(name='Foreign', address='A', description='D', stars='3', owner=self.other)
+        self.url = reverse('rooms-batch-create')
+        self.client.force_authenticate(self.owner)
+
+    def room(self, hotel, number, room_type='Deluxe', price='100.00'):
+        return {'hotel': hotel.pk, 'room_number': str(number), 'room_type': room_type, 'capacity': 2, 'price_per_night': price}
+
+    def test_batch_create(self):
+        rooms = [self.room(self.hotels[i % 2], i, 'Deluxe' if i % 3 else 'Standard') for i in range(300)]
+        with self.assertNumQueries(2):
+            response = self.client.post(self.url, {'rooms': rooms}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['created'], 300)
+        self.assertEqual(Room.objects.filter(hotel=self.hotels[0]).count(), 150)
+
+    def test_batch_create_is_all_or_nothing(self):
+        rooms = [self.room(self.hotels[0], 1), self.room(self.foreign, 2)]
+        response = self.client.post(self.url, {'rooms': rooms}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['rooms'][1], {'hotel': ['Нельзя создать комнату в чужом отеле']})
+        self.assertFalse(Room.objects.exists())
+        response = self.client.post(self.url, {'rooms': [self.room(self.hotels[0], 1), {**self.room(self.hotels[0], 2), 'capacity': 9}]}, format='json')
+        self.assertIn('capacity', response.data['rooms'][1])
+
+    def test_batch_update(self):
+        self.client.post(self.url, {'rooms': [self.room(hotel, i, room_type) for hotel in self.hotels for i, room_type in enumerate(['Deluxe', 'Deluxe', 'Standard'])]}, format='json')
+        foreign = Room.objects.create(hotel=self.foreign, room_number='1', room_type='Deluxe', capacity=2, price_per_night=100)
+        with self.assertNumQueries(2):
+            response = self.client.patch(self.url, {'filter': {'hotels': [self.hotels[0].pk], 'room_type': 'Deluxe'}, 'changes': {'price_per_night': '150.00'}}, format='json')
+        self.assertEqual(response.data, {'updated': 2})
+        prices = Room.objects.filter(hotel__in=self.hotels).values_list('hotel', 'room_type', 'price_per_night')
+        self.assertEqual(sorted((h, t, str(p)) for h, t, p in prices), sorted([
+            (self.hotels[0].pk, 'Deluxe', '150.00'), (self.hotels[0].pk, 'Deluxe', '150.00'), (self.hotels[0].pk, 'Standard', '100.00'),
+            (self.hotels[1].pk, 'Deluxe', '100.00'), (self.hotels[1].pk, 'Deluxe', '100.00'), (self.hotels[1].pk, 'Standard', '100.00'),
+        ]))
+
+        response = self.client.patch(self.url, {'filter': {'hotels': [self.hotels[0].pk, self.foreign.pk]}, 'changes': {'capacity': 1}}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.patch(self.url, {'filter': {'hotels': [self.hotels[0].pk]}, 'changes': {}}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        foreign.refresh_from_db()
+        self.assertEqual(foreign.capacity, 2)
+
+    def test_requires_owner(self):
+        self.client.force_authenticate(User.objects.create_user(email='guest@gmail.com', password='12345'))
+        self.assertEqual(self.client.post(self.url, {'rooms': [self.room(self.hotels[0], 1)]}, format='json').status_code, status.HTTP_403_FORBIDDEN)
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.patch(self.url, {}, format='json').status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+
+@override_settings(EXPORT_CHUNK_SIZE=2)
+class BookingExportTestCase(APITestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(email='owner@gmail.com', password='12345', is_owner=True)
+        self.guest = User.objects.create_user(email='guest@gmail.com', password='12345')
+        self.hotels = [Hotel.objects.create(name=f'Hotel {i}', address='A', description='D', stars='3', owner=self.owner) for i in range(2)]
+        self.rooms = [Room.objects.create(hotel=hotel, room_number='1', room_type='Deluxe', capacity=2, price_per_night=100) for hotel in self.hotels]
+        start = datetime(2023, 5, 1).date()
+        for i in range(5):
+            book_room(self.guest, self.rooms[i % 2], start + timedelta(days=i * 3), start + timedelta(days=i * 3 + 2), 1)
+        book_room(self.owner, self.rooms[0], start + timedelta(days=20), start + timedelta(days=21), 2)
+
+    def export(self, user, fmt, **params):
+        self.client.force_authenticate(user)
+        response = self.client.get(reverse('booking-export', kwargs={'fmt': fmt}), params)
+        if response.status_code != 200:
+            return response, None
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_csv_export_of_own_bookings(self):
+        response, content = self.export(self.guest, 'csv')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('attachment; filename="bookings-', response['Content-Disposition'])
+        rows = list(csv.DictReader(content.splitlines()))
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[0]['hotel'], 'Hotel 0')
+        self.assertEqual(rows[0]['user'], 'guest@gmail.com')
+        self.assertEqual((rows[0]['check_in'], rows[0]['total_cost']), ('2023-05-01', '200.00'))
+
+    def test_csv_neutralizes_formulas(self):
+        Hotel.objects.filter(pk=self.hotels[0].pk).update(name='=HYPERLINK("http://evil.example","x")')
+        Room.objects.filter(pk=self.rooms[0].pk).update(room_type='@SUM(1+1)')
+        rows = list(csv.DictReader(self.export(self.guest, 'csv')[1].splitlines()))
+        self.assertEqual(rows[0]['hotel'], '\'=HYPERLINK("http://evil.example","x")')
+        self.assertEqual(rows[0]['room_type'], "'@SUM(1+1)")
+        self.assertEqual(rows[1]['hotel'], 'Hotel 1')
+        # the NDJSON export stays as is
+        rows = [json.loads(line) for line in self.export(self.guest, 'ndjson')[1].splitlines()]
+        self.assertEqual(rows[0]['room_type'], '@SUM(1+1)')
+
+    def test_ndjson_export_of_hotel_bookings(self):
+        _, content = self.export(self.owner, 'ndjson', scope='hotels', hotel=self.hotels[0].pk, date_from='2023-05-02', date_to='2023-05-21')
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual([row['check_in'] for row in rows], ['2023-05-07', '2023-05-13', '2023-05-21'])
+        self.assertEqual({row['hotel_id'] for row in rows}, {self.hotels[0].pk})
+        self.assertEqual(rows[-1]['user'], 'owner@gmail.com')
+        self.assertEqual(rows[0]['total_cost'], '200.00')
+
+    def test_rejects_bad_requests(self):
+        self.assertEqual(self.export(self.guest, 'csv', scope='hotels')[0].status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.export(self.guest, 'xlsx')[0].status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.export(self.owner, 'csv', date_from='2023-05-10', date_to='2023-05-01')[0].status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.export(None, 'csv')[0].status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+
+class DailyStatsTestCase(APITestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(email='owner@gmail.com', password='12345', is_owner=True)
+        self.guest = User.objects.create_user(email='guest@gmail.com', password='12345')
+        self.hotel = Hotel.objects.create(name='Hotel', address='A', description='D', stars='3', owner=self.owner)
+        self.rooms = [Room.objects.create(hotel=self.hotel, room_number=str(i), room_type='Deluxe', capacity=2, price_per_night=100 + i * 50) for i in range(2)]
+        self.start = datetime(2023, 5, 1).date()
+        # room 0: May 1-3 and May 30 - June 2, room 1: May 2-4 (cancelled) and May 10-11
+        self.book(0, 0, 2)
+        self.book(0, 29, 3)
+        self.cancelled = self.book(1, 1, 2)
+        self.book(1, 9, 1)
+        self.cancelled = Booking.objects.select_related('room').get(pk=self.cancelled.pk)
+        cancel_booking(self.cancelled)
+
+    def book(self, room, offset, nights):
+        check_in = self.start + timedelta(days=offset)
+        return book_room(self.guest, self.rooms[room], check_in, check_in + timedelta(days=nights), 1)
+
+    def stats(self):
+        return list(HotelDailyStats.objects.filter(hotel=self.hotel).order_by('date').values_list('date', 'nights_sold', 'revenue', 'bookings'))
+
+    def test_stats_are_maintained_incrementally(self):
+        stats = {day: (nights, revenue) for day, nights, revenue, _ in self.stats()}
+        self.assertEqual(stats[self.start], (1, 100))
+        self.assertEqual(stats[self.start + timedelta(days=1)], (1, 100))
+        self.assertEqual(stats[self.start + timedelta(days=2)], (0, 0))
+        self.assertEqual(stats[self.start + timedelta(days=9)], (1, 150))
+        self.assertEqual(sum(nights for nights, _ in stats.values()), 6)
+        self.assertEqual(HotelDailyStats.objects.get(hotel=self.hotel, date=timezone.localdate()).bookings, 3)
+
+        incremental = [row for row in self.stats() if row[1] or row[3]]
+        call_command('rebuild_daily_stats', stdout=StringIO())
+        self.assertEqual(self.stats(), incremental)
+
+    def test_second_cancel_changes_nothing(self):
+        # a retry through a stale instance: the row is gone, nothing may move twice
+        before = [row for row in self.stats() if row[1] or row[3]]
+        self.assertFalse(cancel_booking(self.cancelled))
+        self.hotel.refresh_from_db()
+        self.assertEqual(self.hotel.bookings_count, Booking.objects.filter(room__hotel=self.hotel).count())
+        self.assertEqual([row for row in self.stats() if row[1] or row[3]], before)
+
+        booking = self.book(0, 40, 1)
+        self.client.force_authenticate(self.guest)
+        url = reverse('booking-cancel', kwargs={'pk': booking.pk})
+        self.assertEqual(self.client.delete(url).status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.client.delete(url).status_code, status.HTTP_404_NOT_FOUND)
+        self.hotel.refresh_from_db()
+        self.assertEqual(self.hotel.bookings_count, 3)
+
+    def test_analytics(self):
+        url = reverse('owner-analytics')
+        self.client.force_authenticate(self.owner)
+        with self.assertNumQueries(3):
+            response = self.client.get(url, {'hotel': self.hotel.pk, 'from': '2023-05-01', 'to': '2023-06-30', 'granularity': 'month'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['rooms'], 2)
+        may, june = response.data['periods']
+        self.assertEqual((may['nights_sold'], may['revenue'], may['occupancy']), (5, '550.00', round(5 / 62, 4)))
+        self.assertEqual((june['nights_sold'], june['revenue']), (1, '100.00'))
+        self.assertEqual(response.data['totals']['nights_sold'], 6)
+
+        response = self.client.get(url, {'from': '2023-05-03', 'to': '2023-05-14', 'granularity': 'week'})
+        self.assertEqual([(str(p['period']), p['nights_sold']) for p in response.data['periods']], [('2023-05-01', 0), ('2023-05-08', 1)])
+        self.assertEqual(response.data['periods'][0]['occupancy'], 0)
+
+        response = self.client.get(url)
+        self.assertEqual(len(response.data['periods']), 30)
+        self.assertEqual(response.data['totals']['bookings'], 3)
+
+    def test_analytics_rejects_foreign_hotels(self):
+        other = User.objects.create_user(email='other@gmail.com', password='12345', is_owner=True)
+        self.client.force_authenticate(other)
+        response = self.client.get(reverse('owner-analytics'), {'hotel': self.hotel.pk})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.client.force_authenticate(self.guest)
+        self.assertEqual(self.client.get(reverse('owner-analytics')).status_code, status.HTTP_403_FORBIDDEN)
+
+
+
+class ImageVariantsTestCase(APITestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        override = override_settings(MEDIA_ROOT=media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.owner = User.objects.create_user(email='owner@gmail.com', password='12345', is_owner=True)
+        self.client.force_authenticate(self.owner)
+
+    def photo(self, name='photo.jpg', size=(2400, 1800), format='JPEG'):
+        buffer = BytesIO()
+        Image.new('RGB', size, (200, 120, 40)).save(buffer, format)
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type=f'image/{format.lower()}')
+
+    def test_variants_are_rendered_after_upload(self):
+        response = self.client.post('/hotel/', {'name': 'Hotel', 'address': 'A', 'description': 'D', 'stars': '3', 'image': self.photo()}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['image_variants'], {})
+        hotel = Hotel.objects.get(pk=response.data['id'])
+        self.assertTrue(hotel.image_pending)
+
+        call_command('process_images', stdout=StringIO())
+        hotel.refresh_from_db()
+        self.assertFalse(hotel.image_pending)
+        self.assertEqual(set(hotel.image_variants), {'thumb', 'card', 'full'})
+        with default_storage.open(hotel.image_variants['thumb']['webp']) as file, Image.open(file) as image:
+            self.assertEqual((image.format, image.size), ('WEBP', (160, 120)))
+        with default_storage.open(hotel.image_variants['full']['jpeg']) as file, Image.open(file) as image:
+            self.assertEqual((image.format, image.size), ('JPEG', (1600, 1200)))
+
+        variants = self.client.get(f'/hotel/{hotel.pk}/').data['image_variants']
+        self.assertTrue(variants['card']['webp'].startswith('http://testserver/media/hotel_image/variants/'))
+        listed = self.client.get('/hotel/', {'fields': 'id,image_variants'}).data['results'][0]
+        self.assertEqual(listed['image_variants'], variants)
+
+        # a new upload replaces the variants and removes the old files
+        old = [path for files in hotel.image_variants.values() for path in files.values()]
+        self.client.patch(f'/hotel/{hotel.pk}/', {'image': self.photo('new.png', (300, 300), 'PNG')}, format='multipart')
+        hotel.refresh_from_db()
+        self.assertTrue(hotel.image_pending)
+        call_command('process_images', stdout=StringIO())
+        hotel.refresh_from_db()
+        self.assertFalse(any(default_storage.exists(path) for path in old))
+        self.assertIn('new-thumb', hotel.image_variants['thumb']['jpeg'])
+
+    def test_broken_upload_is_skipped(self):
+        hotel = Hotel.objects.create(name='Hotel', address='A', description='D', stars='3', owner=self.owner, image=SimpleUploadedFile('broken.jpg', b'not an image'))
+        self.assertTrue(hotel.image_pending)
+        with self.assertLogs('hotels.images', 'WARNING'):
+            call_command('process_images', stdout=StringIO())
+        hotel.refresh_from_db()
+        self.assertEqual((hotel.image_pending, hotel.image_variants), (False, {}))
+
+
+class AsyncViewsTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        call_command('seed_catalog', users=6, owners=2, hotels=5, rooms_per_hotel=3, bookings_per_room=2, likes=10, favorites=8, ratings=10, reviews=10, stdout=StringIO())
+        cls.user = Favorite.objects.order_by('id').first().user
+        cls.token = Token.objects.create(user=cls.user)
+        cls.hotel = Hotel.objects.order_by('id').first()
+
+    def test_same_responses_as_sync_views(self):
+        check_in = timezone.localdate() + timedelta(days=400)
+        paths = (
+            '/hotel/?page_size=2', '/hotel/?stars=9', '/hotel/?search=море', f'/hotel/{self.hotel.pk}/?fields=id,name,reviews',
+            '/top-hotels/?limit=3', f'/availability/?check_in={check_in}&check_out={check_in + timedelta(days=2)}&page_size=4', '/favorites/',
+        )
+        for path in paths:
+            sync = self.client.get(path, HTTP_AUTHORIZATION=f'Token {self.token.key}')
+            response = self.client.get(f'/async{path}', HTTP_AUTHORIZATION=f'Token {self.token.key}')
+            self.assertEqual(response.status_code, sync.status_code, path)
+            # only the pagination links point elsewhere
+            self.assertEqual(response.content.replace(b'/async/', b'/'), sync.content, path)
+
+    async def test_async_client(self):
+        headers = {'Authorization': f'Token {self.token.key}'}
+        response = await self.async_client.get('/async/favorites/', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({row['user'] for row in response.json()['results']}, {self.user.email})
+
+        response = await self.async_client.get(f'/async/hotel/{self.hotel.pk}/')
+        self.assertEqual(response.json()['id'], self.hotel.pk)
+        response = await self.async_client.get(f'/async/hotel/{self.hotel.pk}/', headers={'If-None-Match': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual((await self.async_client.get('/async/hotel/0/')).status_code, 404)
+
+        response = await self.async_client.get('/async/favorites/')
+        self.assertEqual((response.status_code, response['WWW-Authenticate']), (401, 'Token'))
+        response = await self.async_client.get('/async/hotel/', headers={'Authorization': 'Token wrong'})
+        self.assertEqual(response.status_code, 401)
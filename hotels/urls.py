@@ -1,17 +1,29 @@
 from rest_framework.routers import DefaultRouter
-from django.views.decorators.cache import cache_page
 from django.urls import path, include
-from .views import HotelViewSet, RoomViewSet, BookingCreateAPIView, BookingListAPIView, TopHotelsAPIView, FavoriteListAPIView
+from .async_views import AvailabilityView, FavoriteListView, HotelDetailView, HotelListView, TopHotelsView
+from .views import AvailabilityAPIView, BookingExportAPIView, CatalogImportAPIView, HotelViewSet, OwnerAnalyticsAPIView, ReviewViewSet, RoomViewSet, BookingCancelAPIView, BookingCreateAPIView, BookingListAPIView, TopHotelsAPIView, FavoriteListAPIView
 
 
 router = DefaultRouter()
 router.register('hotel', HotelViewSet, 'hotels')
 router.register('room', RoomViewSet, 'rooms')
+router.register('review', ReviewViewSet, 'reviews')
 
 urlpatterns = [
     path('', include(router.urls)),
     path('bookings/<int:room_id>/', BookingCreateAPIView.as_view(), name='booking-create'),
+    path('bookings/<int:pk>/cancel/', BookingCancelAPIView.as_view(), name='booking-cancel'),
     path('bookings/', BookingListAPIView.as_view(), name='booking-history'),
-    path('top-hotels/', cache_page(60 * 5)(TopHotelsAPIView.as_view()), name='top-hotels'),
-    path('favorites/', FavoriteListAPIView.as_view(), name='favorites')
+    path('bookings/export/<str:fmt>/', BookingExportAPIView.as_view(), name='booking-export'),
+    path('top-hotels/', TopHotelsAPIView.as_view(), name='top-hotels'),
+    path('favorites/', FavoriteListAPIView.as_view(), name='favorites'),
+    path('availability/', AvailabilityAPIView.as_view(), name='availability'),
+    path('import/', CatalogImportAPIView.as_view(), name='catalog-import'),
+    path('owner/analytics/', OwnerAnalyticsAPIView.as_view(), name='owner-analytics'),
+    # async versions of the read-heavy endpoints, for the ASGI workers (see Procfile)
+    path('async/hotel/', HotelListView.as_view(), name='async-hotels-list'),
+    path('async/hotel/<int:pk>/', HotelDetailView.as_view(), name='async-hotels-detail'),
+    path('async/top-hotels/', TopHotelsView.as_view(), name='async-top-hotels'),
+    path('async/availability/', AvailabilityView.as_view(), name='async-availability'),
+    path('async/favorites/', FavoriteListView.as_view(), name='async-favorites'),
 ]
\ No newline at end of file
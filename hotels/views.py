@@ -1,34 +1,58 @@
+from calendar import monthrange
+from datetime import datetime, timedelta
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404, render
+from django.utils import timezone
 from rest_framework.viewsets import ModelViewSet
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import filters, status, generics
-from rest_framework.exceptions import ValidationError, PermissionDenied
+from rest_framework.exceptions import NotFound, ValidationError, PermissionDenied
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.decorators import action
-from django.db.models import Avg, Count
+from rest_framework.parsers import MultiPartParser
+from django.db import transaction
+from django.db.models import DateField, Sum
+from django.db.models.functions import Trunc
 from django.conf import settings
-from django.core.mail import send_mail
-from django.views.decorators.cache import cache_page
 
-from hotels.models import Booking, Favorite, Hotel, Like, Review, Room
+from hotels.booking import RoomUnavailable, book_room, cancel_booking
+from hotels.export import BOOKING_COLUMNS, FORMATS as EXPORT_FORMATS, export_rows, stream_export
+from hotels.importer import FORMATS, CatalogImport, ImportFormatError, import_format, read_rows
+from hotels.mixins import ConditionalGetMixin, FlexFieldsViewMixin
+from hotels.models import Booking, Favorite, Hotel, HotelDailyStats, Like, Review, Room, RoomNight
+from hotels.pagination import BookingPagination, FavoritePagination, HotelPagination, ReviewPagination, RoomPagination
 from hotels.permissions import IsAuthor, IsOwner, IsOwnerAndAuthor, IsHisHotel
-from hotels.serializers import BookingSerializer, FavoriteSerializer, HotelSerializer, LikeSerializer, RatingSerializer, ReviewSerializer, RoomSerializer
+from hotels.search import HotelSearchFilter, statement_timeout
+from hotels.serializers import AvailabilitySerializer, BookingExportSerializer, BookingSerializer, FavoriteSerializer, HotelSerializer, LikeSerializer, OwnerAnalyticsSerializer, RatingSerializer, ReviewCreateSerializer, ReviewSerializer, RoomBatchCreateSerializer, RoomBatchUpdateSerializer, RoomSerializer, TopHotelsSerializer
+from notifications.outbox import enqueue_email
 
 # from .tasks import send_booking_confirmation_email
 # Create your views here.
 
 
 
-class HotelViewSet(ModelViewSet):
+class HotelViewSet(ConditionalGetMixin, FlexFieldsViewMixin, ModelViewSet):
     queryset = Hotel.objects.all()
     serializer_class = HotelSerializer
-    filter_backends = [filters.SearchFilter, DjangoFilterBackend]
+    pagination_class = HotelPagination
+    filter_backends = [HotelSearchFilter, DjangoFilterBackend]
     filterset_fields = ['stars']
     search_fields = ['name', 'description']
+    # see core.querybudget; destroy cascades through every child table and keeps the default
+    query_budget = {
+        'list': 7, 'retrieve': 5, 'create': 6, 'update': 7, 'partial_update': 7,
+        'like': 8, 'favorite': 7, 'rate_hotel': 8, 'review': 6,
+    }
 
 
+    def list(self, request, *args, **kwargs):
+        if not request.query_params.get('search'):
+            return super().list(request, *args, **kwargs)
+        with statement_timeout(settings.HOTEL_SEARCH_TIMEOUT_MS):
+            return super().list(request, *args, **kwargs)
+
     def get_permissions(self):
         if self.action == 'rate_hotel' or self.action == 'like' or self.action == 'favorite' or self.action == 'review':
             self.permission_classes = [IsAuthenticated]
@@ -63,13 +87,17 @@ class HotelViewSet(ModelViewSet):
         if request.method == 'POST':
             serializer = ReviewSerializer(data=request.data, context={'request': request})
             serializer.is_valid(raise_exception=True)
-            serializer.save(user=request.user, hotel=hotel)
+            with transaction.atomic():
+                serializer.save(user=request.user, hotel=hotel)
+                Hotel.objects.bump(hotel.pk, reviews_count=1)
             return Response(serializer.data)
         if request.method == 'DELETE':
             review = get_object_or_404(Review.objects.filter(id=pk))
-            if request.user != review.user:
+            if review.user_id != request.user.pk:
                 return Response({'error': 'Нельзя удалить чужой отзыв'}, status=403)
-            review.delete()
+            with transaction.atomic():
+                review.delete()
+                Hotel.objects.bump(review.hotel_id, reviews_count=-1)
             return Response({'message': 'Ваш отзыв удален'})
 
     
@@ -79,21 +107,25 @@ class HotelViewSet(ModelViewSet):
         hotel = self.get_object()
         serializer = RatingSerializer(data=request.data, context={'request': request, 'hotel': hotel})
         serializer.is_valid(raise_exception=True)
-        serializer.save(hotel=hotel)
+        with transaction.atomic():
+            rating = serializer.save(hotel=hotel)
+            Hotel.objects.bump(hotel.pk, rating_sum=rating.rate, rating_count=1)
         return Response(serializer.data)
     
 
     @action(methods=['POST'], detail=True)
     def like(self, request, pk=None):
         hotel = self.get_object()
-        like = Like.objects.filter(user=request.user, hotel=hotel)
-        if like.exists():
-            like.delete()
-            liked = False
-        else:
-            Like.objects.create(user=request.user, hotel=hotel)
-            liked = True
-        likes_count = Like.objects.filter(hotel=hotel).count()
+        with transaction.atomic():
+            deleted, _ = Like.objects.filter(user=request.user, hotel=hotel).delete()
+            if deleted:
+                Hotel.objects.bump(hotel.pk, likes_count=-1)
+                liked = False
+            else:
+                Like.objects.create(user=request.user, hotel=hotel)
+                Hotel.objects.bump(hotel.pk, likes_count=1)
+                liked = True
+        likes_count = Hotel.objects.filter(pk=hotel.pk).values_list('likes_count', flat=True).get()
         response_data = {'liked': liked, 'likes_count': likes_count}
         return Response(response_data)
     
@@ -101,83 +133,176 @@ class HotelViewSet(ModelViewSet):
     @action(methods=['POST'], detail=True)
     def favorite(self, request, pk=None):
         hotel = self.get_object()
-        favor = Favorite.objects.filter(user=request.user, hotel=hotel)
-        if favor.exists():
-            favor.delete()
-            favor = False
-        else:
-            Favorite.objects.create(user=request.user, hotel=hotel)
-            favor = True
+        with transaction.atomic():
+            deleted, _ = Favorite.objects.filter(user=request.user, hotel=hotel).delete()
+            if deleted:
+                Hotel.objects.bump(hotel.pk, favorites_count=-1)
+                favor = False
+            else:
+                Favorite.objects.create(user=request.user, hotel=hotel)
+                Hotel.objects.bump(hotel.pk, favorites_count=1)
+                favor = True
 
         return Response({'In Favorite': favor})
     
 
 
-class TopHotelsAPIView(generics.ListAPIView):
+class TopHotelsAPIView(FlexFieldsViewMixin, generics.ListAPIView):
     serializer_class = HotelSerializer
+    pagination_class = None
+    query_budget = 4
 
     def get_queryset(self):
-        return Hotel.objects.annotate(num_bookings=Count('bookings_count'), avg_rating=Avg('ratings__rate')).order_by('-num_bookings', '-avg_rating')[:5]
+        if getattr(self, 'swagger_fake_view', False):
+            return Hotel.objects.none()
+        params = TopHotelsSerializer(data=self.request.query_params)
+        params.is_valid(raise_exception=True)
+        params = params.validated_data
+        # top k straight off the leaderboard score index, no aggregation. Hotels without a
+        # leaderboard row yet (bulk imports until the next rebuild) are left out, the
+        # outer join would sort their NULL score first
+        hotels = Hotel.objects.filter(leaderboard__isnull=False).order_by('-leaderboard__score', 'id')
+        if params.get('stars'):
+            hotels = hotels.filter(leaderboard__stars=params['stars'])
+        return hotels[:params['limit']]
     
     
 
 
 
-class RoomViewSet(ModelViewSet):
+class RoomViewSet(ConditionalGetMixin, FlexFieldsViewMixin, ModelViewSet):
     queryset = Room.objects.all()
     serializer_class = RoomSerializer
+    pagination_class = RoomPagination
+    # ?expand=hotel embeds the hotel
+    version_fields = ('updated_at', 'hotel__updated_at')
+    query_budget = {
+        'list': 3, 'retrieve': 3, 'calendar': 3, 'create': 3, 'update': 3, 'partial_update': 3, 'destroy': 7,
+        'batch_create': 3, 'batch_update': 3,
+    }
 
 
     def get_permissions(self):
-        if self.request.method in ['PUT', 'PATCH', 'DELETE']:
+        if self.action in ('batch_create', 'batch_update'):
+            self.permission_classes = [IsOwner]
+        elif self.request.method in ['PUT', 'PATCH', 'DELETE']:
             self.permission_classes = [IsHisHotel]
         return super().get_permissions()
 
+    def get_serializer_class(self):
+        if self.action == 'batch_create':
+            return RoomBatchCreateSerializer
+        elif self.action == 'batch_update':
+            return RoomBatchUpdateSerializer
+        return super().get_serializer_class()
+
+    def get_queryset(self):
+        # IsHisHotel reads room.hotel.owner_id
+        if self.request.method in ['PUT', 'PATCH', 'DELETE']:
+            return super().get_queryset().select_related('hotel')
+        return super().get_queryset()
+
+
+    @action(methods=['GET'], detail=True)
+    def calendar(self, request, pk=None):
+        room = self.get_object()
+        month = request.query_params.get('month')
+        try:
+            first = datetime.strptime(month, '%Y-%m').date() if month else timezone.localdate().replace(day=1)
+        except ValueError:
+            raise ValidationError({'month': 'Укажите месяц в формате ГГГГ-ММ'})
+        days = monthrange(first.year, first.month)[1]
+        booked = set(RoomNight.objects.filter(room=room, night__gte=first, night__lt=first + timedelta(days=days)).values_list('night', flat=True))
+        nights = ''.join('1' if first + timedelta(days=i) in booked else '0' for i in range(days))
+        return Response({'room': room.id, 'month': first.strftime('%Y-%m'), 'nights': nights})
+
+    # Batch endpoints for owners: ownership is checked with one query for all hotels
+    # involved, then the rooms are written with a single INSERT or UPDATE.
+    #   POST  /room/batch/ {"rooms": [{"hotel": 5, "room_number": "101", ...}, ...]}
+    #   PATCH /room/batch/ {"filter": {"hotels": [5], "room_type": "Deluxe"}, "changes": {"price_per_night": "150.00"}}
+    @action(methods=['POST'], detail=False, url_path='batch')
+    def batch_create(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        rooms = Room.objects.bulk_create([
+            Room(hotel_id=room.pop('hotel'), **room) for room in serializer.validated_data['rooms']
+        ])
+        return Response({'created': len(rooms), 'ids': [room.pk for room in rooms]}, status=status.HTTP_201_CREATED)
+
+    @batch_create.mapping.patch
+    def batch_update(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        filter, changes = serializer.validated_data['filter'], serializer.validated_data['changes']
+        rooms = Room.objects.filter(hotel_id__in=filter['hotels'])
+        if 'ids' in filter:
+            rooms = rooms.filter(pk__in=filter['ids'])
+        for field in ('room_type', 'capacity'):
+            if field in filter:
+                rooms = rooms.filter(**{field: filter[field]})
+        # update() skips auto_now, the ETags of the rooms need a new updated_at
+        updated = rooms.update(**changes, updated_at=timezone.now())
+        return Response({'updated': updated})
+
 
     
 
+class CatalogImportAPIView(APIView):
+    # multipart upload `file` (CSV or JSONL, see hotels.importer.CatalogImport), format
+    # from the file extension or `format`; answers with a per-row error report
+    permission_classes = [IsOwner]
+    parser_classes = [MultiPartParser]
+    # a fixed number of queries per chunk, the total grows with the file
+    query_budget = False
+
+    def post(self, request):
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'file': ['Загрузите файл CSV или JSONL']}, status=status.HTTP_400_BAD_REQUEST)
+        format = request.data.get('format') or import_format(upload.name)
+        if format not in FORMATS:
+            return Response({'format': [f'Поддерживаются форматы: {", ".join(FORMATS)}']}, status=status.HTTP_400_BAD_REQUEST)
+
+        importer = CatalogImport(request.user)
+        try:
+            report = importer.run(read_rows(upload, format))
+        except ImportFormatError as exc:
+            # chunks before the broken part are already imported
+            return Response({**importer.report(), 'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(report)
+
+
 class BookingCreateAPIView(generics.CreateAPIView):
     queryset = Booking.objects.all()
     serializer_class = BookingSerializer
     permission_classes = [IsAuthenticated]
+    query_budget = 12
 
     def post(self, request, *args, **kwargs):
         room_id = kwargs.get('room_id')
         try:
-            room = Room.objects.get(id=room_id)
+            room = Room.objects.select_related('hotel').get(id=room_id)
             hotel = room.hotel
         except Room.DoesNotExist:
             return Response({'message': 'Комната не найдена'}, status=status.HTTP_404_NOT_FOUND)
 
-        serializer = self.get_serializer(data=request.data)
+        serializer = self.get_serializer(data=request.data, context={'request': request, 'room': room})
         serializer.is_valid(raise_exception=True)
 
         check_in = serializer.validated_data['check_in']
         check_out = serializer.validated_data['check_out']
-        
-        if Booking.objects.filter(room=room, check_in__lte=check_out, check_out__gte=check_in).exists():
-            return Response({'message': 'Комната уже забронирована на указанный период времени.'}, status=status.HTTP_400_BAD_REQUEST)
-
-        booking = Booking(
-            user=self.request.user,
-            room=room,
-            check_in=check_in,
-            check_out=check_out,
-            guests=serializer.validated_data['guests'],
-            total_cost=room.price_per_night * (check_out - check_in).days,
-        )
-        booking.save()
-        room.status = 'Booked'
-        room.save()
-        hotel.bookings_count += 1 
-        hotel.save()
-        print(room.price_per_night * (check_out - check_in).days)
 
         subject = 'Ваша комната забронирована'
         message = f'Здравствуйте, вы успешно забронировали комнату {room.room_number} отеля {hotel.name}, с {check_in} по {check_out}. Сумма оплаты: {room.price_per_night * (check_out - check_in).days} сом. Спасибо что выбрали наш сервис!'
-        from_email = settings.EMAIL_HOST_USER
         recipient_list = [self.request.user.email]
-        send_mail(subject, message, from_email, recipient_list)
+
+        try:
+            # the confirmation is queued in the booking's transaction and sent by send_outbox
+            with transaction.atomic():
+                book_room(self.request.user, room, check_in, check_out, serializer.validated_data['guests'])
+                enqueue_email(subject, message, recipient_list)
+        except RoomUnavailable:
+            return Response({'message': 'Комната уже забронирована на указанный период времени.'}, status=status.HTTP_400_BAD_REQUEST)
 
         # send_booking_confirmation_email.delay(self.request.user.email, hotel.name, room.room_number, check_in, check_out, room.price_per_night * (check_out - check_in).days)
 
@@ -187,18 +312,157 @@ class BookingCreateAPIView(generics.CreateAPIView):
     
 
 
-class BookingListAPIView(generics.ListAPIView):
+class AvailabilityAPIView(FlexFieldsViewMixin, generics.ListAPIView):
+    serializer_class = RoomSerializer
+    pagination_class = RoomPagination
+    query_budget = 2
+
+    def get_queryset(self):
+        if getattr(self, 'swagger_fake_view', False):
+            return Room.objects.none()
+        params = AvailabilitySerializer(data=self.request.query_params)
+        params.is_valid(raise_exception=True)
+        params = params.validated_data
+        rooms = Room.objects.available(params['check_in'], params['check_out']).filter(capacity__gte=params['guests'])
+        if params.get('stars'):
+            rooms = rooms.filter(hotel__stars=params['stars'])
+        if params.get('max_price') is not None:
+            rooms = rooms.filter(price_per_night__lte=params['max_price'])
+        return rooms
+
+
+
+class BookingCancelAPIView(generics.DestroyAPIView):
+    permission_classes = [IsAuthenticated]
+    query_budget = 9
+
+    def get_queryset(self):
+        return Booking.objects.filter(user=self.request.user).select_related('room')
+
+    def perform_destroy(self, instance):
+        cancel_booking(instance)
+
+
+
+class BookingListAPIView(FlexFieldsViewMixin, generics.ListAPIView):
     serializer_class = BookingSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = BookingPagination
+    query_budget = 2
 
     def get_queryset(self):
         user = self.request.user
         return Booking.objects.filter(user=user)
     
 
-class FavoriteListAPIView(generics.ListAPIView):
+class BookingExportAPIView(APIView):
+    # ?scope=mine|hotels&hotel=<id>&date_from=&date_to= (check-in dates, inclusive).
+    # The rows are read and written while the response streams, EXPORT_CHUNK_SIZE at a time.
+    permission_classes = [IsAuthenticated]
+    query_budget = 2
+
+    def get(self, request, fmt):
+        if fmt not in EXPORT_FORMATS:
+            raise NotFound(f'Поддерживаются форматы: {", ".join(EXPORT_FORMATS)}')
+        params = BookingExportSerializer(data=request.query_params, context={'request': request})
+        params.is_valid(raise_exception=True)
+        params = params.validated_data
+
+        if params['scope'] == 'hotels':
+            bookings = Booking.objects.filter(room__hotel__owner=request.user)
+        else:
+            bookings = Booking.objects.filter(user=request.user)
+        if 'hotel' in params:
+            bookings = bookings.filter(room__hotel=params['hotel'])
+        if 'date_from' in params:
+            bookings = bookings.filter(check_in__gte=params['date_from'])
+        if 'date_to' in params:
+            bookings = bookings.filter(check_in__lte=params['date_to'])
+        bookings = bookings.order_by('check_in', 'id')
+
+        response = StreamingHttpResponse(
+            stream_export(export_rows(bookings, BOOKING_COLUMNS), BOOKING_COLUMNS, fmt), content_type=EXPORT_FORMATS[fmt],
+        )
+        response['Content-Disposition'] = f'attachment; filename="bookings-{timezone.localdate():%Y-%m-%d}.{fmt}"'
+        return response
+
+
+def analytics_periods(start, end, granularity):
+    # [(first day of the period, days of it within start..end)] covering start..end
+    periods = []
+    day = start
+    while day <= end:
+        if granularity == 'month':
+            period = day.replace(day=1)
+            following = (period + timedelta(days=32)).replace(day=1)
+        elif granularity == 'week':
+            period = day - timedelta(days=day.weekday())
+            following = period + timedelta(days=7)
+        else:
+            period, following = day, day + timedelta(days=1)
+        last = min(following - timedelta(days=1), end)
+        periods.append((period, (last - day).days + 1))
+        day = following
+    return periods
+
+
+class OwnerAnalyticsAPIView(APIView):
+    # Occupancy, nights sold, revenue and new bookings of the owner's hotels (or one of
+    # them) per day, week or month, summed from HotelDailyStats: a year of one hotel is
+    # at most 366 index-ordered rows, however many bookings it had.
+    permission_classes = [IsOwner]
+    query_budget = 4
+
+    def get(self, request):
+        params = OwnerAnalyticsSerializer(data=request.query_params, context={'request': request})
+        params.is_valid(raise_exception=True)
+        params = params.validated_data
+        start, end, granularity = params['from'], params['to'], params['granularity']
+
+        hotels = Hotel.objects.filter(owner=request.user)
+        if 'hotel' in params:
+            hotels = hotels.filter(pk=params['hotel'])
+        rooms = Room.objects.filter(hotel__in=hotels).count()
+        rows = (
+            HotelDailyStats.objects.filter(hotel__in=hotels, date__range=(start, end))
+            .annotate(period=Trunc('date', granularity, output_field=DateField()))
+            .values('period')
+            .annotate(nights_sold=Sum('nights_sold'), revenue=Sum('revenue'), bookings=Sum('bookings'))
+            .order_by()
+        )
+        stats = {row['period']: row for row in rows}
+
+        def entry(nights_sold, revenue, bookings, days):
+            return {
+                'nights_sold': nights_sold,
+                'revenue': f'{revenue:.2f}',
+                'bookings': bookings,
+                'occupancy': round(nights_sold / (rooms * days), 4) if rooms else None,
+            }
+
+        periods, totals = [], {'nights_sold': 0, 'revenue': 0, 'bookings': 0}
+        for period, days in analytics_periods(start, end, granularity):
+            row = stats.get(period, {})
+            values = {name: row.get(name) or 0 for name in totals}
+            for name, value in values.items():
+                totals[name] += value
+            periods.append({'period': period, **entry(days=days, **values)})
+        return Response({
+            'hotel': params.get('hotel'),
+            'from': start,
+            'to': end,
+            'granularity': granularity,
+            'rooms': rooms,
+            'totals': entry(days=(end - start).days + 1, **totals),
+            'periods': periods,
+        })
+
+
+class FavoriteListAPIView(FlexFieldsViewMixin, generics.ListAPIView):
     serializer_class = FavoriteSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = FavoritePagination
+    query_budget = 2
 
     def get_queryset(self):
         user = self.request.user
@@ -206,14 +470,16 @@ class FavoriteListAPIView(generics.ListAPIView):
     
 
 
-class ReviewViewSet(ModelViewSet):
+class ReviewViewSet(ConditionalGetMixin, ModelViewSet):
     queryset = Review.objects.all()
     serializer_class = ReviewSerializer
+    pagination_class = ReviewPagination
+    query_budget = {'list': 3, 'retrieve': 3, 'create': 5, 'update': 6, 'partial_update': 6, 'destroy': 6}
     
     def get_permissions(self):
         if self.action == 'create':
             self.permission_classes = [IsAuthenticated]
-        elif self.action in ['update', 'destroy']:
+        elif self.action in ['update', 'partial_update', 'destroy']:
             self.permission_classes = [IsAuthor]
         return super().get_permissions()
     
@@ -221,3 +487,24 @@ class ReviewViewSet(ModelViewSet):
         context = super().get_serializer_context()
         context.update({'request': self.request})
         return context
+
+    def get_serializer_class(self):
+        if self.action == 'create':
+            return ReviewCreateSerializer
+        return super().get_serializer_class()
+
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            review = serializer.save(user=self.request.user)
+            Hotel.objects.bump(review.hotel_id, reviews_count=1)
+
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            review = serializer.save()
+            # the hotel embeds its reviews
+            Hotel.objects.bump(review.hotel_id)
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            instance.delete()
+            Hotel.objects.bump(instance.hotel_id, reviews_count=-1)
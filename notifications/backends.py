@@ -0,0 +1,185 @@
+import os
+import smtplib
+import threading
+import time
+
+from django.conf import settings
+from django.core.mail.backends.smtp import EmailBackend
+
+from core.metrics import EMAIL_SEND_SECONDS, EMAILS
+
+
+class ConnectionPool:
+    # idle authenticated SMTP connections of this process, per server and login
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.idle = {}
+        self.pid = os.getpid()
+
+    def _forked(self):
+        # a forked worker must not share the parent's sockets, forget them
+        if self.pid != os.getpid():
+            self.idle = {}
+            self.pid = os.getpid()
+
+    def checkout(self, key):
+        stale = []
+        connection = None
+        with self.lock:
+            self._forked()
+            idle = self.idle.get(key, [])
+            while idle:
+                candidate, since = idle.pop()
+                if time.monotonic() - since < settings.EMAIL_POOL_IDLE_TIMEOUT:
+                    connection = candidate
+                    break
+                stale.append(candidate)
+        for candidate in stale:
+            _quit(candidate)
+        return connection
+
+    def checkin(self, key, connection):
+        with self.lock:
+            self._forked()
+            idle = self.idle.setdefault(key, [])
+            if len(idle) >= settings.EMAIL_POOL_SIZE:
+                return False
+            idle.append((connection, time.monotonic()))
+            return True
+
+    def clear(self):
+        with self.lock:
+            idle, self.idle = self.idle, {}
+        for connections in idle.values():
+            for connection, _ in connections:
+                _quit(connection)
+
+
+class RateLimiter:
+    # spaces sends at least 1/rate seconds apart across all threads of the process
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.next_slot = 0.0
+
+    def wait(self, rate):
+        if not rate:
+            return
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + 1 / rate
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class EmailStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.started = time.monotonic()
+        self.messages = 0
+        self.connections_opened = 0
+        self.connections_reused = 0
+        self.reconnects = 0
+
+    def incr(self, name):
+        with self.lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def snapshot(self):
+        with self.lock:
+            elapsed = time.monotonic() - self.started
+            checkouts = self.connections_opened + self.connections_reused
+            return {
+                'messages': self.messages,
+                'messages_per_second': self.messages / elapsed if elapsed else 0.0,
+                'connections_opened': self.connections_opened,
+                'connections_reused': self.connections_reused,
+                'connection_reuse_ratio': self.connections_reused / checkouts if checkouts else 0.0,
+                'reconnects': self.reconnects,
+            }
+
+
+pool = ConnectionPool()
+rate_limiter = RateLimiter()
+stats = EmailStats()
+
+
+def email_stats():
+    return stats.snapshot()
+
+
+def _quit(connection):
+    try:
+        connection.quit()
+    except (smtplib.SMTPException, OSError):
+        connection.close()
+
+
+class PooledSMTPEmailBackend(EmailBackend):
+    # Django's SMTP backend, except that close() parks the authenticated connection
+    # in a per-process pool instead of quitting, so the next send_mail()/outbox batch
+    # skips the TCP + TLS + AUTH handshake. A connection is retired after
+    # EMAIL_POOL_MAX_MESSAGES messages or EMAIL_POOL_IDLE_TIMEOUT seconds idle, a
+    # dropped one is replaced once per message, and sends are paced to EMAIL_RATE_LIMIT/s.
+    @property
+    def pool_key(self):
+        return (self.host, self.port, self.username, self.use_tls, self.use_ssl)
+
+    def open(self):
+        if self.connection:
+            return False
+        connection = pool.checkout(self.pool_key)
+        if connection is not None:
+            self.connection = connection
+            stats.incr('connections_reused')
+            return True
+        opened = super().open()
+        if self.connection is not None:
+            self.connection.pooled_sent = 0
+            stats.incr('connections_opened')
+        return opened
+
+    def close(self):
+        if self.connection is None:
+            return
+        if self.connection.pooled_sent < settings.EMAIL_POOL_MAX_MESSAGES and pool.checkin(self.pool_key, self.connection):
+            self.connection = None
+            return
+        super().close()
+
+    def discard(self):
+        connection, self.connection = self.connection, None
+        if connection is not None:
+            connection.close()
+
+    def _send(self, email_message):
+        rate_limiter.wait(settings.EMAIL_RATE_LIMIT)
+        started = time.perf_counter()
+        try:
+            sent = self._send_or_reconnect(email_message)
+        except Exception:
+            EMAILS.labels('error').inc()
+            raise
+        EMAIL_SEND_SECONDS.observe(time.perf_counter() - started)
+        EMAILS.labels('sent' if sent else 'error').inc()
+        return sent
+
+    def _send_or_reconnect(self, email_message):
+        try:
+            sent = super()._send(email_message)
+        except (smtplib.SMTPServerDisconnected, ConnectionError):
+            # the pooled connection was dropped by the server while idle
+            self.discard()
+            stats.incr('reconnects')
+            if super().open() is None:
+                return False
+            self.connection.pooled_sent = 0
+            stats.incr('connections_opened')
+            sent = super()._send(email_message)
+        if sent:
+            self.connection.pooled_sent += 1
+            stats.incr('messages')
+        return sent
@@ -0,0 +1,35 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from notifications.backends import email_stats
+from notifications.outbox import deliver_batch
+
+
+class Command(BaseCommand):
+    help = 'Отправляет накопившиеся письма из очереди OutboxMessage с повторами и экспоненциальной задержкой'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.OUTBOX_BATCH_SIZE, help='писем за одну транзакцию')
+        parser.add_argument('--loop', action='store_true', help='работать постоянно, опрашивая очередь')
+        parser.add_argument('--interval', type=float, default=settings.OUTBOX_POLL_INTERVAL, help='пауза между опросами пустой очереди, сек.')
+
+    def handle(self, *args, **options):
+        while True:
+            total_sent = total_failed = 0
+            while True:
+                sent, failed = deliver_batch(options['batch_size'])
+                total_sent += sent
+                total_failed += failed
+                if sent + failed < options['batch_size']:
+                    break
+            if total_sent or total_failed or not options['loop']:
+                stats = email_stats()
+                self.stdout.write(
+                    f'Отправлено: {total_sent}, ошибок: {total_failed} '
+                    f'(писем/с: {stats["messages_per_second"]:.1f}, повторных соединений: {stats["connection_reuse_ratio"]:.0%})'
+                )
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,37 @@
+from django.db import models
+from django.db.models import Q
+from django.utils import timezone
+
+
+class OutboxMessage(models.Model):
+    PENDING = 'pending'
+    SENT = 'sent'
+    FAILED = 'failed'
+
+    STATUS_CHOICES = (
+        (PENDING, 'ожидает отправки'),
+        (SENT, 'отправлено'),
+        (FAILED, 'не удалось отправить'),
+    )
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=254)
+    recipient = models.EmailField()
+    status = models.CharField(max_length=7, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Исходящее письмо'
+        verbose_name_plural = 'Исходящие письма'
+        # the worker only ever scans pending rows, so only they are indexed
+        indexes = [
+            models.Index(fields=['next_attempt_at', 'id'], condition=Q(status='pending'), name='outbox_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.recipient}: {self.subject}'
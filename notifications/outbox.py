@@ -0,0 +1,84 @@
+import logging
+from datetime import timedelta
+from smtplib import SMTPException
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from notifications.models import OutboxMessage
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_email(subject, message, recipient_list, from_email=None):
+    # Rows are written in the caller's transaction: an email goes out only if the
+    # data it talks about was committed, and a slow or broken SMTP server never
+    # fails the request. One row per recipient so retries don't resend to the rest.
+    return OutboxMessage.objects.bulk_create([
+        OutboxMessage(subject=subject, body=message, from_email=from_email or settings.EMAIL_HOST_USER, recipient=recipient)
+        for recipient in recipient_list
+    ])
+
+
+def backoff(attempts):
+    return timedelta(seconds=min(settings.OUTBOX_BACKOFF_SECONDS * 2 ** (attempts - 1), settings.OUTBOX_MAX_BACKOFF_SECONDS))
+
+
+def reschedule(message, exc):
+    message.last_error = repr(exc)
+    if message.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+        message.status = OutboxMessage.FAILED
+    else:
+        message.next_attempt_at = timezone.now() + backoff(message.attempts)
+
+
+def deliver_batch(batch_size=None):
+    batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+    sent = failed = 0
+    with transaction.atomic():
+        # skip_locked lets several workers drain the outbox side by side; if a worker
+        # dies mid-batch its rows are unlocked and picked up again
+        messages = list(
+            OutboxMessage.objects.select_for_update(skip_locked=True)
+            .filter(status=OutboxMessage.PENDING, next_attempt_at__lte=timezone.now())
+            .order_by('next_attempt_at', 'id')[:batch_size]
+        )
+        if not messages:
+            return sent, failed
+
+        connection = get_connection()
+        try:
+            connection.open()
+        except Exception as exc:
+            # the server is down: the whole batch is rescheduled at once instead of
+            # every send below trying (and timing out on) a connection of its own
+            for message in messages:
+                message.attempts += 1
+                reschedule(message, exc)
+            failed = len(messages)
+        else:
+            try:
+                for message in messages:
+                    message.attempts += 1
+                    try:
+                        EmailMessage(message.subject, message.body, message.from_email, [message.recipient], connection=connection).send()
+                    except Exception as exc:
+                        # SMTP and network errors, but also a message that can't be built
+                        # (a bad header, an encoding error): it is retried and then marked
+                        # failed like the others instead of blocking the head of the queue
+                        if not isinstance(exc, (SMTPException, OSError)):
+                            logger.warning('Не удалось отправить письмо %s из outbox', message.pk, exc_info=True)
+                        reschedule(message, exc)
+                        failed += 1
+                    else:
+                        message.status = OutboxMessage.SENT
+                        message.sent_at = timezone.now()
+                        message.last_error = ''
+                        sent += 1
+            finally:
+                connection.close()
+
+        OutboxMessage.objects.bulk_update(messages, ['status', 'attempts', 'next_attempt_at', 'last_error', 'sent_at'])
+    return sent, failed
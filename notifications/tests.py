@@ -0,0 +1,202 @@
+import socket
+import socketserver
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
+from smtplib import SMTPException
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.mail import EmailMessage
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from hotels.models import Hotel, Room
+from notifications import backends
+from notifications.backends import PooledSMTPEmailBackend, email_stats
+from notifications.models import OutboxMessage
+from notifications.outbox import deliver_batch, enqueue_email
+
+User = get_user_model()
+
+
+@override_settings(OUTBOX_BACKOFF_SECONDS=30, OUTBOX_MAX_ATTEMPTS=3)
+class OutboxTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(email='guest@gmail.com', password='12345')
+        owner = User.objects.create_user(email='owner@gmail.com', password='12345', is_owner=True)
+        hotel = Hotel.objects.create(name='Hotel', address='Address', owner=owner, description='Description', stars='4')
+        self.room = Room.objects.create(hotel=hotel, room_number='101', room_type='Standard', capacity=2, price_per_night=100)
+
+    def test_booking_is_queued_not_sent(self):
+        self.client.force_authenticate(user=self.user)
+        check_in = timezone.localdate() + timedelta(days=1)
+        response = self.client.post(f'/bookings/{self.room.id}/', {'check_in': check_in, 'check_out': check_in + timedelta(days=2), 'guests': 2})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(mail.outbox), 0)
+        message = OutboxMessage.objects.get()
+        self.assertEqual(message.recipient, 'guest@gmail.com')
+
+        self.assertEqual(deliver_batch(), (1, 0))
+        self.assertEqual(mail.outbox[0].to, ['guest@gmail.com'])
+        message.refresh_from_db()
+        self.assertEqual(message.status, OutboxMessage.SENT)
+        self.assertEqual(deliver_batch(), (0, 0))
+
+    def test_rolled_back_transaction_sends_nothing(self):
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                enqueue_email('Тема', 'Текст', ['guest@gmail.com'])
+                raise RuntimeError()
+        self.assertFalse(OutboxMessage.objects.exists())
+
+    def test_registration_email_goes_through_command(self):
+        self.client.post('/account/registration/', {'email': 'new@gmail.com', 'password': '12345678', 'password_confirm': '12345678'})
+        self.assertEqual(len(mail.outbox), 0)
+        call_command('send_outbox', stdout=StringIO())
+        self.assertEqual(mail.outbox[0].to, ['new@gmail.com'])
+        self.assertIn(User.objects.get(email='new@gmail.com').activation_code, mail.outbox[0].body)
+
+    def test_failures_back_off_then_give_up(self):
+        enqueue_email('Тема', 'Текст', ['guest@gmail.com'])
+        with mock.patch('notifications.outbox.EmailMessage.send', side_effect=SMTPException('down')):
+            self.assertEqual(deliver_batch(), (0, 1))
+            message = OutboxMessage.objects.get()
+            self.assertEqual((message.status, message.attempts), (OutboxMessage.PENDING, 1))
+            self.assertGreater(message.next_attempt_at, timezone.now())
+            # not due yet
+            self.assertEqual(deliver_batch(), (0, 0))
+
+            OutboxMessage.objects.update(next_attempt_at=timezone.now(), attempts=2)
+            self.assertEqual(deliver_batch(), (0, 1))
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts), (OutboxMessage.FAILED, 3))
+        self.assertIn('down', message.last_error)
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_unreachable_server_reschedules_the_batch(self):
+        enqueue_email('Тема', 'Текст', ['guest@gmail.com', 'owner@gmail.com'])
+        connection = mock.Mock(**{'open.side_effect': ConnectionRefusedError('refused')})
+        with mock.patch('notifications.outbox.get_connection', return_value=connection), \
+                mock.patch('notifications.outbox.EmailMessage.send') as send:
+            self.assertEqual(deliver_batch(), (0, 2))
+        send.assert_not_called()
+        for message in OutboxMessage.objects.all():
+            self.assertEqual((message.status, message.attempts), (OutboxMessage.PENDING, 1))
+            self.assertGreater(message.next_attempt_at, timezone.now())
+            self.assertIn('refused', message.last_error)
+        self.assertEqual(deliver_batch(), (0, 0))
+
+
+    def test_poison_message_does_not_block_the_batch(self):
+        # a newline in the subject: EmailMessage refuses to build the message
+        enqueue_email('Тема\nBcc: all@example.com', 'Текст', ['guest@gmail.com'])
+        enqueue_email('Тема', 'Текст', ['guest@gmail.com'])
+        with self.assertLogs('notifications.outbox', 'WARNING'):
+            self.assertEqual(deliver_batch(), (1, 1))
+        poison = OutboxMessage.objects.order_by('id').first()
+        self.assertEqual((poison.status, poison.attempts), (OutboxMessage.PENDING, 1))
+        self.assertIn('BadHeaderError', poison.last_error)
+        self.assertGreater(poison.next_attempt_at, timezone.now())
+        self.assertEqual(len(mail.outbox), 1)
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        self.server.sockets.append(self.connection)
+        self.server.connections += 1
+        self.reply('220 localhost ready')
+        data = None
+        for line in self.rfile:
+            line = line.decode().rstrip('\r\n')
+            if data is not None:
+                if line == '.':
+                    self.server.messages.append('\n'.join(data))
+                    data = None
+                    self.reply('250 OK')
+                else:
+                    data.append(line)
+                continue
+            command = line[:4].upper()
+            if command == 'EHLO':
+                self.reply('250 localhost')
+            elif command == 'DATA':
+                data = []
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+            elif command == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('250 OK')
+
+    def reply(self, line):
+        self.wfile.write(f'{line}\r\n'.encode())
+
+
+class SMTPServer(socketserver.ThreadingTCPServer):
+    # just enough SMTP for smtplib: no TLS, no AUTH, counts connections and messages
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), SMTPHandler)
+        self.connections = 0
+        self.messages = []
+        self.sockets = []
+
+    def drop_connections(self):
+        for sock in self.sockets:
+            sock.shutdown(socket.SHUT_RDWR)
+
+
+@override_settings(EMAIL_POOL_SIZE=2, EMAIL_POOL_MAX_MESSAGES=100, EMAIL_POOL_IDLE_TIMEOUT=60, EMAIL_RATE_LIMIT=0)
+class PooledSMTPBackendTestCase(TestCase):
+    def setUp(self):
+        self.server = SMTPServer()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        backends.pool.clear()
+        backends.stats.reset()
+
+    def tearDown(self):
+        backends.pool.clear()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def send(self, count):
+        backend = PooledSMTPEmailBackend(host='127.0.0.1', port=self.server.server_address[1], username='', password='', use_tls=False)
+        messages = [EmailMessage('Тема', f'Письмо {i}', 'noreply@restel.kg', ['guest@gmail.com']) for i in range(count)]
+        return backend.send_messages(messages)
+
+    def test_connection_is_reused_across_sends(self):
+        for _ in range(3):
+            self.assertEqual(self.send(2), 2)
+        self.assertEqual(self.server.connections, 1)
+        self.assertEqual(len(self.server.messages), 6)
+        stats = email_stats()
+        self.assertEqual((stats['messages'], stats['connections_opened'], stats['connections_reused']), (6, 1, 2))
+        self.assertGreater(stats['messages_per_second'], 0)
+
+    @override_settings(EMAIL_POOL_MAX_MESSAGES=3)
+    def test_connection_is_retired_after_max_messages(self):
+        self.send(3)
+        self.send(1)
+        self.assertEqual(self.server.connections, 2)
+
+    def test_reconnects_when_pooled_connection_dropped(self):
+        self.send(1)
+        self.server.drop_connections()
+        self.assertEqual(self.send(1), 1)
+        self.assertEqual(self.server.connections, 2)
+        self.assertEqual(email_stats()['reconnects'], 1)
+
+    @override_settings(EMAIL_RATE_LIMIT=50)
+    def test_rate_limit(self):
+        started = time.monotonic()
+        self.send(6)
+        self.assertGreaterEqual(time.monotonic() - started, 0.09)
@@ -1,11 +1,13 @@
 from django.contrib import admin
 from django.contrib.auth import get_user_model
-from django.core.mail import send_mail
+from django.db import transaction
 from django.template.loader import render_to_string
 from django.conf import settings
 from django.contrib.auth.admin import UserAdmin
 from users.models import OwnerRequest
 from decouple import config
+from notifications.outbox import enqueue_email
+from users.authentication import invalidate_user_tokens
 # Register your models here.
 
 User = get_user_model()
@@ -20,20 +22,26 @@ class CustomAdmin(admin.ModelAdmin):
     actions = ['approve_hotel_registration', 'reject_hotel_registration']
 
     def approve_hotel_registration(self, request, queryset):
-        queryset.update(is_owner=True)
         subject = 'Ваша заявка одобрена'
         message = 'Здравствуйте, ваша заявка на становление владельцем одобрена. Спасибо, что выбрали наш сервис!'
-        from_email = settings.EMAIL_HOST_USER
-        recipient_list = [obj.email for obj in queryset]
-        send_mail(subject, message, from_email, recipient_list)
+        users = list(queryset)
+        recipient_list = [obj.email for obj in users]
+        with transaction.atomic():
+            queryset.update(is_owner=True)
+            enqueue_email(subject, message, recipient_list)
+        # update() sends no post_save, drop the cached users by hand
+        invalidate_user_tokens([obj.pk for obj in users])
 
     def reject_hotel_registration(self, request, queryset):
-        queryset.update(is_owner=False)
         subject = 'Ваша заявка одобрена'
         message = 'Мы рассмотрели вашу заявку, и вынуждены отказать вам.'
-        from_email = settings.EMAIL_HOST_USER
-        recipient_list = [obj.email for obj in queryset]
-        send_mail(subject, message, from_email, recipient_list)
+        users = list(queryset)
+        recipient_list = [obj.email for obj in users]
+        with transaction.atomic():
+            queryset.update(is_owner=False)
+            enqueue_email(subject, message, recipient_list)
+        # update() sends no post_save, drop the cached users by hand
+        invalidate_user_tokens([obj.pk for obj in users])
 
     approve_hotel_registration.short_description = 'Одобрить заявки'
     reject_hotel_registration.short_description = 'Отклонить заявки'
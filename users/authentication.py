@@ -0,0 +1,111 @@
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication, get_authorization_header
+from rest_framework.authtoken.models import Token
+
+
+def token_cache_key(key):
+    # the token itself never leaves the database, the cache only sees its hash
+    return 'token:' + hashlib.sha256(key.encode()).hexdigest()
+
+
+def token_generation_key(key):
+    return token_cache_key(key) + ':generation'
+
+
+def token_expired(created):
+    return settings.TOKEN_TTL is not None and created + settings.TOKEN_TTL <= timezone.now()
+
+
+def invalidate_tokens(keys):
+    # Drops the cached entries now and moves the tokens' generation once the
+    # transaction commits. A request that read the token before the commit and fills
+    # the cache after it stores an entry of the old generation, which is never served.
+    # Entries don't outlive TOKEN_CACHE_TIMEOUT, so neither does a generation.
+    keys = list(keys)
+    cache.delete_many([token_cache_key(key) for key in keys])
+    transaction.on_commit(lambda: cache.set_many(
+        {token_generation_key(key): uuid.uuid4().hex for key in keys}, settings.TOKEN_CACHE_TIMEOUT,
+    ))
+
+
+def invalidate_user_tokens(user_ids):
+    invalidate_tokens(Token.objects.filter(user_id__in=user_ids).values_list('key', flat=True))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    # TokenAuthentication with the token -> user lookup cached for TOKEN_CACHE_TIMEOUT
+    # seconds (never past the token's expiry). An entry holds the user's columns but
+    # the password hash (request.user loads it on first access, like a deferred
+    # field) and the token's generation; it is served only while the generation is
+    # current. Entries are dropped when the token is deleted or its user is saved, see
+    # the receivers in users.models.
+    def authenticate_credentials(self, key):
+        cache_key, generation_key = token_cache_key(key), token_generation_key(key)
+        cached = cache.get_many([cache_key, generation_key])
+        entry, generation = cached.get(cache_key), cached.get(generation_key)
+        if entry is None or entry['generation'] != generation:
+            try:
+                token = Token.objects.select_related('user').get(key=key)
+            except Token.DoesNotExist:
+                raise exceptions.AuthenticationFailed('Неверный токен.')
+            entry, timeout = self.cache_entry(token, generation)
+            if timeout > 0:
+                cache.set(cache_key, entry, timeout)
+        return self.check_entry(entry, key)
+
+    async def aauthenticate(self, request):
+        # authenticate() for async views: the cache and the database are read with
+        # Django's async cache and ORM calls
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) == 1:
+            raise exceptions.AuthenticationFailed(_('Invalid token header. No credentials provided.'))
+        elif len(auth) > 2:
+            raise exceptions.AuthenticationFailed(_('Invalid token header. Token string should not contain spaces.'))
+        try:
+            key = auth[1].decode()
+        except UnicodeError:
+            raise exceptions.AuthenticationFailed(_('Invalid token header. Token string should not contain invalid characters.'))
+
+        cache_key, generation_key = token_cache_key(key), token_generation_key(key)
+        cached = await cache.aget_many([cache_key, generation_key])
+        entry, generation = cached.get(cache_key), cached.get(generation_key)
+        if entry is None or entry['generation'] != generation:
+            try:
+                token = await Token.objects.select_related('user').aget(key=key)
+            except Token.DoesNotExist:
+                raise exceptions.AuthenticationFailed('Неверный токен.')
+            entry, timeout = self.cache_entry(token, generation)
+            if timeout > 0:
+                await cache.aset(cache_key, entry, timeout)
+        return self.check_entry(entry, key)
+
+    def cache_entry(self, token, generation):
+        # (entry, seconds to cache it); inactive users aren't cached
+        timeout = settings.TOKEN_CACHE_TIMEOUT
+        if settings.TOKEN_TTL is not None:
+            timeout = min(timeout, (token.created + settings.TOKEN_TTL - timezone.now()).total_seconds())
+        user = {
+            field.attname: getattr(token.user, field.attname)
+            for field in token.user._meta.concrete_fields if field.attname != 'password'
+        }
+        entry = {'user': user, 'created': token.created, 'generation': generation}
+        return entry, (timeout if token.user.is_active else 0)
+
+    def check_entry(self, entry, key):
+        if token_expired(entry['created']):
+            raise exceptions.AuthenticationFailed('Срок действия токена истек, войдите заново.')
+        if not entry['user']['is_active']:
+            raise exceptions.AuthenticationFailed('Пользователь неактивен или удален.')
+        user = get_user_model().from_db(DEFAULT_DB_ALIAS, list(entry['user']), list(entry['user'].values()))
+        return (user, key)
@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+
+class Command(BaseCommand):
+    help = 'Удаляет токены авторизации старше TOKEN_TTL'
+
+    def handle(self, *args, **options):
+        if settings.TOKEN_TTL is None:
+            self.stdout.write('TOKEN_TTL не задан, токены не истекают')
+            return
+        deleted, _ = Token.objects.filter(created__lte=timezone.now() - settings.TOKEN_TTL).delete()
+        self.stdout.write(self.style.SUCCESS(f'Удалено просроченных токенов: {deleted}'))
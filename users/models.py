@@ -70,10 +70,15 @@ class OwnerRequest(models.Model):
 
 
 
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from django.urls import reverse
+from rest_framework.authtoken.models import Token
 from django_rest_passwordreset.signals import reset_password_token_created
-from django.core.mail import send_mail  
+
+
+from notifications.outbox import enqueue_email
+from users.authentication import invalidate_tokens, invalidate_user_tokens
 
 
 @receiver(reset_password_token_created)
@@ -81,9 +86,22 @@ def password_reset_token_created(sender, instance, reset_password_token, *args,
 
     email_plaintext_message = "{}?token={}".format(reverse('password_reset:reset-password-request'), reset_password_token.key)
 
-    send_mail(
+    enqueue_email(
         "Password Reset for {title}".format(title="Some website title"),
         email_plaintext_message,
+        [reset_password_token.user.email],
         "noreply@somehost.local",
-        [reset_password_token.user.email]
     )
+
+
+# cached token authentication (users.authentication) must not outlive a logout, a
+# password change or a deactivation
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    invalidate_tokens([instance.key])
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, **kwargs):
+    if not created:
+        invalidate_user_tokens([instance.pk])
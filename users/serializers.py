@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model, authenticate
+from django.db import transaction
 
 from users.models import OwnerRequest
 from .utils import create_activation_code
@@ -31,9 +32,10 @@ class RegistrationSerializer(serializers.ModelSerializer):
         return email
 
     def create(self, validated_data: dict):
-        user = User.objects.create_user(**validated_data)
-        create_activation_code(user)
-        send_activation_code(user)
+        with transaction.atomic():
+            user = User.objects.create_user(**validated_data)
+            create_activation_code(user)
+            send_activation_code(user)
         return user
 
 
@@ -1,10 +1,17 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
 from django.test import TestCase
 from django.urls import reverse
 from rest_framework.authtoken.models import Token
 from rest_framework.test import APIClient, APITestCase
 from django.contrib.auth import get_user_model
 from rest_framework import status
+from rest_framework.exceptions import AuthenticationFailed
 
+from users.authentication import CachedTokenAuthentication, token_cache_key
 from users.models import OwnerRequest
 
 User = get_user_model()
@@ -112,4 +119,73 @@ class OwnerRequestCreateAPIViewTestCase(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertEqual(OwnerRequest.objects.count(), 1)
         self.assertEqual(OwnerRequest.objects.get().message, 'Test owner request message.')
-        self.assertEqual(OwnerRequest.objects.get().user, self.user)
\ No newline at end of file
+        self.assertEqual(OwnerRequest.objects.get().user, self.user)
+
+
+class CachedTokenAuthenticationTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='test@example.com', password='password123', is_active=True)
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_second_lookup_is_cached(self):
+        auth = CachedTokenAuthentication()
+        with self.assertNumQueries(1):
+            auth.authenticate_credentials(self.token.key)
+        with self.assertNumQueries(0):
+            user, _ = auth.authenticate_credentials(self.token.key)
+        self.assertEqual(user, self.user)
+
+    def test_entry_has_no_password_hash(self):
+        CachedTokenAuthentication().authenticate_credentials(self.token.key)
+        entry = cache.get(token_cache_key(self.token.key))
+        self.assertEqual(entry['user']['id'], self.user.id)
+        self.assertNotIn('password', entry['user'])
+        with self.assertNumQueries(0):
+            user, _ = CachedTokenAuthentication().authenticate_credentials(self.token.key)
+        # loaded on first access
+        with self.assertNumQueries(1):
+            self.assertTrue(user.check_password('password123'))
+
+    def test_fill_racing_deactivation_is_not_served(self):
+        auth = CachedTokenAuthentication()
+        # a request that read the token before the deactivation committed...
+        entry, timeout = auth.cache_entry(Token.objects.select_related('user').get(key=self.token.key), None)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        # ...and fills the cache after it
+        cache.set(token_cache_key(self.token.key), entry, timeout)
+        with self.assertRaises(AuthenticationFailed):
+            auth.authenticate_credentials(self.token.key)
+
+    def test_logout_invalidates(self):
+        self.assertEqual(self.client.delete('/account/logout/').status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.delete('/account/logout/').status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_password_change_and_deactivation_invalidate(self):
+        data = {'old_password': 'password123', 'new_password': 'newpassword123'}
+        self.assertEqual(self.client.put('/account/change_password/', data).status_code, status.HTTP_200_OK)
+        # the cached user carries the new password hash
+        data = {'old_password': 'newpassword123', 'new_password': 'password123'}
+        self.assertEqual(self.client.put('/account/change_password/', data).status_code, status.HTTP_200_OK)
+
+        self.user.refresh_from_db()
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.put('/account/change_password/', data).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_expired_token_is_rotated_on_login(self):
+        Token.objects.filter(pk=self.token.pk).update(created=self.token.created - timedelta(days=31))
+        cache.clear()
+        self.assertEqual(self.client.delete('/account/logout/').status_code, status.HTTP_401_UNAUTHORIZED)
+
+        response = self.client.post('/account/login/', {'email': 'test@example.com', 'password': 'password123'})
+        self.assertNotEqual(response.data['token'], self.token.key)
+
+    def test_purge_expired_tokens(self):
+        Token.objects.filter(pk=self.token.pk).update(created=self.token.created - timedelta(days=31))
+        Token.objects.create(user=User.objects.create_user(email='fresh@example.com', password='password123'))
+        call_command('purge_expired_tokens', stdout=StringIO())
+        self.assertEqual(list(Token.objects.values_list('user__email', flat=True)), ['fresh@example.com'])
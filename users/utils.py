@@ -1,6 +1,6 @@
 from django.utils.crypto import get_random_string
-from django.core.mail import send_mail
-from django.conf import settings
+
+from notifications.outbox import enqueue_email
 
 
 def create_activation_code(user):
@@ -11,11 +11,9 @@ def send_activation_code(user):
     message = f"""
     Спасибо за регистрацию! Ваш код активации {user.activation_code}
     """
-    send_mail(
+    enqueue_email(
         subject='Активация аккаунта',
         message=message,
-        from_email=settings.EMAIL_HOST_USER,
         recipient_list=[user.email],
-        fail_silently=False
     )
 